@@ -6,15 +6,16 @@ __status__ = "Alpha"
 
 
 from abc import ABC, abstractmethod
+from functools import lru_cache
 import hashlib
 import os
 import re
-from typing import Set, Dict, Type
+from typing import Pattern, Set, Dict, List, Tuple, Type, Union
 
 from lark import Lark, Token
 from lark.visitors import Transformer
 from rdflib import URIRef, Graph, BNode, Literal, IdentifiedNode
-from rdflib.term import Node
+from rdflib.term import Node, _castPythonToLiteral, _castLexicalToPython
 import unidecode
 import pandas as pd
 import numpy as np
@@ -43,6 +44,44 @@ class ParameterNotExintingInFunctionException(Exception):
         super().__init__(self.message)
 
 
+'''
+Registry of the regular expressions used while mapping, compiled once at import time.
+'''
+PATTERNS: Dict[str, Pattern] = {
+    'eval': re.compile(r'(?<=\%eval:).+?(?=\%)'),
+    'placeholder': re.compile(r'(?<!\\)\{.+?(?<!\\)\}'),
+    'backslash': re.compile(r'\\'),
+    'language_tag': re.compile(r'^((?:(en-GB-oed|i-ami|i-bnn|i-default|i-enochian|i-hak|i-klingon|i-lux|i-mingo|i-navajo|i-pwn|i-tao|i-tay|i-tsu|sgn-BE-FR|sgn-BE-NL|sgn-CH-DE)|(art-lojban|cel-gaulish|no-bok|no-nyn|zh-guoyu|zh-hakka|zh-min|zh-min-nan|zh-xiang))|((?:([A-Za-z]{2,3}(-(?:[A-Za-z]{3}(-[A-Za-z]{3}){0,2}))?)|[A-Za-z]{4})(-(?:[A-Za-z]{4}))?(-(?:[A-Za-z]{2}|[0-9]{3}))?(-(?:[A-Za-z0-9]{5,8}|[0-9][A-Za-z0-9]{3}))*(-(?:[0-9A-WY-Za-wy-z](-[A-Za-z0-9]{2,8})+))*(-(?:x(-[A-Za-z0-9]{1,8})+))?)|(?:x(-[A-Za-z0-9]{1,8})+))$', re.IGNORECASE),
+    # It allows to check if a string is provided as a valid URI. E.g. http://dati.isprambiente.it/rmn/Ancona.jpg
+    'url': re.compile(
+        r'^(?:http|ftp)s?://' # http:// or https://
+        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|' #domain...
+        r'localhost|' #localhost...
+        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})' # ...or ip
+        r'(?::\d+)?' # optional port
+        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+}
+
+'''
+The substitutions applied by TermUtils.irify to the strings that are not valid URIs, in order.
+'''
+IRIFY_SUBSTITUTIONS: List[Tuple[Pattern, str]] = [
+    (re.compile(r'[\']'), ''),
+    #(re.compile(r'[;.,&"???!]'), ''),
+    (re.compile(r'[;,&"???!]'), ''),
+    (re.compile(r'[ \/]'), '_'),
+    (re.compile(r'[\(\)]'), ''),
+    (re.compile(r'\-$'), ''),
+    (re.compile(r'(\-)+'), '_'),
+    (re.compile(r'(\_)+'), '_'),
+    (re.compile(r'(\|)+'), '_')
+]
+
+# Maximum number of entries of the memos of TermUtils.irify and TermUtils.is_valid_language_tag.
+IRIFY_CACHE_SIZE = 65536
+LANGUAGE_TAG_CACHE_SIZE = 1024
+
+
 def graph_add_all(g1, g2):
     for (s,p,o) in g2:
         g1.add((s,p,o))
@@ -177,9 +216,11 @@ class Expression():
     
     def __init__(self):
         self._subexprs = []
+        self.__segments = None
         
     def add(self, subexpr: Evaluable):
         self._subexprs.append(subexpr)
+        self.__segments = None
         
     def eval(self, row, is_iri):
         items = [item.eval_(row, is_iri) for item in self._subexprs]
@@ -225,7 +266,74 @@ class Expression():
         
         #return vect_eval(data_source.data, is_iri)
         
-        return [self._eval_(row, data_source.columns, is_iri) for row in data_source.data]
+        segments = self.__compile()
+        if segments is None:
+            return [self._eval_(row, data_source.columns, is_iri) for row in data_source.data]
+        else:
+            return self.__eval_columns(segments, data_source, is_iri)
+        
+    def __compile(self) -> Union[List[Tuple[bool, str]], None]:
+        '''
+        Compiles the expression once into a list of (is_placeholder, text) segments.
+        Expressions containing functions or escapes cannot be compiled, hence None is returned.
+        '''
+        if self.__segments is None:
+            segments = []
+            for item in self._subexprs:
+                item_segments = TermUtils.compile_template(str(item)) if isinstance(item, String) else None
+                if item_segments is None:
+                    segments = False
+                    break
+                segments += item_segments
+            self.__segments = segments
+        
+        return self.__segments if self.__segments is not False else None
+    
+    def __eval_columns(self, segments: List[Tuple[bool, str]], data_source: 'DataSource', is_iri: bool) -> list:
+        '''
+        Evaluates the compiled expression column by column. It yields the same terms as _eval_ applied row by row.
+        Rows whose values contain braces or backslashes are left to _eval_, as it handles them in its own way.
+        '''
+        n_rows = data_source.data.shape[0]
+        if n_rows == 0:
+            return []
+        
+        values = np.full(n_rows, '', dtype=object)
+        nulls = np.zeros(n_rows, dtype=bool)
+        unsafe = np.zeros(n_rows, dtype=bool)
+        
+        for is_placeholder, text in segments:
+            if is_placeholder:
+                column_key = TermUtils.resolve_column(text, data_source.columns)
+                if column_key is None:
+                    return [None] * n_rows
+                
+                cells = data_source.data[:, data_source.columns[column_key]]
+                nulls |= pd.isna(cells)
+                
+                codes, uniques = pd.factorize(pd.Series(cells, dtype=object).astype(str).to_numpy(dtype=object))
+                if is_iri:
+                    uniques = np.array([quote(unique, safe='') for unique in uniques], dtype=object)
+                else:
+                    uniques = np.asarray(uniques, dtype=object)
+                    unsafe |= np.array([('{' in unique or '\\' in unique) for unique in uniques], dtype=bool)[codes]
+                
+                values = values + uniques[codes]
+            else:
+                values = values + text
+        
+        terms = np.full(n_rows, None, dtype=object)
+        valid = ~nulls & (values != '')
+        if is_iri:
+            codes, uniques = pd.factorize(values[valid])
+            terms[valid] = np.array([URIRef(unique) for unique in uniques] + [None], dtype=object)[codes]
+        else:
+            terms[valid] = values[valid]
+        
+        for index in np.flatnonzero(unsafe & ~nulls):
+            terms[index] = self._eval_(data_source.data[index], data_source.columns, is_iri)
+        
+        return terms.tolist()
         
         
         
@@ -234,7 +342,7 @@ class Expression():
         _expr = Expression()
         if value:
             value_str = value.value
-            p = re.compile('(?<=\%eval:).+?(?=\%)')
+            p = PATTERNS['eval']
             
             matches = p.finditer(value_str)
             #s = "'{mapped_entity}'".format(mapped_entity=mapped_entity.replace("'", "\\'"))
@@ -272,7 +380,7 @@ class AbstractMap(TermMap):
         self._expression = Expression()
         
         if mapped_entity is not None and isinstance(mapped_entity, str):
-            p = re.compile('(?<=\%eval:).+?(?=\%)')
+            p = PATTERNS['eval']
             
             matches = p.finditer(mapped_entity)
             #s = "'{mapped_entity}'".format(mapped_entity=mapped_entity.replace("'", "\\'"))
@@ -334,9 +442,9 @@ class TermUtils():
         return hash.hexdigest()
     
     @staticmethod
+    @lru_cache(maxsize=LANGUAGE_TAG_CACHE_SIZE)
     def is_valid_language_tag(tag):
-        regex = re.compile(r'^((?:(en-GB-oed|i-ami|i-bnn|i-default|i-enochian|i-hak|i-klingon|i-lux|i-mingo|i-navajo|i-pwn|i-tao|i-tay|i-tsu|sgn-BE-FR|sgn-BE-NL|sgn-CH-DE)|(art-lojban|cel-gaulish|no-bok|no-nyn|zh-guoyu|zh-hakka|zh-min|zh-min-nan|zh-xiang))|((?:([A-Za-z]{2,3}(-(?:[A-Za-z]{3}(-[A-Za-z]{3}){0,2}))?)|[A-Za-z]{4})(-(?:[A-Za-z]{4}))?(-(?:[A-Za-z]{2}|[0-9]{3}))?(-(?:[A-Za-z0-9]{5,8}|[0-9][A-Za-z0-9]{3}))*(-(?:[0-9A-WY-Za-wy-z](-[A-Za-z0-9]{2,8})+))*(-(?:x(-[A-Za-z0-9]{1,8})+))?)|(?:x(-[A-Za-z0-9]{1,8})+))$', re.IGNORECASE)
-        return True if re.match(regex, tag) else False
+        return True if PATTERNS['language_tag'].match(tag) else False
         
     
     @staticmethod
@@ -399,10 +507,55 @@ class TermUtils():
         return s
     
     
+    @staticmethod
+    def compile_template(value: str) -> Union[List[Tuple[bool, str]], None]:
+        '''
+        Splits a template into (is_placeholder, text) segments, where text is either a literal part of the template
+        or the column referred to by a placeholder. None is returned for templates containing escapes.
+        '''
+        if '\\' in value:
+            return None
+        
+        p = PATTERNS['placeholder']
+        
+        segments = []
+        cursor = 0
+        for match in p.finditer(value):
+            start, end = match.span()
+            if cursor < start:
+                segments.append((False, value[cursor:start]))
+            segments.append((True, match.group(0)[1:-1]))
+            cursor = end
+        
+        if cursor < len(value):
+            segments.append((False, value[cursor:]))
+        
+        return segments
+    
+    @staticmethod
+    def resolve_column(column: str, columns: dict) -> Union[str, None]:
+        '''
+        Returns the key of the column referred to by a template placeholder, or None if the column does not exist.
+        Joined data sources are taken into account, as their columns may be suffixed by _r.
+        '''
+        #column_key = column.strip().replace(r' ', '_')
+        column_key = column.strip("' ")
+        
+        if column_key not in columns:
+            column_key = f'{column_key}_r'
+        
+        if column_key not in columns:
+            column_key = column_key.lower()
+        
+        if column_key not in columns:
+            column_key = column_key.upper() 
+        
+        return column_key if column_key in columns else None
+    
     @staticmethod
     def replace_place_holders_(value, row, columns, is_iri):
         #p = re.compile('(?<=\{).+?(?=\})')
-        p = re.compile(r'(?<!\\)\{.+?(?<!\\)\}')
+        p = PATTERNS['placeholder']
         
         matches = p.finditer(value)
         
@@ -412,19 +565,9 @@ class TermUtils():
         for match in matches:
             column = match.group(0)[1:-1]
             
-            #column_key = column.strip().replace(r' ', '_')
-            column_key = column.strip("' ")
-            
-            if column_key not in columns:
-                column_key = f'{column_key}_r'
+            column_key = TermUtils.resolve_column(column, columns)
             
-            if column_key not in columns:
-                column_key = column_key.lower()
-            
-            if column_key not in columns:
-                column_key = column_key.upper() 
-            
-            if column_key in columns:
+            if column_key is not None:
                 
                 text = "{( )*" + re.escape(column) + "( )*}"
                 target_value = DataSource.get_from_row(row, columns, column_key)
@@ -445,7 +588,7 @@ class TermUtils():
                             value = target_value
                             
                         s = re.sub(text, value, s)
-                        s = re.sub('\\\\', '', s)
+                        s = PATTERNS['backslash'].sub('', s)
             else:
                 return None
             #print(str(row[column]))
@@ -468,7 +611,7 @@ class TermUtils():
         #p = re.compile('\{(.+)\/?\}')
         
         if value is not None:
-            p = re.compile('(?<=\%eval:).+?(?=\%)')
+            p = PATTERNS['eval']
         
             matches = p.finditer(value)
             s = value
@@ -501,40 +644,42 @@ class TermUtils():
     def irify(string):
         
         if string and isinstance(string, str) and PyRML.IRIFY:
-            
-            '''
-            The followint regex pattern allows to check if the input string is provided as a valid URI. E.g. http://dati.isprambiente.it/rmn/Ancona.jpg
-            '''
-            regex = re.compile(
-                r'^(?:http|ftp)s?://' # http:// or https://
-                r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|' #domain...
-                r'localhost|' #localhost...
-                r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})' # ...or ip
-                r'(?::\d+)?' # optional port
-                r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+            return TermUtils.__irify(string)
+        
+        return string
     
+    @staticmethod
+    def irify_many(values) -> np.ndarray:
+        '''
+        Applies irify to an array of values. Each distinct string is irified once.
+        '''
+        values = np.asarray(values, dtype=object)
+        terms = values.copy()
+        
+        if PyRML.IRIFY and len(values) > 0:
+            strings = np.fromiter((isinstance(value, str) and value != '' for value in values), dtype=bool, count=len(values))
+            codes, uniques = pd.factorize(values[strings])
+            terms[strings] = np.array([TermUtils.__irify(unique) for unique in uniques], dtype=object)[codes]
+        
+        return terms
+    
+    @staticmethod
+    @lru_cache(maxsize=IRIFY_CACHE_SIZE)
+    def __irify(string):
+        
+        '''
+        In case the input sstring is not a valid URI than the function applies the irification (i.e. the transormation aimed at removing characters that prevent
+        an IRI to be valid).
+        '''
+        if PATTERNS['url'].match(string) is None:
             
-            '''
-            In case the input sstring is not a valid URI than the function applies the irification (i.e. the transormation aimed at removing characters that prevent
-            an IRI to be valid).
-            '''
-            
-            if re.match(regex, string) is None:
-        
-                string = unidecode.unidecode(string)
-                string = string.lower();
-                string = re.sub(r'[\']', '', string)
-                #string = re.sub(r'[;.,&"???!]', '', string)
-                string = re.sub(r'[;,&"???!]', '', string)
-                string = re.sub(r'[ \/]', '_', string);
-                string = re.sub(r'[\(\)]', '', string);
-                string = re.sub(r'\-$', '', string);
-                string = re.sub(r'(\-)+', '_', string);
-                string = re.sub(r'(\_)+', '_', string);
-                string = re.sub(r'(\|)+', '_', string);
-                
-            string = re.sub(r'(<)', '%3C', string);
-            string = re.sub(r'(>)', '%3E', string);
+            string = unidecode.unidecode(string)
+            string = string.lower();
+            for pattern, replacement in IRIFY_SUBSTITUTIONS:
+                string = pattern.sub(replacement, string)
+        
+        string = string.replace('<', '%3C')
+        string = string.replace('>', '%3E')
         return string
     
 class EvalParser():
@@ -672,6 +817,116 @@ class DataSource():
             
         index = columns[column_reference]
         return row[index]
+    
+
+class TermColumn():
+    '''
+    Columnar representation of the terms generated by a term map over a data source.
+    Each row holds the code of its lexical form in the array of the distinct lexical forms (-1 if the row has no term),
+    whereas the term kind, the datatype and the language are shared by the whole column.
+    The rdflib terms are materialised by TermColumn.to_nodes, which builds each distinct term only once.
+    '''
+    
+    IRI = 0
+    BLANK_NODE = 1
+    LITERAL = 2
+    
+    STRING_DTYPES = frozenset(['string', 'empty'])
+    SCALAR_DTYPES = frozenset(['string', 'empty', 'integer', 'floating', 'mixed-integer-float', 'decimal', 'boolean'])
+    
+    def __init__(self, codes: np.ndarray, lexicals: np.ndarray, kind: int, datatype: URIRef = None, language: str = None, missing: np.ndarray = None):
+        self.__codes = codes
+        self.__lexicals = lexicals
+        self.__kind = kind
+        self.__datatype = datatype
+        self.__language = language
+        self.__missing = missing
+        
+    @property
+    def codes(self) -> np.ndarray:
+        return self.__codes
+    
+    @property
+    def lexicals(self) -> np.ndarray:
+        return self.__lexicals
+    
+    @property
+    def kind(self) -> int:
+        return self.__kind
+    
+    @property
+    def datatype(self) -> URIRef:
+        return self.__datatype
+    
+    @property
+    def language(self) -> str:
+        return self.__language
+    
+    def __len__(self) -> int:
+        return len(self.__codes)
+    
+    @staticmethod
+    def encode(values, kind: int, datatype: URIRef = None, language: str = None, stringify: bool = False, valid: np.ndarray = None, keep_missing: bool = False) -> Union['TermColumn', None]:
+        '''
+        Encodes the values of a term map into a TermColumn.
+        By default only non-empty strings are terms. If stringify is True, the non-string scalars are terms too,
+        whose lexical form is given by str, and so are the empty strings. The mask valid overrides both rules.
+        For the rows without a term, to_nodes returns the original value if keep_missing is True, None otherwise.
+        None is returned if the values cannot be encoded (e.g. nested lists or non-scalar values),
+        so that the caller can fall back to the row-wise construction of the terms.
+        '''
+        values = np.asarray(values, dtype=object)
+        if values.ndim != 1:
+            return None
+        
+        dtype = pd.api.types.infer_dtype(values, skipna=True)
+        if dtype not in (TermColumn.SCALAR_DTYPES if stringify else TermColumn.STRING_DTYPES):
+            return None
+        
+        if valid is None:
+            valid = ~pd.isna(values)
+            if not stringify:
+                valid &= values != ''
+        
+        lexicals = values[valid]
+        if dtype != 'string':
+            lexicals = np.array([str(value) for value in lexicals], dtype=object)
+        elif stringify:
+            # The missing values kept by the mask valid (e.g. NaN) are terms as well.
+            nans = pd.isna(lexicals)
+            if nans.any():
+                lexicals[nans] = [str(value) for value in lexicals[nans]]
+        
+        codes = np.full(len(values), -1, dtype=np.int64)
+        codes[valid], uniques = pd.factorize(lexicals)
+        
+        return TermColumn(codes, np.asarray(uniques, dtype=object), kind, datatype, language, values if keep_missing else None)
+    
+    def __node(self, lexical: str) -> Node:
+        if self.__kind == TermColumn.IRI:
+            return URIRef(TermUtils.irify(lexical))
+        elif self.__kind == TermColumn.BLANK_NODE:
+            return BNode(lexical)
+        elif self.__datatype is not None:
+            return Literal(_castPythonToLiteral(_castLexicalToPython(lexical, self.__datatype), self.__datatype)[0], datatype=self.__datatype)
+        elif self.__language is not None:
+            return Literal(lexical, lang=self.__language)
+        else:
+            return Literal(lexical)
+    
+    def to_nodes(self) -> np.ndarray:
+        '''
+        Materialises the column as an array of rdflib terms.
+        '''
+        nodes = np.empty(len(self.__lexicals) + 1, dtype=object)
+        nodes[:-1] = [self.__node(lexical) for lexical in self.__lexicals]
+        
+        terms = nodes[self.__codes]
+        if self.__missing is not None:
+            missing = self.__codes < 0
+            terms[missing] = self.__missing[missing]
+        
+        return terms
         
         
 class Mapper(ABC):
@@ -693,6 +948,7 @@ class PyRML():
     
     __mapper = None
     __function_registry = dict()
+    __source_registry = dict()
     
     register('text/turtle', Parser, 'pyrml.pyrml_rdflib', 'MyTurtleParser')
     register('turtle', Parser, 'pyrml.pyrml_rdflib', 'MyTurtleParser')
@@ -704,6 +960,12 @@ class PyRML():
     RML_STRICT = True
     INFER_LITERAL_DATATYPES = False
     
+    # Maximum number of triples in each batch yielded by TripleMappings.stream.
+    TRIPLE_BATCH_SIZE = 10000
+    
+    # Directory of the on-disk cache of parsed mappings (see MappingCache). Caching is disabled if None.
+    MAPPING_CACHE_DIR = os.environ.get('PYRML_MAPPING_CACHE_DIR')
+    
     @classmethod
     def set_mapper(cls, mapper):
         cls.delete_mapper()
@@ -741,9 +1003,38 @@ class PyRML():
         return cls.__function_registry.get(name)
     
     
+    @classmethod
+    def register_source(cls, name: str, data: Union[pd.DataFrame, list, dict]):
+        '''
+        Registers in-memory data as the logical source named name, i.e. the value of rml:source in the mapping,
+        which then takes precedence over the file with the same name.
+        A DataFrame is used as is, as if it had been loaded from the file. Any other data is a JSON document
+        (e.g. a list of dicts, any other iterable is turned into a list) which the iterator of the logical source is evaluated against.
+        '''
+        if not isinstance(data, (pd.DataFrame, list, dict)):
+            data = list(data)
+        cls.__source_registry.update({name: data})
+        
+    @classmethod
+    def unregister_source(cls, name: str):
+        cls.__source_registry.pop(name, None)
+        
+    @classmethod
+    def has_registered_source(cls, name: str) -> bool:
+        return name in cls.__source_registry
+    
+    @classmethod
+    def get_registered_source(cls, name: str) -> Union[pd.DataFrame, list, dict]:
+        return cls.__source_registry.get(name)
+    
+    @classmethod
+    def registered_sources(cls) -> Dict[str, Union[pd.DataFrame, list, dict]]:
+        return dict(cls.__source_registry)
+    
     @classmethod
     def delete_mapper(cls):
         
-        cls.__mapper.reset()
+        if cls.__mapper is not None:
+            cls.__mapper.reset()
         cls.__mapper = None
     
\ No newline at end of file
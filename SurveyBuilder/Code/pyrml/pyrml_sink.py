@@ -0,0 +1,249 @@
+__author__ = "Andrea Giovanni Nuzzolese"
+__email__ = "andrea.nuzzolese@cnr.it"
+__license__ = "Apache 2"
+__version__ = "0.2.9"
+__status__ = "Alpha"
+
+from abc import ABC, abstractmethod
+import hashlib
+from io import StringIO
+from typing import Tuple, Union
+
+from rdflib import Dataset
+from rdflib.exceptions import ParserError
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser, r_nodeid, r_wspace, r_tail
+from rdflib.plugins.serializers.nt import _nt_row
+from rdflib.plugins.serializers.nquads import _nq_row
+from rdflib.term import BNode, Node, URIRef
+
+
+def nquads_line(_tuple: Tuple[Node, ...]) -> str:
+    if len(_tuple) == 4 and _tuple[3] is not None:
+        ctx = _tuple[3] if isinstance(_tuple[3], Node) else URIRef(_tuple[3])
+        return _nq_row(_tuple[:3], ctx)
+    else:
+        return _nt_row(_tuple[:3])
+
+
+class Sink(ABC):
+    '''
+    A sink receives the triples (3-tuples) and quads (4-tuples) generated by
+    RMLConverter.convert. Quads carry the named graph as their fourth term.
+    '''
+
+    def __init__(self):
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        '''
+        Called by RMLConverter.convert instead of close when the conversion fails.
+        By default the sink is just closed.
+        '''
+        self.close()
+
+    @abstractmethod
+    def add(self, _tuple: Tuple[Node, ...]):
+        pass
+
+    def result(self) -> object:
+        return self
+
+    def add_nquads(self, data: str):
+        '''
+        Adds the triples and quads serialised as N-Quads in data, in the order they appear.
+        '''
+        NQuadsLineParser(self).read(data)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DatasetSink(Sink):
+    '''
+    Collects the triples into an in-memory rdflib Dataset. This is the sink used by
+    RMLConverter.convert when no sink is provided.
+    '''
+
+    def __init__(self, base: str = None):
+        super().__init__()
+        if base:
+            self.__dataset = Dataset(default_graph_base=base)
+        else:
+            self.__dataset = Dataset()
+
+    @property
+    def dataset(self) -> Dataset:
+        return self.__dataset
+
+    @property
+    def count(self) -> int:
+        return len(self.__dataset)
+
+    def add(self, _tuple: Tuple[Node, ...]):
+        self.__dataset.add(_tuple)
+
+    def result(self) -> Dataset:
+        return self.__dataset
+
+
+class FileSink(Sink):
+    '''
+    Base class for the sinks writing line-based RDF serialisations straight to disk.
+    If dedup is True, the lines already written are skipped by keeping a digest of each of them.
+    '''
+
+    def __init__(self, path: str, dedup: bool = False, append: bool = False, encoding: str = 'utf-8'):
+        super().__init__()
+        self.__path = path
+        self.__dedup = dedup
+        self.__mode = 'a' if append else 'w'
+        self.__encoding = encoding
+        self.__digests = set() if dedup else None
+        self.__file = None
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def dedup(self) -> bool:
+        return self.__dedup
+
+    def open(self):
+        if self.__file is None:
+            self.__file = open(self.__path, mode=self.__mode, encoding=self.__encoding, buffering=1 << 20)
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__digests = set() if self.__dedup else None
+
+    def write(self, line: str):
+        if self.__file is None:
+            self.open()
+
+        if self.__digests is not None:
+            digest = hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+            if digest in self.__digests:
+                return
+            self.__digests.add(digest)
+
+        self.__file.write(line)
+        self._count += 1
+
+    @abstractmethod
+    def to_line(self, _tuple: Tuple[Node, ...]) -> Union[str, None]:
+        pass
+
+    def add(self, _tuple: Tuple[Node, ...]):
+        line = self.to_line(_tuple)
+        if line:
+            self.write(line)
+
+    def result(self) -> 'FileSink':
+        return self
+
+
+class NTriplesFileSink(FileSink):
+    '''
+    Writes N-Triples. The named graph of quads is dropped, hence the output is the union of all graphs.
+    N-Triples is a subset of Turtle, so the output can be loaded as Turtle too.
+    '''
+
+    def to_line(self, _tuple: Tuple[Node, ...]) -> str:
+        return _nt_row(_tuple[:3])
+
+
+class NQuadsFileSink(FileSink):
+    '''
+    Writes N-Quads. Triples without a named graph are written in the default graph.
+    '''
+
+    def to_line(self, _tuple: Tuple[Node, ...]) -> str:
+        return nquads_line(_tuple)
+
+    def add_nquads(self, data: str):
+        for line in data.split('\n'):
+            if line:
+                self.write(line + '\n')
+
+
+class NQuadsChunkSink(Sink):
+    '''
+    Collects N-Quads in memory. The worker processes of RMLConverter.convert use it
+    for shipping their output to the main process, which merges it by means of Sink.add_nquads.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.__lines = []
+
+    def add(self, _tuple: Tuple[Node, ...]):
+        self.__lines.append(nquads_line(_tuple))
+        self._count += 1
+
+    def result(self) -> str:
+        return ''.join(self.__lines)
+
+
+class NQuadsLineParser(W3CNTriplesParser):
+    '''
+    Parses N-Quads line by line and hands each triple or quad to a sink.
+    Blank node labels are preserved, so the blank nodes are the same as the serialised ones.
+    '''
+
+    def __init__(self, sink: Sink):
+        super().__init__()
+        self.target = sink
+
+    def read(self, data: str):
+        self.file = StringIO(data)
+        self.buffer = ''
+        while True:
+            self.line = self.readline()
+            if self.line is None:
+                break
+            self.parseline()
+
+    def nodeid(self, bnode_context=None) -> Union[BNode, bool]:
+        if self.peek('_'):
+            return BNode(self.eat(r_nodeid).group(1))
+        return False
+
+    def parseline(self, bnode_context=None):
+        self.eat(r_wspace)
+        if (not self.line) or self.line.startswith('#'):
+            return
+
+        subj = self.subject()
+        self.eat(r_wspace)
+        pred = self.predicate()
+        self.eat(r_wspace)
+        obj = self.object()
+        self.eat(r_wspace)
+        ctx = self.uriref() or self.nodeid()
+        self.eat(r_tail)
+
+        if self.line:
+            raise ParserError(f'Trailing garbage: {self.line}')
+
+        if ctx:
+            self.target.add((subj, pred, obj, ctx))
+        else:
+            self.target.add((subj, pred, obj))
+
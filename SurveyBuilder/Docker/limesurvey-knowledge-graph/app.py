@@ -1,12 +1,24 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http.cookiejar import DefaultCookiePolicy
 import json
+import queue
+import hashlib
+import gzip
+import shutil
 import csv
 import os
 import io
+import re
+import mmap
+import zlib
+from collections import OrderedDict
 from typing import Optional, Union
 from datetime import datetime
 import base64
+import itertools
 import pandas as pd
 import sys
 from pathlib import Path
@@ -16,15 +28,22 @@ lib_path = Path(__file__).parent / 'lib'
 sys.path.insert(0, str(lib_path))
 
 # Ora importa pyrml normalmente
-from pyrml import Mapper, PyRML
+from pyrml import Mapper, PyRML, Sink, nquads_line
 
 # from pyrml import Mapper, PyRML
-from rdflib import Graph
+from rdflib import Graph, BNode
 from typing import Dict, List, Any
 from xml.dom import minidom
 from SPARQLWrapper import SPARQLWrapper, JSON
-import subprocess
+import multiprocessing
+import tempfile
+import threading
+import time
+import traceback
+import uuid
 import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +58,59 @@ LIMESURVEY_URL = "http://localhost/limesurvey/index.php/admin/remotecontrol"
 LIMESURVEY_USERNAME = "sara"
 LIMESURVEY_PASSWORD = "sara"
 
+# Export delle question properties: chiamate RemoteControl in parallelo e retry con backoff esponenziale
+LIMESURVEY_EXPORT_CONCURRENCY = int(os.environ.get('LIMESURVEY_EXPORT_CONCURRENCY', 8))
+LIMESURVEY_MAX_RETRIES = 3
+LIMESURVEY_RETRY_BACKOFF = 0.5
+
+# Trasporto HTTP condiviso verso LimeSurvey: connessioni keep-alive per host, timeout (connessione, lettura),
+# richieste per JSON-RPC batch e log di debug (LIMESURVEY_DEBUG=1)
+LIMESURVEY_POOL_SIZE = int(os.environ.get('LIMESURVEY_POOL_SIZE', max(10, LIMESURVEY_EXPORT_CONCURRENCY)))
+LIMESURVEY_TIMEOUT = (float(os.environ.get('LIMESURVEY_CONNECT_TIMEOUT', 5)), float(os.environ.get('LIMESURVEY_READ_TIMEOUT', 30)))
+LIMESURVEY_BATCH_SIZE = int(os.environ.get('LIMESURVEY_BATCH_SIZE', 25))
+LIMESURVEY_DEBUG = os.environ.get('LIMESURVEY_DEBUG', '0') == '1'
+
+# Cache su disco delle mappature RML già parsate (pyrml MappingCache), condivisa dai worker di conversione
+RML_MAPPING_CACHE_DIR = os.environ.get('PYRML_MAPPING_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pyrml_mapping_cache'))
+
+# Pool di worker di conversione RML (processi caldi con pyrml già importato)
+RML_WORKERS = int(os.environ.get('RML_WORKERS', max(1, min(4, os.cpu_count() or 1))))
+RML_CONVERSION_TIMEOUT = 300
+
+# Job di conversione asincroni: job eseguiti in parallelo e job conclusi conservati per il polling
+CONVERSION_JOB_WORKERS = int(os.environ.get('CONVERSION_JOB_WORKERS', 2))
+CONVERSION_JOB_HISTORY = 100
+
+# Survey builder: domande per query di prefetch, processi per la generazione .lsq, import concorrenti su LimeSurvey
+SURVEYBUILDER_PREFETCH_BATCH = int(os.environ.get('SURVEYBUILDER_PREFETCH_BATCH', 50))
+SURVEYBUILDER_XML_WORKERS = int(os.environ.get('SURVEYBUILDER_XML_WORKERS', RML_WORKERS))
+SURVEYBUILDER_IMPORT_CONCURRENCY = int(os.environ.get('SURVEYBUILDER_IMPORT_CONCURRENCY', 4))
+
+# Cache dei risultati delle query di lettura su GraphDB (secondi di validità, numero massimo di risposte; 0 disattiva)
+GRAPHDB_QUERY_CACHE_TTL = float(os.environ.get('GRAPHDB_QUERY_CACHE_TTL', 300))
+GRAPHDB_QUERY_CACHE_SIZE = int(os.environ.get('GRAPHDB_QUERY_CACHE_SIZE', 256))
+
+# Query SPARQL ad-hoc: righe massime per pagina e dimensione dei blocchi inoltrati nelle risposte in streaming
+SPARQL_MAX_PAGE_SIZE = int(os.environ.get('SPARQL_MAX_PAGE_SIZE', 10000))
+SPARQL_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Upload su GraphDB: corpo compresso gzip, dimensione dei blocchi letti dal disco,
+# dimensione massima di ogni invio per i file N-Triples/N-Quads (0 = un solo invio),
+# thread che preparano i blocchi successivi durante i caricamenti in transazione
+GRAPHDB_UPLOAD_GZIP = os.environ.get('GRAPHDB_UPLOAD_GZIP', '0') == '1'
+GRAPHDB_UPLOAD_CHUNK_SIZE = 1 << 20
+GRAPHDB_UPLOAD_BATCH_BYTES = int(os.environ.get('GRAPHDB_UPLOAD_BATCH_BYTES', 256 * 1024 * 1024))
+GRAPHDB_TXN_PREPARE_WORKERS = int(os.environ.get('GRAPHDB_TXN_PREPARE_WORKERS', 2))
+
+# Snapshot locali dei named graph sincronizzati a differenze (GraphDBManager.sync_files)
+GRAPHDB_SNAPSHOT_DIR = os.environ.get('GRAPHDB_SNAPSHOT_DIR', os.path.join('exports', 'graphdb_snapshots'))
+
+# Conversione diretta RML -> GraphDB: dimensione dei blocchi N-Triples, blocchi in volo, tentativi per blocco
+GRAPHDB_SINK_BATCH_BYTES = int(os.environ.get('GRAPHDB_SINK_BATCH_BYTES', 8 * 1024 * 1024))
+GRAPHDB_SINK_IN_FLIGHT = int(os.environ.get('GRAPHDB_SINK_IN_FLIGHT', 2))
+GRAPHDB_SINK_RETRIES = 3
+GRAPHDB_SINK_RETRY_BACKOFF = 1.0
+
 
 # FUNZIONI PER BUILDER SURVEY
 def generate_lsq_xml(question_data: Dict) -> str:
@@ -439,6 +511,54 @@ def generate_lsq_xml(question_data: Dict) -> str:
     # ✅ QUESTO RETURN È FONDAMENTALE!
     return final_xml
 
+
+class LSQGenerator:
+    """
+    Genera i file .lsq in un pool persistente di processi: generate_lsq_xml è CPU-bound
+    e nel processo Flask terrebbe il GIL mentre gli import verso LimeSurvey sono in corso.
+    Se il pool si rompe la generazione prosegue nel thread chiamante.
+    """
+
+    _pool: Optional[ProcessPoolExecutor] = None
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls) -> ProcessPoolExecutor:
+        with cls._pool_lock:
+            # un worker morto rompe il pool: se ne crea uno nuovo alla richiesta successiva
+            if cls._pool is None or getattr(cls._pool, '_broken', False):
+                cls._pool = ProcessPoolExecutor(max_workers=max(1, SURVEYBUILDER_XML_WORKERS),
+                                                mp_context=multiprocessing.get_context('spawn'))
+            return cls._pool
+
+    @classmethod
+    def discard_pool(cls, pool: ProcessPoolExecutor):
+        with cls._pool_lock:
+            if cls._pool is pool:
+                cls._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def submit(cls, question_data: Dict) -> Future:
+        """Avvia la generazione del .lsq di una domanda; il Future ritorna l'XML o l'eccezione di generate_lsq_xml"""
+        pool = cls.get_pool()
+        try:
+            return pool.submit(generate_lsq_xml, question_data)
+        except (BrokenProcessPool, RuntimeError):
+            cls.discard_pool(pool)
+            future = Future()
+            future.set_result(None)
+            return future
+
+    @classmethod
+    def result(cls, future: Future, question_data: Dict) -> str:
+        """XML generato dal pool, oppure generato qui se il pool non è disponibile"""
+        try:
+            xml = future.result()
+        except BrokenProcessPool:
+            xml = None
+        return xml if xml is not None else generate_lsq_xml(question_data)
+
 # Configura Flask con le directory corrette
 app = Flask(__name__,
             static_folder='static',
@@ -551,87 +671,81 @@ def transform_limesurvey_json(questions):
     return questions
 
 
-def split_limesurvey_json(input_file):
-    """
-    Separa JSON in 4 file distinti:
-    - questions_only.json
-    - subquestions_only.json
-    - answeroptions_only.json
-    - attributes_only.json
-    """
-
-    print(f"📂 Caricamento: {input_file}")
+# Logical source (rml:source) di ogni parte della split del JSON delle question
+LIMESURVEY_SPLIT_SOURCES = {
+    'questions': 'questions_only.json',
+    'subquestions': 'subquestions_only.json',
+    'answeroptions': 'answeroptions_only.json',
+    'attributes': 'attributes_only.json',
+}
 
-    with open(input_file, 'r', encoding='utf-8') as f:
-        questions = json.load(f)
 
-    print(f"✓ Caricate {len(questions)} questions")
-    print()
-    questions = transform_limesurvey_json(questions)
-    # ====== FILE 1: QUESTIONS ONLY ======
-    print("🔄 Elaborazione questions...")
+def split_limesurvey_questions(questions: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Separa le question (già trasformate da transform_limesurvey_json) in un solo passaggio
+    nelle 4 liste di record lette dai mapping, indicizzate per nome della logical source.
+    """
     questions_output = []
+    subquestions_output = []
+    answeroptions_output = []
+    attributes_output = []
 
     for q in questions:
         # Rimuovi nested arrays - li mapperemo separatamente
-        q_clean = {
+        questions_output.append({
             k: v for k, v in q.items()
             if k not in ['subquestions', 'answeroptions', 'attributes', 'attributes_lang', 'available_answers']
-        }
-        questions_output.append(q_clean)
-
-    with open('questions_only.json', 'w', encoding='utf-8') as f:
-        json.dump(questions_output, f, indent=2, ensure_ascii=False)
-
-    print(f"✓ Salvato: questions_only.json ({len(questions_output)} questions)")
-
-    # ====== FILE 2: SUBQUESTIONS ONLY ======
-    print("🔄 Elaborazione subquestions...")
-    subquestions_output = []
-
-    for q in questions:
-        subqs = q.get('subquestions', [])
-        if isinstance(subqs, list):
-            for sq in subqs:
-                if sq:  # Solo se non None o vuoto
-                    subquestions_output.append(sq)
+        })
 
-    with open('subquestions_only.json', 'w', encoding='utf-8') as f:
-        json.dump(subquestions_output, f, indent=2, ensure_ascii=False)
+        for key, output in (('subquestions', subquestions_output),
+                            ('answeroptions', answeroptions_output),
+                            ('attributes', attributes_output)):
+            items = q.get(key, [])
+            if isinstance(items, list):
+                # Solo se non None o vuoto
+                output.extend(item for item in items if item)
+
+    return {
+        LIMESURVEY_SPLIT_SOURCES['questions']: questions_output,
+        LIMESURVEY_SPLIT_SOURCES['subquestions']: subquestions_output,
+        LIMESURVEY_SPLIT_SOURCES['answeroptions']: answeroptions_output,
+        LIMESURVEY_SPLIT_SOURCES['attributes']: attributes_output,
+    }
 
-    print(f"✓ Salvato: subquestions_only.json ({len(subquestions_output)} subquestions)")
 
-    # ====== FILE 3: ANSWEROPTIONS ONLY ======
-    print("🔄 Elaborazione answer options...")
-    answeroptions_output = []
+def split_limesurvey_json(input_file, write_files: bool = True) -> Dict[str, List[Dict]]:
+    """
+    Separa JSON in 4 parti distinte:
+    - questions_only.json
+    - subquestions_only.json
+    - answeroptions_only.json
+    - attributes_only.json
 
-    for q in questions:
-        answers = q.get('answeroptions', [])
-        if isinstance(answers, list):
-            for ao in answers:
-                if ao:  # Solo se non None o vuoto
-                    answeroptions_output.append(ao)
+    Args:
+        input_file: JSON delle question esportato da LimeSurvey.
+        write_files: Se False le parti non sono scritte su disco, ma solo restituite
+            (i mapping le ricevono come sorgenti in memoria, vedi PyRML.register_source).
 
-    with open('answeroptions_only.json', 'w', encoding='utf-8') as f:
-        json.dump(answeroptions_output, f, indent=2, ensure_ascii=False)
+    Returns:
+        Dict nome della logical source -> lista di record.
+    """
 
-    print(f"✓ Salvato: answeroptions_only.json ({len(answeroptions_output)} answeroptions)")
+    print(f"📂 Caricamento: {input_file}")
 
-    # ====== FILE 4: ATTRIBUTES ONLY ======
-    print("🔄 Elaborazione attributes...")
-    attributes_output = []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        questions = json.load(f)
 
-    for q in questions:
-        attrs = q.get('attributes', [])
-        if isinstance(attrs, list):
-            for attr in attrs:
-                if attr:  # Solo se non None o vuoto
-                    attributes_output.append(attr)
+    print(f"✓ Caricate {len(questions)} questions")
+    print()
+    questions = transform_limesurvey_json(questions)
 
-    with open('attributes_only.json', 'w', encoding='utf-8') as f:
-        json.dump(attributes_output, f, indent=2, ensure_ascii=False)
+    parts = split_limesurvey_questions(questions)
 
-    print(f"✓ Salvato: attributes_only.json ({len(attributes_output)} attributes)")
+    if write_files:
+        for name, records in parts.items():
+            with open(name, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, ensure_ascii=False)
+            print(f"✓ Salvato: {name} ({len(records)} record)")
 
     print()
     print("=" * 70)
@@ -639,35 +753,14 @@ def split_limesurvey_json(input_file):
     print("=" * 70)
     print()
     print("📊 Riepilogo:")
-    print(f"  Questions:      {len(questions_output):4d}")
-    print(f"  Subquestions:   {len(subquestions_output):4d}")
-    print(f"  Answer Options: {len(answeroptions_output):4d}")
-    print(f"  Attributes:     {len(attributes_output):4d}")
-    print()
-    print("📝 File creati:")
-    print("  - questions_only.json")
-    print("  - subquestions_only.json")
-    print("  - answeroptions_only.json")
-    print("  - attributes_only.json")
-    print()
-    print("🎯 Ora aggiorna il tuo RML per usare questi file:")
-    print()
-    print("  <#QuestionsSource>")
-    print('    rml:source "questions_only.json" ;')
-    print()
-    print("  <#SubQuestionsSource>")
-    print('    rml:source "subquestions_only.json" ;')
-    print('    rml:iterator "$[*]" .  # ← Nota: root level!')
-    print()
-    print("  <#AnswerOptionsSource>")
-    print('    rml:source "answeroptions_only.json" ;')
-    print('    rml:iterator "$[*]" .  # ← Nota: root level!')
-    print()
-    print("  <#AttributesSource>")
-    print('    rml:source "attributes_only.json" ;')
-    print('    rml:iterator "$[*]" .  # ← Nota: root level!')
+    print(f"  Questions:      {len(parts[LIMESURVEY_SPLIT_SOURCES['questions']]):4d}")
+    print(f"  Subquestions:   {len(parts[LIMESURVEY_SPLIT_SOURCES['subquestions']]):4d}")
+    print(f"  Answer Options: {len(parts[LIMESURVEY_SPLIT_SOURCES['answeroptions']]):4d}")
+    print(f"  Attributes:     {len(parts[LIMESURVEY_SPLIT_SOURCES['attributes']]):4d}")
     print()
 
+    return parts
+
 
 def clean_uri_path(path):
     """
@@ -1024,28 +1117,337 @@ class RMLConversionError(Exception):
     pass
 
 
+class GraphDBStatementsSink(Sink):
+    """
+    Sink pyrml che carica le triple in GraphDB in una sola transazione RDF4J, in blocchi N-Triples
+    di circa batch_bytes e senza file intermedi: il commit avviene in close(), mentre abort() o un
+    errore annullano la transazione e il repository resta com'era. I blocchi sono inviati in sequenza
+    (come richiede RDF4J) da un thread dedicato; al più max_in_flight blocchi sono in coda o in volo:
+    oltre, add() attende, quindi il mapper rallenta al ritmo di GraphDB. Ogni blocco è ritentato fino
+    a retries volte su errori di rete e risposte 5xx, cosa innocua perché aggiungere di nuovo le stesse
+    triple non cambia il repository. Le triple con blank node vanno invece in un solo invio finale, perché
+    GraphDB rinomina i blank node di ogni richiesta: sono accumulate su un file temporaneo (la memoria
+    resta limitata) e non vengono ritentate, perché un nuovo invio duplicherebbe i blank node.
+    """
+
+    def __init__(self, base_url: str, repo_id: str, context: Optional[str] = None,
+                 batch_bytes: int = GRAPHDB_SINK_BATCH_BYTES, max_in_flight: int = GRAPHDB_SINK_IN_FLIGHT,
+                 retries: int = GRAPHDB_SINK_RETRIES, dedup: bool = True):
+        super().__init__()
+        self.manager = GraphDBManager(base_url)
+        self.repo_id = repo_id
+        self.context = context
+        self.batch_bytes = batch_bytes
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = retries
+        self.batches = 0
+        self._digests = set() if dedup else None
+        self._buffer = []
+        self._buffer_size = 0
+        self._bnode_file = None
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._transaction_url: Optional[str] = None
+        self._futures = []
+        self._error: Optional[Exception] = None
+
+    def open(self):
+        if self._executor is None:
+            self._transaction_url = self.manager.begin_transaction(self.repo_id)
+            self._bnode_file = tempfile.TemporaryFile()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graphdb-sink')
+
+    def add(self, _tuple):
+        if self._error is not None:
+            raise self._error
+
+        line = nquads_line(_tuple[:3])
+        if self._digests is not None:
+            digest = hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+            if digest in self._digests:
+                return
+            self._digests.add(digest)
+        self._count += 1
+
+        if isinstance(_tuple[0], BNode) or isinstance(_tuple[2], BNode):
+            self._bnode_file.write(line.encode('utf-8'))
+            return
+
+        self._buffer.append(line)
+        self._buffer_size += len(line)
+        if self._buffer_size >= self.batch_bytes:
+            self._flush(self._buffer)
+            self._buffer = []
+            self._buffer_size = 0
+
+    def close(self):
+        if self._executor is None:
+            return
+        try:
+            if self._error is None:
+                self._flush(self._buffer)
+            for future in self._futures:
+                future.exception()
+            if self._error is None and self._bnode_file.tell():
+                self._send_bnodes()
+            if self._error is None:
+                self.manager.commit_transaction(self._transaction_url)
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        finally:
+            if self._error is not None:
+                self._rollback()
+            self._release()
+
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        """Annulla il caricamento dopo un errore del mapper: i blocchi non ancora partiti sono scartati"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._rollback()
+            self._release()
+
+    def _rollback(self):
+        try:
+            self.manager.rollback_transaction(self._transaction_url)
+        except Exception as e:
+            print(f"ERRORE rollback: {e}")
+
+    def _release(self):
+        self._buffer = []
+        self._bnode_file.close()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        SPARQLResultCache.invalidate(self.repo_id)
+        GraphSnapshotStore.invalidate(self.repo_id, all_contexts=True)
+
+    def _flush(self, lines: List[str]):
+        if not lines:
+            return
+        data = "".join(lines).encode('utf-8')
+
+        # backpressure: si attende che uno dei blocchi in coda o in volo termini
+        self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+
+        self.batches += 1
+        future = self._executor.submit(self._send, data, self.batches)
+        future.add_done_callback(self._batch_done)
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+
+    def _batch_done(self, future):
+        if not future.cancelled() and future.exception() is not None and self._error is None:
+            self._error = future.exception()
+        self._slots.release()
+
+    def _send(self, data: bytes, number: int):
+        if self._error is not None:
+            return
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(GRAPHDB_SINK_RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                self.manager.transaction_add(self._transaction_url, iter([data]), 'application/n-triples',
+                                             self.context)
+                return
+            except requests.exceptions.RequestException as e:
+                error = e
+            except Exception as e:
+                # transaction_add: "HTTP <status>: ..."; solo i 5xx sono ritentati
+                error = e
+                if not str(e).startswith('HTTP 5'):
+                    break
+
+        raise Exception(f"Invio del blocco {number} a GraphDB fallito: {error}")
+
+    def _send_bnodes(self):
+        """Invia in un'unica richiesta, senza ritentarla, le triple con blank node accumulate sul file"""
+        self.batches += 1
+        self._bnode_file.seek(0)
+        chunks = iter(lambda: self._bnode_file.read(GRAPHDB_UPLOAD_CHUNK_SIZE), b'')
+        try:
+            self.manager.transaction_add(self._transaction_url, chunks, 'application/n-triples', self.context)
+        except Exception as e:
+            raise Exception(f"Invio del blocco {self.batches} (blank node) a GraphDB fallito: {e}")
+
+
+def _rml_worker_init():
+    """Inizializza un worker di conversione: pyrml viene importato una sola volta per processo."""
+    import pyrml  # noqa: F401
+    logging.getLogger("rdflib").setLevel(logging.ERROR)
+
+
+def _rml_worker_ping() -> int:
+    return os.getpid()
+
+
+def _rml_worker_convert(rml_file: str, output_file: str, strict_mode: bool,
+                        mapping_cache_dir: Optional[str], cwd: str,
+                        sources: Optional[Dict[str, Any]] = None,
+                        graphdb: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Converte un file RML in N-Triples dentro un worker del pool.
+    Le sources in memoria sono registrate come logical source solo per la durata del job.
+    Con graphdb ({'url', 'repo_id', 'context'}) le triple vanno direttamente a GraphDB
+    (GraphDBStatementsSink) invece che in output_file.
+    Il mapper viene azzerato con PyRML.delete_mapper alla fine di ogni job,
+    quindi nessuno stato (sorgenti caricate, cache dei term map) passa da un job all'altro.
+    """
+    from pyrml import PyRML, NTriplesFileSink
+
+    sink = None
+    try:
+        # I path delle logical source sono relativi alla directory di lavoro dell'app
+        if os.getcwd() != cwd:
+            os.chdir(cwd)
+
+        PyRML.RML_STRICT = strict_mode
+        PyRML.MAPPING_CACHE_DIR = mapping_cache_dir
+        for name, data in (sources or {}).items():
+            PyRML.register_source(name, data)
+
+        mapper = PyRML.get_mapper()
+        if graphdb:
+            sink = GraphDBStatementsSink(graphdb['url'], graphdb['repo_id'], graphdb.get('context'))
+            mapper.convert(rml_file, sink=sink)
+            return {'success': True, 'triples': sink.count, 'batches': sink.batches,
+                    'repo_id': graphdb['repo_id'], 'context': graphdb.get('context')}
+
+        sink = mapper.convert(rml_file, sink=NTriplesFileSink(output_file, dedup=True))
+
+        return {'success': True, 'triples': sink.count, 'output': output_file}
+
+    except Exception as e:
+        if isinstance(sink, GraphDBStatementsSink):
+            sink.abort()
+        return {'success': False, 'error': str(e), 'traceback': traceback.format_exc()}
+
+    finally:
+        for name in (sources or {}):
+            PyRML.unregister_source(name)
+        PyRML.delete_mapper()
+
+
 class RMLConverter:
     """
-    RML Converter con subprocess isolation per pyrml locale.
-    Ricrea un processo Python fresco per ogni conversione.
+    RML Converter con un pool persistente di worker (processi separati).
+    I worker restano caldi tra una conversione e l'altra. Ogni worker è un ProcessPoolExecutor
+    con un solo processo: un crash o un timeout termina solo il worker del job coinvolto,
+    che viene sostituito, senza toccare l'app né le conversioni in corso negli altri worker.
     """
 
-    def __init__(self, strict_mode: bool = False):
+    # worker liberi; una conversione attende qui finché uno non si libera
+    _idle: Optional[queue.Queue] = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, strict_mode: bool = False, mapping_cache_dir: Optional[str] = RML_MAPPING_CACHE_DIR):
         """
         Initialize converter.
 
         Args:
             strict_mode: If True, enables RML strict mode validation.
+            mapping_cache_dir: Directory of the on-disk cache of parsed mappings (None disables it).
         """
         self.strict_mode = strict_mode
+        self.mapping_cache_dir = mapping_cache_dir
         self.rdf_graph: Optional[Graph] = None
 
-        logger.info(f"RMLConverter initialized (strict_mode={strict_mode}, subprocess mode)")
+        logger.info(f"RMLConverter initialized (strict_mode={strict_mode}, worker pool mode)")
+
+    @staticmethod
+    def _new_worker() -> ProcessPoolExecutor:
+        # spawn: i worker non ereditano thread e lock dal processo Flask
+        return ProcessPoolExecutor(max_workers=1,
+                                   mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_rml_worker_init)
+
+    @classmethod
+    def get_workers(cls) -> queue.Queue:
+        """Return the queue of idle workers, creating the workers if needed."""
+        with cls._pool_lock:
+            if cls._idle is None:
+                cls._idle = queue.Queue()
+                for _ in range(RML_WORKERS):
+                    cls._idle.put(cls._new_worker())
+                logger.info(f"RML worker pool created ({RML_WORKERS} workers)")
+            return cls._idle
+
+    @classmethod
+    def acquire_worker(cls) -> ProcessPoolExecutor:
+        """Take an idle worker, waiting while all of them are busy."""
+        return cls.get_workers().get()
+
+    @classmethod
+    def release_worker(cls, worker: ProcessPoolExecutor):
+        cls.get_workers().put(worker)
+
+    @classmethod
+    def warm_up(cls):
+        """Prefork the workers of the pool, so that the first conversions do not pay the startup."""
+        workers = [cls.acquire_worker() for _ in range(RML_WORKERS)]
+        try:
+            for future in [worker.submit(_rml_worker_ping) for worker in workers]:
+                future.result()
+        finally:
+            for worker in workers:
+                cls.release_worker(worker)
+
+    @classmethod
+    def discard_worker(cls, worker: ProcessPoolExecutor):
+        """
+        Terminate a crashed or stuck worker and put a new one in the pool.
+        The conversions running in the other workers are not affected.
+        """
+        processes = list((getattr(worker, '_processes', None) or {}).values())
+        worker.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        cls.release_worker(cls._new_worker())
+        logger.warning("RML worker discarded and replaced")
 
     def convert_rml_file(self, rml_file_path: Union[str, Path]) -> Graph:
         """
-        Convert RML file using subprocess isolation.
-        Each conversion runs in a fresh Python process.
+        Convert RML file in the worker pool.
+        The output is N-Triples, which is loaded back into the graph.
+        """
+        result = self.convert_rml_file_to_file(rml_file_path)
+
+        try:
+            # Load graph
+            self.rdf_graph = Graph()
+            self.rdf_graph.parse(result['output'], format='nt')
+
+            return self.rdf_graph
+
+        except Exception as e:
+            error_msg = f"Failed to load {result['output']}: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise RMLConversionError(error_msg) from e
+
+    def convert_rml_file_to_file(self, rml_file_path: Union[str, Path],
+                                 output_file: Optional[Union[str, Path]] = None,
+                                 sources: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Convert RML file writing the triples straight to disk as N-Triples
+        (a subset of Turtle), without building an in-memory graph.
+
+        Args:
+            rml_file_path: Path of the RML mapping.
+            output_file: Destination file (default: <mapping>_output.ttl next to the mapping).
+            sources: In-memory logical sources (rml:source name -> DataFrame or JSON records),
+                registered in the worker with PyRML.register_source.
+
+        Returns:
+            Dict with 'triples' (number of distinct triples written) and 'output' (file path).
         """
         # Validate
         if not rml_file_path:
@@ -1060,103 +1462,118 @@ class RMLConverter:
         print(f"🔄 Converting RML: {rml_path}")
 
         # Output file
-        output_path = rml_path.parent / (rml_path.stem + '_output.ttl')
+        if output_file is None:
+            output_path = rml_path.parent / (rml_path.stem + '_output.ttl')
+        else:
+            output_path = Path(output_file).resolve()
 
         try:
-            # Convert in subprocess
-            result = self._convert_in_subprocess(str(rml_path), str(output_path))
+            # Convert in the worker pool
+            result = self._convert_in_pool(str(rml_path), str(output_path), sources)
 
             if not result['success']:
                 raise RMLConversionError(result.get('error', 'Unknown error'))
 
-            # Load graph
-            self.rdf_graph = Graph()
-            self.rdf_graph.parse(str(output_path), format='turtle')
+            self.rdf_graph = None
 
-            logger.info(f"Conversion complete: {len(self.rdf_graph)} triples")
-            print(f"✅ Conversion complete: {len(self.rdf_graph)} triples")
+            logger.info(f"Conversion complete: {result['triples']} triples")
+            print(f"✅ Conversion complete: {result['triples']} triples")
 
-            return self.rdf_graph
+            return result
 
         except Exception as e:
             error_msg = f"Failed to convert {rml_path}: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise RMLConversionError(error_msg) from e
 
-    def _convert_in_subprocess(self, rml_file: str, output_file: str) -> dict:
-        """Run conversion in isolated subprocess."""
-
-        # Conversion script
-        script = f"""
-import sys
-import json
+    def convert_rml_file_to_graphdb(self, rml_file_path: Union[str, Path], graphdb_url: str, repo_id: str,
+                                    context: Optional[str] = None,
+                                    sources: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Convert RML file streaming the triples straight into a GraphDB repository
+        (GraphDBStatementsSink), without intermediate files.
 
-try:
-    from pyrml import PyRML
+        Args:
+            rml_file_path: Path of the RML mapping.
+            graphdb_url: Base URL of GraphDB.
+            repo_id: Target repository.
+            context: Named graph of the triples (default graph if None).
+            sources: In-memory logical sources, as in convert_rml_file_to_file.
 
-    PyRML.RML_STRICT = {self.strict_mode}
-    mapper = PyRML.get_mapper()
-    graph = mapper.convert(r'{rml_file}')
-    graph.serialize(r'{output_file}', format='turtle')
+        Returns:
+            Dict with 'triples' (number of distinct triples sent) and 'batches' (requests to GraphDB).
+        """
+        if not rml_file_path:
+            raise ValueError("RML file path cannot be empty")
 
-    result = {{'success': True, 'triples': len(graph), 'output': r'{output_file}'}}
-    print(json.dumps(result))
-    sys.exit(0)
+        rml_path = Path(rml_file_path).resolve()
 
-except Exception as e:
-    import traceback
-    result = {{'success': False, 'error': str(e), 'traceback': traceback.format_exc()}}
-    print(json.dumps(result))
-    sys.exit(1)
-"""
+        if not rml_path.exists():
+            raise FileNotFoundError(f"RML file not found: {rml_path}")
 
-        logger.debug(f"Running subprocess conversion: {rml_file}")
-        print(f"🔧 Running isolated conversion...")
+        logger.info(f"Converting RML to GraphDB: {rml_path} -> {repo_id} <{context}>")
+        print(f"🔄 Converting RML to GraphDB: {rml_path} -> {repo_id}")
 
+        graphdb = {'url': graphdb_url, 'repo_id': repo_id, 'context': context}
         try:
-            result = subprocess.run(
-                [sys.executable, '-c', script],
-                capture_output=True,
-                text=True,
-                timeout=300,
-                cwd=os.getcwd()
-            )
-
-            try:
-                # ✅ FIX: Parsing robusto - trova l'ultima riga JSON
-                stdout_lines = result.stdout.strip().split('\n')
+            result = self._convert_in_pool(str(rml_path), None, sources, graphdb=graphdb)
+        finally:
+            # la scrittura è avvenuta nel worker: la cache delle query è quella di questo processo
+            SPARQLResultCache.invalidate(repo_id)
+            GraphSnapshotStore.invalidate(repo_id, all_contexts=True)
+
+        if not result['success']:
+            error_msg = f"Failed to convert {rml_path}: {result.get('error', 'Unknown error')}"
+            logger.error(error_msg)
+            raise RMLConversionError(error_msg)
+
+        print(f"✅ Conversion complete: {result['triples']} triples in {result['batches']} batches")
+        return result
 
-                # Cerca l'ultima riga che inizia con '{'
-                json_line = None
-                for line in reversed(stdout_lines):
-                    line = line.strip()
-                    if line.startswith('{'):
-                        json_line = line
-                        break
+    def _convert_in_pool(self, rml_file: str, output_file: Optional[str], sources: Optional[Dict[str, Any]] = None,
+                         graphdb: Optional[Dict[str, str]] = None) -> dict:
+        """Run conversion in a worker of the pool."""
 
-                if not json_line:
-                    error_msg = f"No JSON output\nstdout: {result.stdout}\nstderr: {result.stderr}"
-                    return {'success': False, 'error': error_msg}
+        logger.debug(f"Running pooled conversion: {rml_file}")
+        print(f"🔧 Running isolated conversion...")
 
-                output = json.loads(json_line)
+        job = (_rml_worker_convert, rml_file, output_file, self.strict_mode, self.mapping_cache_dir, os.getcwd(), sources,
+               graphdb)
+        # l'attesa di un worker libero non conta per il timeout: il job parte appena inviato
+        worker = RMLConverter.acquire_worker()
 
-                if output['success']:
-                    print(f"✓ Subprocess: {output.get('triples', 0)} triples")
-                else:
-                    print(f"✗ Subprocess error: {output.get('error')}")
+        try:
+            try:
+                future = worker.submit(*job)
+            except BrokenProcessPool:
+                # Worker rotto: questo job non è partito, si riprova con il suo sostituto
+                RMLConverter.discard_worker(worker)
+                worker = RMLConverter.acquire_worker()
+                future = worker.submit(*job)
 
-                return output
+            output = future.result(timeout=RML_CONVERSION_TIMEOUT)
 
-            except json.JSONDecodeError as e:
-                error_msg = f"JSON parse error: {e}\nstdout: {result.stdout}\nstderr: {result.stderr}"
-                return {'success': False, 'error': error_msg}
+        except FutureTimeoutError:
+            RMLConverter.discard_worker(worker)
+            return {'success': False, 'error': f'Timeout ({RML_CONVERSION_TIMEOUT // 60} minutes)'}
 
-        except subprocess.TimeoutExpired:
-            return {'success': False, 'error': 'Timeout (5 minutes)'}
+        except BrokenProcessPool as e:
+            RMLConverter.discard_worker(worker)
+            return {'success': False, 'error': f'Conversion worker crashed: {e}'}
 
         except Exception as e:
+            RMLConverter.release_worker(worker)
             return {'success': False, 'error': str(e)}
 
+        RMLConverter.release_worker(worker)
+
+        if output['success']:
+            print(f"✓ Worker: {output.get('triples', 0)} triples")
+        else:
+            print(f"✗ Worker error: {output.get('error')}")
+
+        return output
+
     def save_to_file(self, output_file: Union[str, Path], format: str = 'turtle') -> bool:
         """Save current graph to file."""
         if self.rdf_graph is None:
@@ -1181,12 +1598,22 @@ except Exception as e:
 # ==================== LIMESURVEY API ====================
 
 
+class LimeSurveyConnectionError(Exception):
+    """Errore di trasporto verso LimeSurvey (connessione, timeout): la chiamata può essere ripetuta."""
+    pass
+
+
 class LimeSurveyAPI:
     """
     Client unificato per LimeSurvey RemoteControl API
     Combina funzionalità di lettura (export) e scrittura (creazione survey)
     """
 
+    _transport: Optional[requests.Session] = None
+    _transport_lock = threading.Lock()
+    # URL -> True/False se il server accetta (o no) richieste JSON-RPC batch
+    _batch_support: Dict[str, bool] = {}
+
     def __init__(self, url: str, username: str, password: str):
         """
         Inizializza il client LimeSurvey
@@ -1200,6 +1627,33 @@ class LimeSurveyAPI:
         self.username = username
         self.password = password
         self.session_key = None
+        self.http = LimeSurveyAPI.get_transport()
+
+    @classmethod
+    def get_transport(cls) -> requests.Session:
+        """
+        Sessione HTTP condivisa da tutti i client: le connessioni (TCP/TLS) restano aperte e sono
+        riusate tra le richieste Flask. I tentativi di connessione falliti sono ripetuti da urllib3;
+        le richieste già inviate no, perché le chiamate RPC di scrittura non sono idempotenti.
+        La risposta è compressa (gzip/deflate) se il server lo consente.
+        """
+        with cls._transport_lock:
+            if cls._transport is None:
+                session = requests.Session()
+                retry = Retry(total=LIMESURVEY_MAX_RETRIES, connect=LIMESURVEY_MAX_RETRIES, read=0, status=0,
+                              backoff_factor=LIMESURVEY_RETRY_BACKOFF)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=LIMESURVEY_POOL_SIZE, max_retries=retry)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+                # Nessun cookie condiviso tra client diversi: l'autenticazione passa dalla session key
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                cls._transport = session
+            return cls._transport
+
+    def _debug(self, message: str):
+        if LIMESURVEY_DEBUG:
+            print(f"DEBUG: {message}")
 
     def _call(self, method: str, params: List) -> Any:
         """
@@ -1221,19 +1675,19 @@ class LimeSurveyAPI:
             "id": 1
         }
 
-        print(f"DEBUG: Calling LimeSurvey method: {method}")
-        print(f"DEBUG: URL: {self.url}")
+        self._debug(f"Calling LimeSurvey method: {method}")
+        self._debug(f"URL: {self.url}")
 
         try:
-            response = requests.post(self.url, json=payload, timeout=30)
+            response = self.http.post(self.url, json=payload, timeout=LIMESURVEY_TIMEOUT)
 
-            print(f"DEBUG: Response status: {response.status_code}")
-            print(f"DEBUG: Response content type: {response.headers.get('content-type', 'unknown')}")
+            self._debug(f"Response status: {response.status_code}")
+            self._debug(f"Response content type: {response.headers.get('content-type', 'unknown')}")
 
             # Verifica se la risposta è HTML (pagina di errore)
             if 'text/html' in response.headers.get('content-type', ''):
-                print(f"DEBUG: Received HTML instead of JSON")
-                print(f"DEBUG: First 500 chars: {response.text[:500]}")
+                self._debug(f"Received HTML instead of JSON")
+                self._debug(f"First 500 chars: {response.text[:500]}")
                 raise Exception(
                     f"LimeSurvey returned HTML instead of JSON. "
                     f"Check if RemoteControl is enabled and URL is correct. URL: {self.url}"
@@ -1246,20 +1700,84 @@ class LimeSurveyAPI:
                 error_msg = result["error"]
                 if isinstance(error_msg, dict):
                     error_msg = error_msg.get("message", str(error_msg))
-                print(f"DEBUG: API Error: {error_msg}")
+                self._debug(f"API Error: {error_msg}")
                 raise Exception(f"LimeSurvey API Error: {error_msg}")
 
-            print(f"DEBUG: Success - Result: {str(result.get('result'))[:200]}")
+            if LIMESURVEY_DEBUG:
+                self._debug(f"Success - Result: {str(result.get('result'))[:200]}")
             return result.get("result")
 
         except requests.exceptions.RequestException as e:
-            print(f"DEBUG: Request failed: {e}")
-            raise Exception(f"Failed to connect to LimeSurvey: {e}")
+            self._debug(f"Request failed: {e}")
+            raise LimeSurveyConnectionError(f"Failed to connect to LimeSurvey: {e}")
         except json.JSONDecodeError as e:
-            print(f"DEBUG: JSON decode error: {e}")
-            print(f"DEBUG: Response text: {response.text[:500]}")
+            self._debug(f"JSON decode error: {e}")
+            self._debug(f"Response text: {response.text[:500]}")
             raise Exception(f"Invalid JSON response from LimeSurvey. Check if RemoteControl API is enabled.")
 
+    def call_batch(self, calls: List[tuple]) -> List[Any]:
+        """
+        Esegue più chiamate RPC con una sola richiesta HTTP (JSON-RPC batch), se il server lo consente.
+        Se il server rifiuta il batch con una risposta JSON-RPC valida le chiamate sono eseguite una alla
+        volta con _call e il fallback viene ricordato per l'URL. Una risposta non valida (5xx, pagina HTML
+        di un proxy...) non cambia quanto già noto sull'URL: se il batch era già stato accettato è un
+        errore di trasporto da ripetere, altrimenti solo questa volta si passa alle chiamate singole.
+
+        Args:
+            calls: Lista di (metodo, parametri)
+
+        Returns:
+            Risultati nell'ordine delle chiamate
+
+        Raises:
+            LimeSurveyConnectionError: Se la richiesta fallisce o, con batch già accettato, la risposta non è valida
+            Exception: Se una delle chiamate ritorna errore
+        """
+        if not calls:
+            return []
+
+        batch_support = LimeSurveyAPI._batch_support.get(self.url)
+        if len(calls) > 1 and batch_support is not False:
+            payload = [{"method": method, "params": params, "id": i} for i, (method, params) in enumerate(calls)]
+            self._debug(f"Calling LimeSurvey batch: {len(calls)} calls")
+
+            try:
+                response = self.http.post(self.url, json=payload, timeout=LIMESURVEY_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                raise LimeSurveyConnectionError(f"Failed to connect to LimeSurvey: {e}")
+            try:
+                results = response.json() if response.status_code < 500 else None
+            except ValueError:
+                results = None
+
+            if isinstance(results, list) and all(isinstance(r, dict) and 'id' in r for r in results):
+                by_id = {r['id']: r for r in results}
+                if all(i in by_id for i in range(len(calls))):
+                    LimeSurveyAPI._batch_support[self.url] = True
+                    output = []
+                    for i, (method, _) in enumerate(calls):
+                        error_msg = by_id[i].get('error')
+                        if error_msg:
+                            if isinstance(error_msg, dict):
+                                error_msg = error_msg.get("message", str(error_msg))
+                            raise Exception(f"LimeSurvey API Error ({method}): {error_msg}")
+                        output.append(by_id[i].get('result'))
+                    return output
+
+            if results is None:
+                # risposta non JSON-RPC: non dice nulla sul supporto del batch
+                if batch_support:
+                    raise LimeSurveyConnectionError(
+                        f"Invalid batch response from LimeSurvey (HTTP {response.status_code})")
+                print(f"⚠️ Risposta non valida al JSON-RPC batch (HTTP {response.status_code}): chiamate singole")
+            elif batch_support:
+                raise Exception(f"Unexpected LimeSurvey batch response: {str(results)[:200]}")
+            else:
+                print(f"ℹ️ JSON-RPC batch non supportato da {self.url}: chiamate singole")
+                LimeSurveyAPI._batch_support[self.url] = False
+
+        return [self._call(method, params) for method, params in calls]
+
     def get_session_key(self) -> str:
         """
         Ottiene la session key per l'autenticazione
@@ -1400,24 +1918,83 @@ class LimeSurveyAPI:
             self.get_session_key()
         return self._call('get_question_properties', [self.session_key, question_id])
 
-    def export_all_question_properties_survey(self, survey_id):
+    def _call_with_retry(self, calls: List[tuple], retries: int = LIMESURVEY_MAX_RETRIES,
+                         backoff: float = LIMESURVEY_RETRY_BACKOFF) -> List[Any]:
+        """
+        Come call_batch, ma ripete le chiamate in caso di errori di trasporto,
+        attendendo backoff, 2*backoff, 4*backoff... secondi tra un tentativo e l'altro.
+        Gli errori restituiti dall'API non vengono ripetuti.
+        """
+        for attempt in range(retries + 1):
+            try:
+                return self.call_batch(calls)
+            except LimeSurveyConnectionError as e:
+                if attempt == retries:
+                    raise
+                delay = backoff * (2 ** attempt)
+                print(f"⚠️ {calls[0][0]}: tentativo {attempt + 1} fallito ({e}), nuovo tentativo tra {delay:.1f}s")
+                time.sleep(delay)
+
+    def export_all_question_properties_survey(self, survey_id, concurrency: int = LIMESURVEY_EXPORT_CONCURRENCY,
+                                              filename: str = "questions.json") -> str:
+        """
+        Esporta le proprietà di tutte le domande di una survey in exports/<filename>.
+
+        Le chiamate get_question_properties sono raggruppate in JSON-RPC batch di LIMESURVEY_BATCH_SIZE
+        (se il server li accetta) ed eseguite in parallelo (al più concurrency richieste alla volta)
+        sulla sessione HTTP condivisa, con retry e backoff sugli errori di trasporto.
+        Le domande sono scritte nel file man mano che arrivano, nell'ordine di list_questions;
+        il file viene sostituito solo a export completato.
+
+        Returns:
+            Path del file JSON
+        """
         if not self.session_key:
             self.get_session_key()
 
-        data1 = self.list_questions(survey_id)
-        print("sono all'inizio")
-        data = []
-        k = 0
+        questions = self.list_questions(survey_id)
+        if not isinstance(questions, list):
+            # LimeSurvey restituisce {'status': ...} se la survey non ha domande
+            questions = []
+
+        print(f"🔄 Export di {len(questions)} domande (concorrenza {concurrency})")
+
+        exports_dir = Path("exports")
+        exports_dir.mkdir(exist_ok=True)
+        output_path = exports_dir / filename
+        tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+
+        def fetch(chunk):
+            return self._call_with_retry([('get_question_properties', [self.session_key, q['qid']]) for q in chunk])
 
-        for e in data1:  # ciclo sulle domande della survey
-            risultato_intermedio = self.get_question_properties(e['qid'])
-            print(risultato_intermedio)
-            data.append(risultato_intermedio)
+        start = time.time()
+        count = 0
+        try:
+            # La prima richiesta (batch di due domande) verifica anche se il server accetta i batch
+            head = fetch(questions[:2])
+            batch_size = LIMESURVEY_BATCH_SIZE if LimeSurveyAPI._batch_support.get(self.url) else 1
+            chunks = [questions[i:i + batch_size] for i in range(2, len(questions), batch_size)]
+
+            with open(tmp_path, 'w', encoding='utf-8') as f, \
+                    ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='limesurvey-export') as executor:
+                f.write('[')
+                for properties in itertools.chain(head, itertools.chain.from_iterable(executor.map(fetch, chunks))):
+                    # Stesso formato di json.dump(data, indent=2) sull'intera lista
+                    item = json.dumps(properties, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+                    f.write((',\n  ' if count else '\n  ') + item)
+                    count += 1
+                    if count % 100 == 0:
+                        print(f"  ... {count}/{len(questions)} domande")
+                f.write('\n]' if count else ']')
+
+            os.replace(tmp_path, output_path)
+        except Exception:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
 
-        # Save to JSON and return path
-        output_path = self._save_to_json(data, "questions.json")
-        print(f"✅ Exported {len(data)} questions to {output_path}")
-        return output_path
+        print(f"✅ Exported {count} questions to {output_path} in {time.time() - start:.2f}s")
+        return str(output_path)
 
     def _save_to_json(self, data: any, filename: str) -> str:
         """Save data to JSON file in exports directory"""
@@ -1769,6 +2346,184 @@ class SurveyExporter:
 
 # ==================== GRAPHDB MANAGER and CLIENT====================
 
+class SPARQLResultCache:
+    """
+    Cache (TTL + LRU) dei risultati delle query di lettura di GraphDBClient, condivisa nel processo.
+    La chiave è (endpoint, query normalizzata, versione del repository): ogni scrittura fatta dall'app
+    (GraphDBManager o update SPARQL) incrementa la versione del repository e rende irraggiungibili
+    le risposte precedenti. Le scritture fatte fuori dall'app sono visibili al più dopo il TTL.
+    """
+
+    _entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+    _versions: Dict[str, int] = {}
+    _lock = threading.Lock()
+
+    _literal = re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'')
+
+    @classmethod
+    def normalize(cls, query: str) -> str:
+        """Compatta gli spazi della query fuori dai letterali, che restano invariati"""
+        parts = []
+        position = 0
+        for match in cls._literal.finditer(query):
+            parts.append(" ".join(query[position:match.start()].split()))
+            parts.append(match.group(0))
+            position = match.end()
+        parts.append(" ".join(query[position:].split()))
+        return " ".join(part for part in parts if part)
+
+    @classmethod
+    def version(cls, repository: str) -> int:
+        with cls._lock:
+            return cls._versions.get(repository, 0)
+
+    @classmethod
+    def invalidate(cls, repository: str):
+        """Da chiamare dopo ogni scrittura sul repository (il nome, indipendente dall'URL di GraphDB)"""
+        with cls._lock:
+            cls._versions[repository] = cls._versions.get(repository, 0) + 1
+            for key in [key for key in cls._entries if key[1] == repository]:
+                del cls._entries[key]
+
+    @classmethod
+    def get(cls, key: tuple) -> Optional[Dict[str, Any]]:
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del cls._entries[key]
+                return None
+            cls._entries.move_to_end(key)
+            return results
+
+    @classmethod
+    def put(cls, key: tuple, results: Dict[str, Any]):
+        if GRAPHDB_QUERY_CACHE_TTL <= 0 or GRAPHDB_QUERY_CACHE_SIZE <= 0:
+            return
+        with cls._lock:
+            # la versione è cambiata durante la query: la risposta potrebbe essere già vecchia
+            if key[3] != cls._versions.get(key[1], 0):
+                return
+            cls._entries[key] = (time.monotonic() + GRAPHDB_QUERY_CACHE_TTL, results)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > GRAPHDB_QUERY_CACHE_SIZE:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+
+
+class GraphSnapshotStore:
+    """
+    Stato locale dei named graph scritti da GraphDBManager, per (GraphDB, repository, context):
+    - snapshot (.nt): le righe N-Triples dell'ultima sincronizzazione (sync_files);
+    - manifest (.json): hash del contenuto e numero di triple dell'ultimo file caricato
+      (upload_file, bulk_upload), per saltare il caricamento di un file identico.
+    Una scrittura fatta per altre vie rende entrambi inaffidabili: vanno invalidati, e il caricamento
+    successivo di quel graph torna a essere completo.
+    """
+
+    # formati con il named graph in ogni statement: senza context possono toccare qualunque graph
+    QUAD_FORMATS = ('application/n-quads', 'application/trig')
+
+    _locks: Dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+
+    @staticmethod
+    def _digest(value: str) -> str:
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+    @classmethod
+    def _repository_dir(cls, repository: str) -> Path:
+        return Path(GRAPHDB_SNAPSHOT_DIR) / cls._digest(repository)
+
+    @classmethod
+    def path(cls, base_url: str, repository: str, context: Optional[str]) -> Path:
+        # repository e context nel percorso per invalidare senza conoscere l'URL di GraphDB
+        return cls._repository_dir(repository) / f"{cls._digest(context or '')}-{cls._digest(base_url.rstrip('/'))}.nt"
+
+    @classmethod
+    def lock(cls, path: Path) -> threading.Lock:
+        with cls._locks_lock:
+            return cls._locks.setdefault(str(path), threading.Lock())
+
+    @classmethod
+    def manifest_path(cls, base_url: str, repository: str, context: Optional[str]) -> Path:
+        return cls.path(base_url, repository, context).with_suffix('.json')
+
+    @classmethod
+    def invalidate(cls, repository: str, context: Optional[str] = None, all_contexts: bool = False):
+        """Elimina snapshot e manifest di un context (None = default graph) o, con all_contexts, dell'intero repository"""
+        directory = cls._repository_dir(repository)
+        if not directory.exists():
+            return
+        prefix = "" if all_contexts else f"{cls._digest(context or '')}-"
+        for pattern in (f"{prefix}*.nt", f"{prefix}*.json"):
+            for path in directory.glob(pattern):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def discard_snapshot(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def discard_manifest(cls, base_url: str, repository: str, context: Optional[str]):
+        try:
+            cls.manifest_path(base_url, repository, context).unlink()
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def manifest(cls, base_url: str, repository: str, context: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Voce del manifest dell'ultimo caricamento nel graph, None se assente o illeggibile"""
+        try:
+            with open(cls.manifest_path(base_url, repository, context), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def record_upload(cls, base_url: str, repository: str, context: Optional[str], entry: Dict[str, Any]):
+        """Registra l'ultimo caricamento nel graph; se la scrittura fallisce la voce precedente è rimossa"""
+        path = cls.manifest_path(base_url, repository, context)
+        try:
+            cls._write_atomic(path, lambda out: out.write(json.dumps(entry, ensure_ascii=False).encode('utf-8')))
+        except OSError as e:
+            print(f"⚠ Manifest non salvato per {context}: {e}")
+            cls.discard_manifest(base_url, repository, context)
+
+    @classmethod
+    def save(cls, path: Path, lines_file: Path):
+        """Sostituisce lo snapshot in modo atomico con il file di righe N-Triples indicato"""
+        def copy(out):
+            with open(lines_file, 'rb') as src:
+                shutil.copyfileobj(src, out, GRAPHDB_UPLOAD_CHUNK_SIZE)
+        cls._write_atomic(path, copy)
+
+    @staticmethod
+    def _write_atomic(path: Path, write):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
 class GraphDBManager:
     """Gestisce la connessione e le operazioni con GraphDB"""
 
@@ -1961,6 +2716,8 @@ class GraphDBManager:
     def delete_repository(self, repo_id):
         url = f"{self.base_url}/rest/repositories/{repo_id}"
         response = self.session.delete(url)
+        SPARQLResultCache.invalidate(repo_id)
+        GraphSnapshotStore.invalidate(repo_id, all_contexts=True)
         if response.status_code == 200:
             return {"success": True, "message": f"Repository '{repo_id}' eliminato"}
         else:
@@ -1974,8 +2731,20 @@ class GraphDBManager:
         else:
             return {"success": False, "message": f"Errore: {response.status_code}"}
 
-    def upload_file(self, repo_id, file_path, context=None, file_format=None):
+    def upload_file(self, repo_id, file_path, context=None, file_format=None, compress=None, batch_bytes=None,
+                    force=False):
+        """
+        Carica un file RDF leggendolo dal disco a blocchi (corpo chunked, memoria costante).
+        I file .gz sono inviati così come sono con Content-Encoding: gzip; gli altri sono compressi
+        al volo se compress (default GRAPHDB_UPLOAD_GZIP). I file N-Triples/N-Quads più grandi
+        di batch_bytes (default GRAPHDB_UPLOAD_BATCH_BYTES) sono inviati in più richieste,
+        divisi a fine riga, purché non contengano blank node (il loro nome vale per un solo invio).
+        Un file identico all'ultimo caricato nello stesso graph (manifest di GraphSnapshotStore)
+        non viene reinviato, salvo force.
+        """
         file_path = Path(file_path)
+        compress = GRAPHDB_UPLOAD_GZIP if compress is None else compress
+        batch_bytes = GRAPHDB_UPLOAD_BATCH_BYTES if batch_bytes is None else batch_bytes
 
         print(f"\n--- GraphDBManager.upload_file ---")
         print(f"Repository: {repo_id}")
@@ -1988,20 +2757,20 @@ class GraphDBManager:
             print(f"ERRORE: {error_msg}")
             return {"success": False, "message": error_msg}
 
+        detected_format, gzipped = self.rdf_format(file_path)
         if file_format is None:
-            extension_map = {
-                '.ttl': 'text/turtle',
-                '.rdf': 'application/rdf+xml',
-                '.owl': 'application/rdf+xml',
-                '.nt': 'application/n-triples',
-                '.nq': 'application/n-quads',
-                '.jsonld': 'application/ld+json',
-                '.trig': 'application/trig'
-            }
-            file_format = extension_map.get(file_path.suffix.lower(), 'text/turtle')
+            file_format = detected_format
 
         print(f"File format: {file_format}")
 
+        content_hash = self.file_digest(file_path, file_format)
+        if not force:
+            entry = GraphSnapshotStore.manifest(self.base_url, repo_id, context)
+            if entry is not None and entry.get('sha256') == content_hash:
+                success_msg = f"File '{file_path.name}' invariato, già caricato in '{repo_id}'"
+                print(f"SKIP: {success_msg}")
+                return {"success": True, "message": success_msg, "skipped": True, "triples": entry.get('triples')}
+
         url = f"{self.base_url}/repositories/{repo_id}/statements"
         params = {}
         if context:
@@ -2010,21 +2779,37 @@ class GraphDBManager:
         print(f"URL GraphDB: {url}")
         print(f"Params: {params}")
 
-        headers = {"Content-Type": file_format}
-
         try:
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                print(f"File size: {len(file_content)} bytes")
-                response = self.session.post(url, params=params, data=file_content, headers=headers)
+            file_size = file_path.stat().st_size
+            print(f"File size: {file_size} bytes")
+
+            line_based = file_format in ('application/n-triples', 'application/n-quads')
+            if (line_based and not gzipped and 0 < batch_bytes < file_size
+                    and not self._has_blank_nodes(file_path)):
+                batches = 0
+                with open(file_path, 'rb') as f:
+                    while f.tell() < file_size:
+                        batches += 1
+                        response = self.upload_data(repo_id, self._line_batch(f, batch_bytes), file_format,
+                                                    context, compress=compress)
+                        print(f"Batch {batches}: {f.tell()}/{file_size} bytes, status {response.status_code}")
+                        if response.status_code not in [200, 201, 204]:
+                            break
+                print(f"Batches: {batches}")
+            else:
+                with open(file_path, 'rb') as f:
+                    chunks = iter(lambda: f.read(GRAPHDB_UPLOAD_CHUNK_SIZE), b'')
+                    response = self.upload_data(repo_id, chunks, file_format, context,
+                                                 compress=compress, gzipped=gzipped)
 
             print(f"Response status: {response.status_code}")
             print(f"Response text: {response.text[:500] if response.text else 'empty'}")
 
             if response.status_code in [200, 201, 204]:
+                triples = self.record_upload(repo_id, file_path, context, file_format, content_hash)
                 success_msg = f"File '{file_path.name}' caricato in '{repo_id}'"
                 print(f"SUCCESS: {success_msg}")
-                return {"success": True, "message": success_msg}
+                return {"success": True, "message": success_msg, "skipped": False, "triples": triples}
             else:
                 error_msg = f"Errore HTTP {response.status_code}: {response.text}"
                 print(f"ERRORE: {error_msg}")
@@ -2036,243 +2821,757 @@ class GraphDBManager:
             traceback.print_exc()
             return {"success": False, "message": error_msg}
 
-    def clear_repository(self, repo_id, context=None):
-        url = f"{self.base_url}/repositories/{repo_id}/statements"
-        params = {}
-        if context:
-            params['context'] = f"<{context}>"
-        response = self.session.delete(url, params=params)
-        if response.status_code in [200, 204]:
-            target = f"named graph '{context}'" if context else "repository"
-            return {"success": True, "message": f"{target} svuotato"}
-        else:
-            return {"success": False, "message": f"Errore: {response.status_code}"}
-
-    def delete_by_subject(self, repo_id, subject_uri):
-        url = f"{self.base_url}/repositories/{repo_id}/statements"
-        params = {"subj": f"<{subject_uri}>"}
-        response = self.session.delete(url, params=params)
-        if response.status_code in [200, 204]:
-            return {"success": True, "message": f"Dati eliminati per: {subject_uri}"}
-        else:
-            return {"success": False, "message": f"Errore: {response.status_code}"}
+    def bulk_upload(self, repo_id, files, compress=None, batch_bytes=None, force=False):
+        """
+        Carica più file in una sola transazione RDF4J (/repositories/{id}/transactions) con un solo commit:
+        se un invio fallisce la transazione è annullata e il repository resta com'era.
+        I file N-Triples/N-Quads senza blank node sono divisi in blocchi di batch_bytes a fine riga;
+        i blocchi successivi vengono letti (e compressi) da un pool di thread mentre il precedente è in invio.
+        Gli invii di una transazione sono invece in sequenza, come richiede RDF4J.
 
+        Args:
+            repo_id: Repository di destinazione
+            files: Lista di (file_path, context o None)
+            compress: Corpo gzip (default GRAPHDB_UPLOAD_GZIP)
+            batch_bytes: Dimensione massima dei blocchi (default GRAPHDB_UPLOAD_BATCH_BYTES)
+            force: Invia anche i file identici all'ultimo caricamento nel loro graph
 
-class GraphDBClient:
-
-    def __init__(self, endpoint: str, repository: str):
-        self.endpoint = f"{endpoint}/repositories/{repository}"
-        self.sparql = SPARQLWrapper(self.endpoint)
-        self.sparql.setReturnFormat(JSON)
+        Returns:
+            Dizionario con success, message, i file saltati perché invariati (skipped)
+            e le triple di ogni graph dopo il caricamento (triples, per file)
+        """
+        compress = GRAPHDB_UPLOAD_GZIP if compress is None else compress
+        batch_bytes = GRAPHDB_UPLOAD_BATCH_BYTES if batch_bytes is None else batch_bytes
+
+        print(f"\n--- GraphDBManager.bulk_upload ---")
+        print(f"Repository: {repo_id}, files: {len(files)}")
+
+        for file_path, _ in files:
+            if not Path(file_path).exists():
+                return {"success": False, "message": f"File non trovato: {file_path}"}
+
+        # file identici all'ultimo caricamento nello stesso graph: non vengono reinviati
+        skipped, triples, hashes, to_send = [], {}, {}, []
+        for file_path, context in files:
+            file_format, _ = self.rdf_format(file_path)
+            hashes[str(file_path)] = self.file_digest(file_path, file_format)
+            entry = None if force else GraphSnapshotStore.manifest(self.base_url, repo_id, context)
+            if entry is not None and entry.get('sha256') == hashes[str(file_path)]:
+                skipped.append(str(file_path))
+                triples[str(file_path)] = entry.get('triples')
+            else:
+                to_send.append((file_path, context))
+
+        if not to_send:
+            success_msg = f"{len(files)} file invariati, già caricati in '{repo_id}'"
+            print(f"SKIP: {success_msg}")
+            return {"success": True, "message": success_msg, "batches": 0, "skipped": skipped, "triples": triples}
+        if skipped:
+            print(f"Invariati, non reinviati: {skipped}")
+        files = to_send
+
+        # Blocchi da inviare: (file, context, formato, offset, lunghezza); lunghezza None = file intero in streaming
+        batches = []
+        for file_path, context in files:
+            file_path = Path(file_path)
+            file_format, gzipped = self.rdf_format(file_path)
+            file_size = file_path.stat().st_size
+            line_based = file_format in ('application/n-triples', 'application/n-quads')
+            if (line_based and not gzipped and 0 < batch_bytes < file_size
+                    and not self._has_blank_nodes(file_path)):
+                batches.extend((file_path, context, file_format, offset, length)
+                               for offset, length in self._line_ranges(file_path, batch_bytes))
+            else:
+                batches.append((file_path, context, file_format, 0, None))
 
-    def execute_query(self, query: str) -> Dict[str, Any]:
-        # Esegue una query SPARQL e ritorna i risultati"""
         try:
-            self.sparql.setQuery(query)
-            results = self.sparql.query().convert()
-            return results
+            transaction_url = self.begin_transaction(repo_id)
         except Exception as e:
-            raise Exception(f"Errore query SPARQL: {str(e)}")
+            return {"success": False, "message": f"Eccezione: {str(e)}"}
 
-        # ... [mantieni tutti i metodi esistenti] ...
+        print(f"Transaction: {transaction_url}, batches: {len(batches)}")
 
-    def get_complete_question_data(self, question_uri: str) -> Dict[str, Any]:
+        def prepare(batch):
+            file_path, _, _, offset, length = batch
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+            return zlib.compress(data, wbits=31) if compress else data
 
-        query = f"""
-                PREFIX ls: <https://w3id.org/fossr/ontology/limesurvey/>
-                PREFIX ns1: <https://w3id.org/fossr/ontology/limesurvey/>
-
-                SELECT DISTINCT 
-                  ?qid ?sid ?gid ?type ?title ?questionText ?script
-                  ?attrName ?attrValue
-                  ?parentQid
-                  ?subQuestion ?subQid ?subTitle ?subQuestionText ?subOrder
-                  ?answer ?answerCode ?answerText ?answerSortOrder ?answerAssessmentValue ?answerScaleId
-                WHERE {{
-                  <{question_uri}> a ls:Question .
-                  <{question_uri}> ls:hasId ?idNode .
-                  ?idNode ls:id ?qid .
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasSurveyId ?sidNode .
-                    ?sidNode ls:id ?sid .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasGroup ?groupNode .
-                    ?groupNode ns1:hasId ?gidNode .
-                    ?gidNode ns1:id ?gid .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasType ?typeNode .
-                    ?typeNode ls:code ?type .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasVariable ?varNode .
-                    ?varNode ls:variableCod ?title .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasContent ?contentNode .
-                    ?contentNode ls:text ?questionText .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasContent ?contentNode .
-                    ?contentNode ls:script ?script .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasComponentAttribute ?attr .
-                    ?attr ls:componentName ?attrName .
-                    ?attr ls:componentValue ?attrValue .
-                  }}
-
-                  OPTIONAL {{
-                    <{question_uri}> ls:hasParentQuestion ?parentQuestion .
-                    ?parentQuestion ls:hasId ?parentIdNode .
-                    ?parentIdNode ls:id ?parentQid .
-                  }}
+        prepared = {}
+        executor = ThreadPoolExecutor(max_workers=GRAPHDB_TXN_PREPARE_WORKERS, thread_name_prefix='graphdb-txn')
+        try:
+            for i, batch in enumerate(batches):
+                # finestra di blocchi preparati in anticipo: la memoria resta limitata
+                for j in range(i, min(len(batches), i + GRAPHDB_TXN_PREPARE_WORKERS + 1)):
+                    if j not in prepared and batches[j][4] is not None:
+                        prepared[j] = executor.submit(prepare, batches[j])
+
+                file_path, context, file_format, offset, length = batch
+                if length is None:
+                    gzipped = file_path.suffix.lower() == '.gz'
+                    with open(file_path, 'rb') as f:
+                        chunks = iter(lambda: f.read(GRAPHDB_UPLOAD_CHUNK_SIZE), b'')
+                        self.transaction_add(transaction_url, chunks, file_format, context,
+                                             compress=compress, gzipped=gzipped)
+                else:
+                    data = prepared.pop(i).result()
+                    self.transaction_add(transaction_url, iter([data]), file_format, context,
+                                         gzipped=compress)
+                print(f"Batch {i + 1}/{len(batches)}: {file_path.name} OK")
 
-                  OPTIONAL {{
-                    ?subQuestion ls:hasParentQuestion <{question_uri}> .
-                    ?subQuestion ls:hasId ?subIdNode .
-                    ?subIdNode ls:id ?subQid .
+            self.commit_transaction(transaction_url)
 
-                    OPTIONAL {{
-                      ?subQuestion ls:hasVariable ?subVarNode .
-                      ?subVarNode ls:variableCod ?subTitle .
-                    }}
+        except Exception as e:
+            error_msg = f"Transazione annullata: {str(e)}"
+            print(f"ERRORE: {error_msg}")
+            try:
+                self.rollback_transaction(transaction_url)
+            except Exception as rollback_error:
+                print(f"ERRORE rollback: {rollback_error}")
+            return {"success": False, "message": error_msg}
 
-                    OPTIONAL {{
-                      ?subQuestion ls:hasContent ?subContentNode .
-                      ?subContentNode ls:text ?subQuestionText .
-                    }}
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            SPARQLResultCache.invalidate(repo_id)
+            for file_path, context in files:
+                GraphSnapshotStore.invalidate(repo_id, context,
+                                              all_contexts=self.rdf_format(file_path)[0] in GraphSnapshotStore.QUAD_FORMATS)
+
+        for file_path, context in files:
+            triples[str(file_path)] = self.record_upload(repo_id, file_path, context, self.rdf_format(file_path)[0],
+                                                         hashes[str(file_path)])
+
+        success_msg = f"{len(files)} file caricati in '{repo_id}' in una transazione"
+        if skipped:
+            success_msg += f", {len(skipped)} invariati"
+        print(f"SUCCESS: {success_msg}")
+        return {"success": True, "message": success_msg, "batches": len(batches), "skipped": skipped,
+                "triples": triples}
+
+    def sync_files(self, repo_id, files):
+        """
+        Sincronizza i named graph con i file indicati inviando solo le differenze:
+        le righe N-Triples dei file sono confrontate con lo snapshot dell'ultima sincronizzazione
+        (GraphSnapshotStore) e triple eliminate e nuove vanno in una sola transazione RDF4J.
+        Un graph senza snapshot, o con blank node (i cui nomi cambiano a ogni caricamento),
+        viene svuotato e ricaricato per intero nella stessa transazione.
 
-                    OPTIONAL {{
-                      ?subQuestion ls:hasComponentAttribute ?subOrderAttr .
-                      ?subOrderAttr ls:componentName "question_order" .
-                      ?subOrderAttr ls:componentValue ?subOrder .
-                    }}
-                  }}
+        Args:
+            repo_id: Repository di destinazione
+            files: Lista di (file_path, context o None)
 
-                  OPTIONAL {{
-                    ?answer a ls:AnswerOption .
-                    <{question_uri}> ls:hasAnswerOption ?answer .
+        Returns:
+            Dizionario con success, message, inserted, deleted e i graph ricaricati per intero (full_reload)
+        """
+        print(f"\n--- GraphDBManager.sync_files ---")
+        print(f"Repository: {repo_id}, files: {len(files)}")
 
-                    OPTIONAL {{
-                      ?answer ls:componentValue ?answerCode .
-                    }}
+        for file_path, _ in files:
+            if not Path(file_path).exists():
+                return {"success": False, "message": f"File non trovato: {file_path}"}
 
-                    OPTIONAL {{
-                      ?answer ls:hasContent ?answerContentNode .
-                      ?answerContentNode ls:text ?answerText .
-                    }}
+        snapshots = [GraphSnapshotStore.path(self.base_url, repo_id, context) for _, context in files]
+        locks = [GraphSnapshotStore.lock(path) for path in sorted(set(snapshots))]
+        for lock in locks:
+            lock.acquire()
 
-                    OPTIONAL {{
-                      ?answer ls:hasComponentAttribute ?answerAttr1 .
-                      ?answerAttr1 ls:componentName "sortorder" .
-                      ?answerAttr1 ls:componentValue ?answerSortOrder .
-                    }}
+        work_dir = tempfile.mkdtemp(prefix='graphdb_sync_')
+        try:
+            plans = []
+            for (file_path, context), snapshot in zip(files, snapshots):
+                # righe N-Triples del nuovo contenuto, una tripla per riga
+                lines_file = Path(work_dir) / f"{len(plans)}.nt"
+                has_bnodes = self._write_ntriples_lines(file_path, lines_file)
+
+                if has_bnodes or not snapshot.exists():
+                    plans.append({'context': context, 'snapshot': snapshot, 'lines': lines_file, 'full': True,
+                                  'bnodes': has_bnodes})
+                    continue
 
-                    OPTIONAL {{
-                      ?answer ls:hasComponentAttribute ?answerAttr2 .
-                      ?answerAttr2 ls:componentName "assessment_value" .
-                      ?answerAttr2 ls:componentValue ?answerAssessmentValue .
-                    }}
+                new_digests = self._line_digests(lines_file)
+                old_digests = self._line_digests(snapshot)
+                deletes = [line for line in self._read_lines(snapshot) if self._line_digest(line) not in new_digests]
+                inserts = [line for line in self._read_lines(lines_file) if self._line_digest(line) not in old_digests]
+                plans.append({'context': context, 'snapshot': snapshot, 'lines': lines_file, 'full': False,
+                              'deletes': deletes, 'inserts': inserts, 'bnodes': False})
+
+            inserted = sum(len(p['inserts']) for p in plans if not p['full'])
+            deleted = sum(len(p['deletes']) for p in plans if not p['full'])
+            full_reload = [p['context'] for p in plans if p['full']]
+            print(f"Delta: +{inserted} -{deleted}, full reload: {full_reload}")
+
+            if inserted or deleted or full_reload:
+                # il contenuto dei graph cambia: il manifest vale di nuovo solo dopo il commit, e lo
+                # snapshot di un graph ricaricato per intero solo se viene riscritto (senza blank node)
+                for plan in plans:
+                    GraphSnapshotStore.discard_manifest(self.base_url, repo_id, plan['context'])
+                    if plan['full']:
+                        GraphSnapshotStore.discard_snapshot(plan['snapshot'])
+                transaction_url = self.begin_transaction(repo_id)
+                try:
+                    for plan in plans:
+                        context = plan['context']
+                        if plan['full']:
+                            target = f"GRAPH <{context}>" if context else "DEFAULT"
+                            self.transaction_update(transaction_url, f"DROP SILENT {target}")
+                            with open(plan['lines'], 'rb') as f:
+                                chunks = iter(lambda: f.read(GRAPHDB_UPLOAD_CHUNK_SIZE), b'')
+                                self.transaction_add(transaction_url, chunks, 'application/n-triples', context)
+                            continue
+                        if plan['deletes']:
+                            self.transaction_delete(transaction_url, iter(["".join(plan['deletes']).encode('utf-8')]),
+                                                    'application/n-triples', context)
+                        if plan['inserts']:
+                            self.transaction_add(transaction_url, iter(["".join(plan['inserts']).encode('utf-8')]),
+                                                 'application/n-triples', context)
+                    self.commit_transaction(transaction_url)
+                except Exception:
+                    try:
+                        self.rollback_transaction(transaction_url)
+                    except Exception as rollback_error:
+                        print(f"ERRORE rollback: {rollback_error}")
+                    raise
+                finally:
+                    SPARQLResultCache.invalidate(repo_id)
+
+            # gli snapshot seguono il contenuto appena scritto; con blank node non sono confrontabili
+            for plan in plans:
+                if plan['bnodes']:
+                    continue
+                try:
+                    GraphSnapshotStore.save(plan['snapshot'], plan['lines'])
+                except OSError as e:
+                    print(f"⚠ Snapshot non salvato per {plan['context']}: {e}")
+            for file_path, context in files:
+                file_format, _ = self.rdf_format(file_path)
+                self.record_upload(repo_id, file_path, context, file_format, self.file_digest(file_path, file_format))
+
+            success_msg = f"Sincronizzati {len(files)} graph in '{repo_id}': +{inserted} -{deleted} triple"
+            if full_reload:
+                success_msg += f", {len(full_reload)} ricaricati per intero"
+            print(f"SUCCESS: {success_msg}")
+            return {"success": True, "message": success_msg, "inserted": inserted, "deleted": deleted,
+                    "full_reload": full_reload}
 
-                    OPTIONAL {{
-                      ?answer ls:hasComponentAttribute ?answerAttr3 .
-                      ?answerAttr3 ls:componentName "scale_id" .
-                      ?answerAttr3 ls:componentValue ?answerScaleId .
-                    }}
-                  }}
-                }}
-                ORDER BY ?qid ?subOrder ?answerSortOrder
-            """
+        except Exception as e:
+            error_msg = f"Sincronizzazione fallita: {str(e)}"
+            print(f"ERRORE: {error_msg}")
+            traceback.print_exc()
+            return {"success": False, "message": error_msg}
 
-        print(f"DEBUG: Fetching complete data for question: {question_uri}")
-        results = self.execute_query(query)
-        return self._parse_complete_question_data(results)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            for lock in reversed(locks):
+                lock.release()
 
-    def _parse_complete_question_data(self, results: Dict) -> Dict[str, Any]:
-        # """Parser per organizzare tutti i dati della question"""
-        bindings = results["results"]["bindings"]
+    def _write_ntriples_lines(self, file_path, lines_file):
+        """
+        Scrive in lines_file il contenuto di file_path come N-Triples, una tripla per riga.
+        I file N-Triples sono copiati; gli altri formati sono letti con rdflib.
 
-        if not bindings:
-            print("DEBUG: No data found for question")
+        Returns:
+            True se il contenuto ha blank node
+        """
+        file_format, gzipped = self.rdf_format(file_path)
+        if file_format in GraphSnapshotStore.QUAD_FORMATS:
+            raise ValueError(f"Formato non supportato dalla sincronizzazione (solo triple): {file_path}")
+        if file_format == 'application/n-triples':
+            opener = gzip.open if gzipped else open
+            with opener(file_path, 'rb') as src, open(lines_file, 'wb') as out:
+                shutil.copyfileobj(src, out, GRAPHDB_UPLOAD_CHUNK_SIZE)
+        else:
+            graph = Graph()
+            opener = gzip.open if gzipped else open
+            with opener(file_path, 'rb') as src:
+                graph.parse(src, format=file_format)
+            graph.serialize(destination=str(lines_file), format='nt', encoding='utf-8')
+        return self._has_blank_nodes(lines_file)
+
+    @staticmethod
+    def _read_lines(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip() and not line.lstrip().startswith('#'):
+                    yield line if line.endswith('\n') else line + '\n'
+
+    @staticmethod
+    def _line_digest(line):
+        return hashlib.blake2b(line.strip().encode('utf-8'), digest_size=16).digest()
+
+    def _line_digests(self, path):
+        return {self._line_digest(line) for line in self._read_lines(path)}
+
+    @staticmethod
+    def file_digest(file_path, file_format):
+        """SHA-256 del contenuto del file e del formato con cui viene inviato"""
+        digest = hashlib.sha256(file_format.encode('utf-8') + b'\n')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(GRAPHDB_UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def graph_size(self, repo_id, context=None):
+        """Numero di statement nel named graph (None = default graph); None se GraphDB non risponde"""
+        try:
+            response = self.session.get(f"{self.base_url}/repositories/{repo_id}/size",
+                                        params={'context': f"<{context}>" if context else 'null'})
+            if response.status_code == 200:
+                return int(response.text.strip())
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ Dimensione del graph non disponibile: {e}")
+        return None
+
+    def record_upload(self, repo_id, file_path, context, file_format, content_hash):
+        """
+        Registra nel manifest il file appena caricato nel graph e ne restituisce il numero di triple.
+        I file a quad senza context possono scrivere in più graph: non sono registrati.
+        """
+        if not context and file_format in GraphSnapshotStore.QUAD_FORMATS:
             return None
+        triples = self.graph_size(repo_id, context)
+        GraphSnapshotStore.record_upload(self.base_url, repo_id, context, {
+            'sha256': content_hash,
+            'file': Path(file_path).name,
+            'format': file_format,
+            'bytes': Path(file_path).stat().st_size,
+            'triples': triples,
+            'uploaded_at': datetime.now().isoformat()
+        })
+        return triples
+
+    def begin_transaction(self, repo_id):
+        """Apre una transazione RDF4J e ne restituisce l'URL"""
+        response = self.session.post(f"{self.base_url}/repositories/{repo_id}/transactions")
+        if response.status_code != 201 or 'Location' not in response.headers:
+            raise Exception(f"Apertura transazione fallita: HTTP {response.status_code}: {response.text[:500]}")
+        return response.headers['Location']
+
+    def transaction_add(self, transaction_url, chunks, file_format, context=None, compress=False, gzipped=False):
+        """Aggiunge alla transazione i dati di un iterabile di bytes (corpo chunked)"""
+        params = {'action': 'ADD'}
+        if context:
+            params['context'] = f"<{context}>"
 
-            # Dati base dalla prima riga
-        first_row = bindings[0]
+        headers = {"Content-Type": file_format}
+        if compress and not gzipped:
+            chunks = self._gzip_chunks(chunks)
+        if compress or gzipped:
+            headers["Content-Encoding"] = "gzip"
+
+        response = self.session.put(transaction_url, params=params, data=chunks, headers=headers)
+        if response.status_code not in [200, 204]:
+            raise Exception(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    def transaction_delete(self, transaction_url, chunks, file_format, context=None):
+        """Rimuove nella transazione le triple di un iterabile di bytes RDF"""
+        params = {'action': 'DELETE'}
+        if context:
+            params['context'] = f"<{context}>"
 
-        question_data = {
-            "qid": first_row.get("qid", {}).get("value", "0"),
-            "sid": first_row.get("sid", {}).get("value", "0"),
-            "gid": first_row.get("gid", {}).get("value", "0"),
-            "type": first_row.get("type", {}).get("value", "T"),
-            "title": first_row.get("title", {}).get("value", "Q1"),
-            "questionText": first_row.get("questionText", {}).get("value", ""),
-            "script": first_row.get("script", {}).get("value", ""),
-            "parentQid": first_row.get("parentQid", {}).get("value", "0"),
-            "attributes": {},
-            "subquestions": [],
-            "answerOptions": []
+        response = self.session.put(transaction_url, params=params, data=chunks, headers={"Content-Type": file_format})
+        if response.status_code not in [200, 204]:
+            raise Exception(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    def transaction_update(self, transaction_url, update):
+        """Esegue una SPARQL UPDATE nella transazione"""
+        response = self.session.put(transaction_url, params={'action': 'UPDATE', 'update': update})
+        if response.status_code not in [200, 204]:
+            raise Exception(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    def commit_transaction(self, transaction_url):
+        response = self.session.put(transaction_url, params={'action': 'COMMIT'})
+        if response.status_code not in [200, 204]:
+            raise Exception(f"Commit fallito: HTTP {response.status_code}: {response.text[:500]}")
+
+    def rollback_transaction(self, transaction_url):
+        response = self.session.delete(transaction_url)
+        if response.status_code not in [200, 204]:
+            raise Exception(f"Rollback fallito: HTTP {response.status_code}: {response.text[:500]}")
+
+    @staticmethod
+    def rdf_format(file_path):
+        """Content-Type RDF ricavato dall'estensione (anche sotto .gz) e se il file è compresso"""
+        file_path = Path(file_path)
+        extension_map = {
+            '.ttl': 'text/turtle',
+            '.rdf': 'application/rdf+xml',
+            '.owl': 'application/rdf+xml',
+            '.nt': 'application/n-triples',
+            '.nq': 'application/n-quads',
+            '.jsonld': 'application/ld+json',
+            '.trig': 'application/trig'
         }
+        gzipped = file_path.suffix.lower() == '.gz'
+        suffix = Path(file_path.stem).suffix if gzipped else file_path.suffix
+        return extension_map.get(suffix.lower(), 'text/turtle'), gzipped
 
-        # Usa set per evitare duplicati
-        subquestions_map = {}
-        answers_map = {}
+    @staticmethod
+    def _line_ranges(file_path, batch_bytes):
+        """(offset, lunghezza) di blocchi di circa batch_bytes che terminano a fine riga"""
+        file_size = Path(file_path).stat().st_size
+        ranges = []
+        with open(file_path, 'rb') as f:
+            offset = 0
+            while offset < file_size:
+                f.seek(min(offset + batch_bytes, file_size))
+                f.readline()
+                end = min(f.tell(), file_size)
+                ranges.append((offset, end - offset))
+                offset = end
+        return ranges
+
+    def upload_data(self, repo_id, chunks, file_format, context=None, compress=False, gzipped=False):
+        """
+        Invia a /statements un corpo chunked preso da un iterabile di bytes (file, generatore...).
+        Con compress i blocchi sono compressi al volo; gzipped indica blocchi già compressi.
 
-        # Raccogli attributes, subquestions, answer options
-        for row in bindings:
-            # Attributes
-            if "attrName" in row and row["attrName"].get("value"):
-                attr_name = row["attrName"]["value"]
-                attr_value = row.get("attrValue", {}).get("value", "")
-                question_data["attributes"][attr_name] = attr_value
+        Returns:
+            La risposta HTTP di GraphDB
+        """
+        url = f"{self.base_url}/repositories/{repo_id}/statements"
+        params = {}
+        if context:
+            params['context'] = f"<{context}>"
 
-                # Subquestions
-            if "subQid" in row and row["subQid"].get("value"):
-                sub_qid = row["subQid"]["value"]
-                if sub_qid not in subquestions_map:
-                    subquestions_map[sub_qid] = {
-                        "qid": sub_qid,
-                        "title": row.get("subTitle", {}).get("value", ""),
-                        "text": row.get("subQuestionText", {}).get("value", ""),
-                        "order": row.get("subOrder", {}).get("value", "0")
-                    }
+        headers = {"Content-Type": file_format}
+        if compress and not gzipped:
+            chunks = self._gzip_chunks(chunks)
+        if compress or gzipped:
+            headers["Content-Encoding"] = "gzip"
 
-                # Answer Options
-            if "answer" in row and row["answer"].get("value"):
-                answer_uri = row["answer"]["value"]
-                if answer_uri not in answers_map:
-                    answers_map[answer_uri] = {
-                        "code": row.get("answerCode", {}).get("value", ""),
-                        "text": row.get("answerText", {}).get("value", ""),
-                        "sortOrder": row.get("answerSortOrder", {}).get("value", "0"),
-                        "assessmentValue": row.get("answerAssessmentValue", {}).get("value", "0"),
-                        "scaleId": row.get("answerScaleId", {}).get("value", "0")
-                    }
+        try:
+            return self.session.post(url, params=params, data=chunks, headers=headers)
+        finally:
+            SPARQLResultCache.invalidate(repo_id)
+            GraphSnapshotStore.invalidate(repo_id, context, all_contexts=file_format in GraphSnapshotStore.QUAD_FORMATS)
 
-            # Converti in liste
-        question_data["subquestions"] = list(subquestions_map.values())
-        question_data["answerOptions"] = list(answers_map.values())
+    @staticmethod
+    def _gzip_chunks(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: formato gzip
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
 
-        # Ordina subquestions e answers
-        question_data["subquestions"].sort(key=lambda x: int(x.get("order", "0")))
-        question_data["answerOptions"].sort(key=lambda x: int(x.get("sortOrder", "0")))
+    @staticmethod
+    def _line_batch(f, batch_bytes):
+        """Blocchi dal file f fino a circa batch_bytes, fermandosi a fine riga"""
+        sent = 0
+        while sent < batch_bytes:
+            lines = f.readlines(min(GRAPHDB_UPLOAD_CHUNK_SIZE, batch_bytes - sent))
+            if not lines:
+                return
+            chunk = b"".join(lines)
+            sent += len(chunk)
+            yield chunk
 
-        print(f"DEBUG: Parsed question data:")
-        print(f"  - QID: {question_data['qid']}")
-        print(f"  - Type: {question_data['type']}")
-        print(f"  - Subquestions: {len(question_data['subquestions'])}")
-        print(f"  - Answer options: {len(question_data['answerOptions'])}")
-        print(f"  - Attributes: {len(question_data['attributes'])}")
+    @staticmethod
+    def _has_blank_nodes(file_path):
+        # Controllo prudente: anche "_:" dentro un letterale o un IRI disattiva la divisione in più invii
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data.find(b'_:') != -1
 
-        return question_data
+    def clear_repository(self, repo_id, context=None):
+        url = f"{self.base_url}/repositories/{repo_id}/statements"
+        params = {}
+        if context:
+            params['context'] = f"<{context}>"
+        response = self.session.delete(url, params=params)
+        SPARQLResultCache.invalidate(repo_id)
+        GraphSnapshotStore.invalidate(repo_id, context, all_contexts=not context)
+        if response.status_code in [200, 204]:
+            target = f"named graph '{context}'" if context else "repository"
+            return {"success": True, "message": f"{target} svuotato"}
+        else:
+            return {"success": False, "message": f"Errore: {response.status_code}"}
+
+    def delete_by_subject(self, repo_id, subject_uri):
+        url = f"{self.base_url}/repositories/{repo_id}/statements"
+        params = {"subj": f"<{subject_uri}>"}
+        response = self.session.delete(url, params=params)
+        SPARQLResultCache.invalidate(repo_id)
+        GraphSnapshotStore.invalidate(repo_id, all_contexts=True)
+        if response.status_code in [200, 204]:
+            return {"success": True, "message": f"Dati eliminati per: {subject_uri}"}
+        else:
+            return {"success": False, "message": f"Errore: {response.status_code}"}
+
+    def stream_query(self, repo_id, query, accept):
+        """
+        Invia una query SPARQL senza leggere la risposta: il corpo va consumato
+        (iter_content / raw) e la risposta chiusa dal chiamante
+        """
+        url = f"{self.base_url}/repositories/{repo_id}"
+        return self.session.post(
+            url,
+            data=query.encode('utf-8'),
+            headers={'Content-Type': 'application/sparql-query', 'Accept': accept},
+            stream=True
+        )
+
+
+class GraphDBClient:
+
+    def __init__(self, endpoint: str, repository: str):
+        self.repository = repository
+        self.endpoint = f"{endpoint.rstrip('/')}/repositories/{repository}"
+        self.sparql = SPARQLWrapper(self.endpoint)
+        self.sparql.setReturnFormat(JSON)
+
+    def execute_query(self, query: str, use_cache: bool = True) -> Dict[str, Any]:
+        # Esegue una query SPARQL e ritorna i risultati"""
+        # Le letture passano dalla SPARQLResultCache: i risultati sono condivisi, non vanno modificati
+        try:
+            self.sparql.setQuery(query)
+            if self.sparql.isSparqlUpdateRequest():
+                try:
+                    return self.sparql.query().convert()
+                finally:
+                    SPARQLResultCache.invalidate(self.repository)
+                    GraphSnapshotStore.invalidate(self.repository, all_contexts=True)
+
+            key = (self.endpoint, self.repository, SPARQLResultCache.normalize(query),
+                   SPARQLResultCache.version(self.repository))
+            if use_cache:
+                results = SPARQLResultCache.get(key)
+                if results is not None:
+                    return results
+
+            results = self.sparql.query().convert()
+            if use_cache and isinstance(results, dict):
+                SPARQLResultCache.put(key, results)
+            return results
+        except Exception as e:
+            raise Exception(f"Errore query SPARQL: {str(e)}")
+
+        # ... [mantieni tutti i metodi esistenti] ...
+
+    def get_complete_question_data(self, question_uri: str) -> Dict[str, Any]:
+        print(f"DEBUG: Fetching complete data for question: {question_uri}")
+        return self.get_complete_questions_data([question_uri]).get(question_uri)
+
+    def get_complete_questions_data(self, question_uris: List[str],
+                                    batch_size: int = SURVEYBUILDER_PREFETCH_BATCH) -> Dict[str, Dict[str, Any]]:
+        """
+        Recupera i dati completi di più domande. Le URI sono raggruppate in blocchi di batch_size (VALUES)
+        e per ogni blocco c'è una query per ciascun aspetto (dati base, attributi, subquestion, answer option):
+        una sola query con tutti gli OPTIONAL produrrebbe il prodotto cartesiano attributi × subquestion × answer.
+
+        Returns:
+            Dizionario URI -> dati della domanda (come get_complete_question_data);
+            le domande non trovate non sono presenti
+        """
+        uris = list(dict.fromkeys(question_uris))
+        questions_data = {}
+
+        for i in range(0, len(uris), batch_size):
+            values = " ".join(f"<{uri}>" for uri in uris[i:i + batch_size])
+            facets = {
+                facet: self.execute_query(query.format(values=values))["results"]["bindings"]
+                for facet, query in self.COMPLETE_QUESTION_QUERIES.items()
+            }
+            questions_data.update(self._parse_complete_questions_data(**facets))
+
+        print(f"DEBUG: Fetched complete data for {len(questions_data)}/{len(uris)} questions")
+        return questions_data
+
+    # Query per aspetto usate da get_complete_questions_data; {values} sono le URI delle domande
+    COMPLETE_QUESTION_QUERIES = {
+        "base": """
+            PREFIX ls: <https://w3id.org/fossr/ontology/limesurvey/>
+
+            SELECT DISTINCT ?question ?qid ?sid ?gid ?type ?title ?questionText ?script ?parentQid
+            WHERE {{
+              VALUES ?question {{ {values} }}
+              ?question a ls:Question .
+              ?question ls:hasId ?idNode .
+              ?idNode ls:id ?qid .
+
+              OPTIONAL {{
+                ?question ls:hasSurveyId ?sidNode .
+                ?sidNode ls:id ?sid .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasGroup ?groupNode .
+                ?groupNode ls:hasId ?gidNode .
+                ?gidNode ls:id ?gid .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasType ?typeNode .
+                ?typeNode ls:code ?type .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasVariable ?varNode .
+                ?varNode ls:variableCod ?title .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasContent ?contentNode .
+                ?contentNode ls:text ?questionText .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasContent ?contentNode .
+                ?contentNode ls:script ?script .
+              }}
+
+              OPTIONAL {{
+                ?question ls:hasParentQuestion ?parentQuestion .
+                ?parentQuestion ls:hasId ?parentIdNode .
+                ?parentIdNode ls:id ?parentQid .
+              }}
+            }}
+            ORDER BY ?question ?qid
+        """,
+        "attributes": """
+            PREFIX ls: <https://w3id.org/fossr/ontology/limesurvey/>
+
+            SELECT DISTINCT ?question ?attrName ?attrValue
+            WHERE {{
+              VALUES ?question {{ {values} }}
+              ?question ls:hasComponentAttribute ?attr .
+              ?attr ls:componentName ?attrName .
+              ?attr ls:componentValue ?attrValue .
+            }}
+        """,
+        "subquestions": """
+            PREFIX ls: <https://w3id.org/fossr/ontology/limesurvey/>
+
+            SELECT DISTINCT ?question ?subQuestion ?subQid ?subTitle ?subQuestionText ?subOrder
+            WHERE {{
+              VALUES ?question {{ {values} }}
+              ?subQuestion ls:hasParentQuestion ?question .
+              ?subQuestion ls:hasId ?subIdNode .
+              ?subIdNode ls:id ?subQid .
+
+              OPTIONAL {{
+                ?subQuestion ls:hasVariable ?subVarNode .
+                ?subVarNode ls:variableCod ?subTitle .
+              }}
+
+              OPTIONAL {{
+                ?subQuestion ls:hasContent ?subContentNode .
+                ?subContentNode ls:text ?subQuestionText .
+              }}
+
+              OPTIONAL {{
+                ?subQuestion ls:hasComponentAttribute ?subOrderAttr .
+                ?subOrderAttr ls:componentName "question_order" .
+                ?subOrderAttr ls:componentValue ?subOrder .
+              }}
+            }}
+            ORDER BY ?question ?subOrder
+        """,
+        "answers": """
+            PREFIX ls: <https://w3id.org/fossr/ontology/limesurvey/>
+
+            SELECT DISTINCT ?question ?answer ?answerCode ?answerText ?answerSortOrder ?answerAssessmentValue ?answerScaleId
+            WHERE {{
+              VALUES ?question {{ {values} }}
+              ?question ls:hasAnswerOption ?answer .
+              ?answer a ls:AnswerOption .
+
+              OPTIONAL {{
+                ?answer ls:componentValue ?answerCode .
+              }}
+
+              OPTIONAL {{
+                ?answer ls:hasContent ?answerContentNode .
+                ?answerContentNode ls:text ?answerText .
+              }}
+
+              OPTIONAL {{
+                ?answer ls:hasComponentAttribute ?answerAttr1 .
+                ?answerAttr1 ls:componentName "sortorder" .
+                ?answerAttr1 ls:componentValue ?answerSortOrder .
+              }}
+
+              OPTIONAL {{
+                ?answer ls:hasComponentAttribute ?answerAttr2 .
+                ?answerAttr2 ls:componentName "assessment_value" .
+                ?answerAttr2 ls:componentValue ?answerAssessmentValue .
+              }}
+
+              OPTIONAL {{
+                ?answer ls:hasComponentAttribute ?answerAttr3 .
+                ?answerAttr3 ls:componentName "scale_id" .
+                ?answerAttr3 ls:componentValue ?answerScaleId .
+              }}
+            }}
+            ORDER BY ?question ?answerSortOrder
+        """,
+    }
+
+    def _parse_complete_questions_data(self, base: List[Dict], attributes: List[Dict],
+                                       subquestions: List[Dict], answers: List[Dict]) -> Dict[str, Dict[str, Any]]:
+        # """Parser: organizza i risultati delle query per aspetto in un dizionario URI -> dati della question"""
+        questions_data = {}
+        subquestions_maps = {}
+        answers_maps = {}
+
+        # Dati base dalla prima riga di ogni domanda
+        for row in base:
+            uri = row["question"]["value"]
+            if uri in questions_data:
+                continue
+            questions_data[uri] = {
+                "qid": row.get("qid", {}).get("value", "0"),
+                "sid": row.get("sid", {}).get("value", "0"),
+                "gid": row.get("gid", {}).get("value", "0"),
+                "type": row.get("type", {}).get("value", "T"),
+                "title": row.get("title", {}).get("value", "Q1"),
+                "questionText": row.get("questionText", {}).get("value", ""),
+                "script": row.get("script", {}).get("value", ""),
+                "parentQid": row.get("parentQid", {}).get("value", "0"),
+                "attributes": {},
+                "subquestions": [],
+                "answerOptions": []
+            }
+            subquestions_maps[uri] = {}
+            answers_maps[uri] = {}
+
+        # Attributes
+        for row in attributes:
+            question_data = questions_data.get(row["question"]["value"])
+            if question_data is not None and row.get("attrName", {}).get("value"):
+                question_data["attributes"][row["attrName"]["value"]] = row.get("attrValue", {}).get("value", "")
+
+        # Subquestions (senza duplicati)
+        for row in subquestions:
+            subquestions_map = subquestions_maps.get(row["question"]["value"])
+            sub_qid = row.get("subQid", {}).get("value")
+            if subquestions_map is not None and sub_qid and sub_qid not in subquestions_map:
+                subquestions_map[sub_qid] = {
+                    "qid": sub_qid,
+                    "title": row.get("subTitle", {}).get("value", ""),
+                    "text": row.get("subQuestionText", {}).get("value", ""),
+                    "order": row.get("subOrder", {}).get("value", "0")
+                }
+
+        # Answer Options (senza duplicati)
+        for row in answers:
+            answers_map = answers_maps.get(row["question"]["value"])
+            answer_uri = row["answer"]["value"]
+            if answers_map is not None and answer_uri not in answers_map:
+                answers_map[answer_uri] = {
+                    "code": row.get("answerCode", {}).get("value", ""),
+                    "text": row.get("answerText", {}).get("value", ""),
+                    "sortOrder": row.get("answerSortOrder", {}).get("value", "0"),
+                    "assessmentValue": row.get("answerAssessmentValue", {}).get("value", "0"),
+                    "scaleId": row.get("answerScaleId", {}).get("value", "0")
+                }
+
+        # Converti in liste ordinate
+        for uri, question_data in questions_data.items():
+            question_data["subquestions"] = sorted(subquestions_maps[uri].values(), key=lambda x: int(x.get("order", "0")))
+            question_data["answerOptions"] = sorted(answers_maps[uri].values(), key=lambda x: int(x.get("sortOrder", "0")))
+
+        return questions_data
 
     def get_all_groups(self) -> List[Dict[str, Any]]:
         """Recupera tutti i gruppi con le loro domande (solo main questions)"""
@@ -3006,7 +4305,8 @@ def upload_ontology():
         result = graphdb.upload_file(
             data['repo_id'],
             data['ontology_file'],
-            data.get('context', 'http://www.w3.org/2002/07/owl#ontology')
+            data.get('context', 'http://www.w3.org/2002/07/owl#ontology'),
+            force=bool(data.get('force', False))
         )
 
         print(f"Risultato: {result}\n======================")
@@ -3018,6 +4318,240 @@ def upload_ontology():
         return jsonify({'success': False, 'error': str(e)})
 
 
+# Mapping RML da applicare per ogni tipo di dato, nell'ordine di conversione
+CONVERSION_RML_FILES = {
+    'group': ["RMLGroup2.ttl"],
+    'question': ["RMLQuestion.ttl"],
+    'question_properties': ["2_subquestions.ttl", "1_questions.ttl", "3_answeroptions.ttl", "4_attributes.ttl"],
+}
+
+# Tipi di dato i cui mapping leggono file indipendenti (split_limesurvey_json) e possono girare in parallelo
+CONVERSION_CONCURRENT_TYPES = {'question_properties'}
+
+# Logical source in memoria lette da ogni mapping RML
+CONVERSION_SOURCES = {
+    '1_questions.ttl': LIMESURVEY_SPLIT_SOURCES['questions'],
+    '2_subquestions.ttl': LIMESURVEY_SPLIT_SOURCES['subquestions'],
+    '3_answeroptions.ttl': LIMESURVEY_SPLIT_SOURCES['answeroptions'],
+    '4_attributes.ttl': LIMESURVEY_SPLIT_SOURCES['attributes'],
+}
+
+
+def prepare_csv_conversion(csv_path: str, data_type: str) -> tuple:
+    """
+    Prepara il file di input (pulizia CSV, rinomina colonne o split del JSON)
+    e restituisce i file RML da convertire e le logical source in memoria
+    (nome -> record, vuoto se i mapping leggono solo file).
+
+    Raises:
+        ValueError: tipo di dato non supportato.
+        FileNotFoundError: file di input o file RML mancante.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f'File CSV non trovato: {csv_path}')
+
+    if data_type not in CONVERSION_RML_FILES:
+        raise ValueError(f'Tipo non supportato: {data_type}')
+
+    sources = {}
+    if data_type == "group":
+        pulisciCSV(csv_path)
+    elif data_type == "question":
+        cambiaNomeCSV(csv_path)
+    elif data_type == "question_properties":
+        # è un json: le 4 parti passano ai mapping in memoria, senza file intermedi
+        sources = split_limesurvey_json(csv_path, write_files=False)
+
+    rml_files = CONVERSION_RML_FILES[data_type]
+    if not os.path.exists(rml_files[0]):
+        raise FileNotFoundError(f'File RML non trovato: {rml_files[0]}')
+
+    return rml_files, sources
+
+
+def run_rml_conversions(rml_files: List[str], on_start=None, on_done=None, concurrent: bool = False,
+                        sources: Optional[Dict[str, Any]] = None, graphdb: Optional[Dict[str, Any]] = None) -> dict:
+    """
+    Converte i file RML, ognuno in <nome>_output.ttl, oppure direttamente in GraphDB se graphdb è indicato.
+
+    Args:
+        rml_files: File RML da convertire.
+        on_start: Callback (rml_file) chiamata all'inizio di ogni conversione.
+        on_done: Callback (rml_file, result, elapsed) chiamata alla fine di ogni conversione.
+        concurrent: Se True i file sono convertiti in parallelo dai worker RML,
+            quindi il tempo totale è circa quello del mapping più lento.
+        sources: Logical source in memoria; ogni mapping riceve quella indicata in CONVERSION_SOURCES.
+        graphdb: {'url', 'repo_id', 'contexts': {rml_file: named graph}}; le triple non passano da file.
+
+    Returns:
+        Dict con 'output_paths', 'triples', 'elapsed' e 'files' (triple e secondi per file),
+        nell'ordine di rml_files. Con graphdb 'output_paths' sono i named graph.
+    """
+    rml_converter = RMLConverter(False)
+
+    def convert(i):
+        output_file = Path(i).stem + "_output.ttl"
+        if on_start:
+            on_start(i)
+        source = CONVERSION_SOURCES.get(i)
+        file_sources = {source: sources[source]} if sources and source in sources else None
+        start = time.time()
+        if graphdb:
+            output_file = graphdb['contexts'].get(i)
+            result = rml_converter.convert_rml_file_to_graphdb(i, graphdb['url'], graphdb['repo_id'], output_file,
+                                                               sources=file_sources)
+        else:
+            result = rml_converter.convert_rml_file_to_file(i, output_file, sources=file_sources)
+        elapsed = round(time.time() - start, 3)
+        if on_done:
+            on_done(i, result, elapsed)
+        return {'rml_file': i, 'output': output_file, 'triples': result['triples'], 'elapsed': elapsed}
+
+    start = time.time()
+    if concurrent and len(rml_files) > 1:
+        with ThreadPoolExecutor(max_workers=len(rml_files), thread_name_prefix='rml-file') as executor:
+            futures = [executor.submit(convert, i) for i in rml_files]
+            # Si attendono tutti i file prima di propagare l'eventuale primo errore
+            errors = [future.exception() for future in futures]
+            for error in errors:
+                if error is not None:
+                    raise error
+            files = [future.result() for future in futures]
+    else:
+        files = [convert(i) for i in rml_files]
+
+    return {
+        'output_paths': [f.pop('output') for f in files],
+        'triples': sum(f['triples'] for f in files),
+        'elapsed': round(time.time() - start, 3),
+        'files': files
+    }
+
+
+class ConversionJobManager:
+    """
+    Coda di job di conversione CSV -> RDF eseguiti in background da un pool di thread
+    di dimensione limitata. Ogni job ha un id e riporta lo stato di avanzamento di ogni file RML
+    (triple prodotte e tempo trascorso). I job dello stesso tipo di dato sono eseguiti uno alla volta,
+    perché scrivono gli stessi file intermedi e di output.
+    """
+
+    def __init__(self, max_workers: int = CONVERSION_JOB_WORKERS, history: int = CONVERSION_JOB_HISTORY):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conversion-job')
+        self._history = history
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._type_locks: Dict[str, threading.Lock] = {}
+
+    def submit(self, csv_path: str, data_type: str) -> str:
+        """Accoda una conversione e restituisce l'id del job."""
+        if data_type not in CONVERSION_RML_FILES:
+            raise ValueError(f'Tipo non supportato: {data_type}')
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'csv_path': csv_path,
+            'data_type': data_type,
+            'status': 'queued',
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'triples': 0,
+            'output_paths': [],
+            'files': [{'rml_file': rml_file, 'status': 'pending', 'triples': 0, 'started': None, 'elapsed': None}
+                      for rml_file in CONVERSION_RML_FILES[data_type]],
+            'error': None,
+        }
+
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def type_lock(self, data_type: str) -> threading.Lock:
+        """Lock delle conversioni di un tipo di dato, condiviso anche dalle conversioni sincrone."""
+        with self._lock:
+            return self._type_locks.setdefault(data_type, threading.Lock())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Restituisce una copia dello stato del job, con i tempi trascorsi aggiornati."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [self._snapshot(job) for job in self._jobs.values()]
+
+    def _snapshot(self, job: dict) -> dict:
+        now = time.time()
+        snapshot = dict(job)
+        snapshot['files'] = [dict(f) for f in job['files']]
+        if job['started']:
+            snapshot['elapsed'] = round((job['finished'] or now) - job['started'], 3)
+        for f in snapshot['files']:
+            if f['status'] == 'running':
+                f['elapsed'] = round(now - f['started'], 3)
+            del f['started']
+        return snapshot
+
+    def _prune(self):
+        """Elimina i job conclusi più vecchi oltre il limite della cronologia."""
+        finished = [job for job in self._jobs.values() if job['status'] in ('completed', 'failed')]
+        for job in sorted(finished, key=lambda j: j['created'])[:max(0, len(self._jobs) - self._history)]:
+            del self._jobs[job['job_id']]
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _update_file(self, job_id: str, rml_file: str, **fields):
+        with self._lock:
+            for f in self._jobs[job_id]['files']:
+                if f['rml_file'] == rml_file:
+                    f.update(fields)
+
+    def _on_done(self, job_id: str, rml_file: str, result: dict, elapsed: float):
+        self._update_file(job_id, rml_file, status='completed', triples=result['triples'], elapsed=elapsed)
+        with self._lock:
+            self._jobs[job_id]['triples'] += result['triples']
+
+    def _run(self, job_id: str):
+        job = self.get(job_id)
+
+        with self.type_lock(job['data_type']):
+            self._update(job_id, status='running', started=time.time())
+            print(f"\n=== JOB CONVERSIONE {job_id} ({job['data_type']}) ===")
+
+            try:
+                rml_files, sources = prepare_csv_conversion(job['csv_path'], job['data_type'])
+                result = run_rml_conversions(
+                    rml_files,
+                    on_start=lambda rml_file: self._update_file(job_id, rml_file, status='running', started=time.time()),
+                    on_done=lambda rml_file, res, elapsed: self._on_done(job_id, rml_file, res, elapsed),
+                    concurrent=job['data_type'] in CONVERSION_CONCURRENT_TYPES,
+                    sources=sources
+                )
+                self._update(job_id, status='completed', finished=time.time(), output_paths=result['output_paths'])
+                print(f"✅ Job {job_id} OK: {result['output_paths']}")
+
+            except Exception as e:
+                print(f"❌ Job {job_id} ERRORE: {e}")
+                traceback.print_exc()
+                with self._lock:
+                    for f in self._jobs[job_id]['files']:
+                        if f['status'] == 'running':
+                            f['status'] = 'failed'
+                            f['elapsed'] = round(time.time() - f['started'], 3)
+                self._update(job_id, status='failed', finished=time.time(), error=str(e))
+
+
+conversion_jobs = ConversionJobManager()
+
+
 @app.route('/api/convert/csv-to-rdf', methods=['POST'])
 def convert_csv_to_rdf():
     try:
@@ -3028,36 +4562,18 @@ def convert_csv_to_rdf():
         print(f"\n=== CONVERSIONE CSV -> RDF ===")
         print(f"CSV: {csv_path}, Tipo: {data_type}")
 
-        if not os.path.exists(csv_path):
-            return jsonify({'success': False, 'error': f'File CSV non trovato: {csv_path}'})
-
-        rml_converter = RMLConverter(False)
-        rml_file = []
-
-        if data_type == "group":
-            rml_file = ["RMLGroup2.ttl"]
-            pulisciCSV(csv_path)
-        elif data_type == "question":
-            rml_file = ["RMLQuestion.ttl"]
-            cambiaNomeCSV(csv_path)
-        elif data_type == "question_properties":
-            rml_file = ["2_subquestions.ttl", "1_questions.ttl", "3_answeroptions.ttl", "4_attributes.ttl"]
-            split_limesurvey_json(csv_path)  # è un json
-        else:
-            return jsonify({'success': False, 'error': f'Tipo non supportato: {data_type}'})
+        with conversion_jobs.type_lock(data_type):
+            try:
+                rml_file, sources = prepare_csv_conversion(csv_path, data_type)
+            except (ValueError, FileNotFoundError) as e:
+                return jsonify({'success': False, 'error': str(e)})
 
-        if not os.path.exists(rml_file[0]):
-            return jsonify({'success': False, 'error': f'File RML non trovato: {rml_file[0]}'})
-        rml_output_file = []
-        k = 0
-        for i in rml_file:
-            rml_converter.convert_rml_file(i)
-            rml_output_file.append(Path(i).stem + "_output.ttl")
-            rml_converter.save_to_file(rml_output_file[k])
-            k = k + 1
+            result = run_rml_conversions(rml_file, concurrent=data_type in CONVERSION_CONCURRENT_TYPES,
+                                         sources=sources)
 
-        print(f"✅ Conversione OK: {rml_output_file}\n===================")
-        return jsonify({'success': True, 'message': 'CSV convertito in RDF', 'output_paths': rml_output_file})
+        print(f"✅ Conversione OK: {result['output_paths']}\n===================")
+        return jsonify({'success': True, 'message': 'CSV convertito in RDF', 'output_paths': result['output_paths'],
+                        'triples': result['triples'], 'elapsed': result['elapsed'], 'files': result['files']})
 
     except Exception as e:
         print(f"ERRORE: {e}")
@@ -3066,6 +4582,100 @@ def convert_csv_to_rdf():
         return jsonify({'success': False, 'error': str(e)})
 
 
+# Named graph dei dati caricati per tipo di conversione (come in /api/graphdb/upload/data)
+CONVERSION_GRAPHDB_CONTEXTS = {
+    'group': 'groups',
+    'question': 'questions',
+    'question_properties': 'properties',
+}
+
+
+def conversion_graphdb_contexts(data_type: str, survey_id: str, context: Optional[str] = None) -> Dict[str, str]:
+    """
+    Named graph di ogni file RML di una conversione. I file di question_properties
+    vanno in <context>/<nome>_output, come nell'upload dei file convertiti.
+    """
+    base_context = context or f"http://example.org/survey/{survey_id}/{CONVERSION_GRAPHDB_CONTEXTS[data_type]}"
+    rml_files = CONVERSION_RML_FILES[data_type]
+    if data_type == 'question_properties':
+        return {rml_file: f"{base_context}/{Path(rml_file).stem}_output" for rml_file in rml_files}
+    return {rml_file: base_context for rml_file in rml_files}
+
+
+@app.route('/api/convert/csv-to-graphdb', methods=['POST'])
+def convert_csv_to_graphdb():
+    """Converte un CSV/JSON con i mapping RML e carica le triple in GraphDB in un solo passo, senza file .ttl"""
+    try:
+        data = request.json
+        csv_path = data['csv_path']
+        data_type = data.get('data_type', 'generic')
+        repo_id = data['repo_id']
+        graphdb_url = data.get('graphdb_url', 'http://localhost:7200')
+        survey_id = clean_uri_path(data.get("survey_id", ""))
+
+        print(f"\n=== CONVERSIONE CSV -> GRAPHDB ===")
+        print(f"CSV: {csv_path}, Tipo: {data_type}, Repository: {repo_id}")
+
+        with conversion_jobs.type_lock(data_type):
+            try:
+                rml_file, sources = prepare_csv_conversion(csv_path, data_type)
+            except (ValueError, FileNotFoundError) as e:
+                return jsonify({'success': False, 'error': str(e)})
+
+            graphdb = {
+                'url': graphdb_url,
+                'repo_id': repo_id,
+                'contexts': conversion_graphdb_contexts(data_type, survey_id, data.get('context')),
+            }
+            result = run_rml_conversions(rml_file, concurrent=data_type in CONVERSION_CONCURRENT_TYPES,
+                                         sources=sources, graphdb=graphdb)
+
+        print(f"✅ Conversione e upload OK: {result['triples']} triple\n===================")
+        return jsonify({'success': True, 'message': f"Dati caricati in '{repo_id}'", 'contexts': result['output_paths'],
+                        'triples': result['triples'], 'elapsed': result['elapsed'], 'files': result['files']})
+
+    except Exception as e:
+        print(f"ERRORE: {e}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/convert/jobs', methods=['POST'])
+def submit_conversion_job():
+    """Accoda una conversione CSV -> RDF; lo stato si legge da /api/convert/jobs/<job_id>."""
+    try:
+        data = request.json
+        csv_path = data['csv_path']
+        data_type = data.get('data_type', 'generic')
+
+        if not os.path.exists(csv_path):
+            return jsonify({'success': False, 'error': f'File CSV non trovato: {csv_path}'})
+
+        job_id = conversion_jobs.submit(csv_path, data_type)
+        print(f"📥 Job di conversione accodato: {job_id} ({data_type})")
+        return jsonify({'success': True, 'job_id': job_id, 'status_url': f'/api/convert/jobs/{job_id}'}), 202
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    except Exception as e:
+        print(f"ERRORE: {e}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/convert/jobs', methods=['GET'])
+def list_conversion_jobs():
+    return jsonify({'success': True, 'jobs': conversion_jobs.list()})
+
+
+@app.route('/api/convert/jobs/<job_id>', methods=['GET'])
+def get_conversion_job(job_id):
+    job = conversion_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Job non trovato: {job_id}'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
 @app.route('/api/upload/file', methods=['POST'])
 def upload_file_to_server():
     try:
@@ -3124,6 +4734,11 @@ def upload_survey_data():
         file_path = data.get('file_path')
         file_paths = data.get('file_paths')
 
+        # sync: invia solo le differenze rispetto all'ultimo caricamento (GraphDBManager.sync_files)
+        sync = bool(data.get('sync', False))
+        # force: reinvia anche i file identici all'ultimo caricamento nello stesso graph
+        force = bool(data.get('force', False))
+
         # ============================================
         # CASO 1: SINGOLO FILE (backward compatibility)
         # ============================================
@@ -3145,11 +4760,15 @@ def upload_survey_data():
                 })
 
             # Upload single file
-            result = graphdb.upload_file(
-                data['repo_id'],
-                file_path,
-                base_context
-            )
+            if sync:
+                result = graphdb.sync_files(data['repo_id'], [(file_path, base_context)])
+            else:
+                result = graphdb.upload_file(
+                    data['repo_id'],
+                    file_path,
+                    base_context,
+                    force=force
+                )
 
             print(f"✅ Single file uploaded: {result}")
             return jsonify(result)
@@ -3164,6 +4783,7 @@ def upload_survey_data():
 
             results = []
             failed = []
+            to_upload = []
             for fp in file_paths:
                 print(f"\n📄 [ Processing: {fp}")
 
@@ -3187,39 +4807,34 @@ def upload_survey_data():
                 context_uri = f"{base_context}/{file_name}"
 
                 print(f"Context URI: {context_uri}")
+                to_upload.append((fp, context_uri))
 
-                try:
-                    # Upload file
-                    result = graphdb.upload_file(
-                        data['repo_id'],
-                        fp,
-                        context_uri
-                    )
+            # Tutti i file validi in una sola transazione: o sono caricati tutti o nessuno
+            if to_upload:
+                if sync:
+                    result = graphdb.sync_files(data['repo_id'], to_upload)
+                else:
+                    result = graphdb.bulk_upload(data['repo_id'], to_upload, force=force)
 
-                    if result.get('success'):
-                        print(f"✅ Uploaded successfully")
+                if result.get('success'):
+                    print(f"✅ Uploaded successfully")
+                    for fp, context_uri in to_upload:
                         results.append({
                             'file': fp,
                             'success': True,
-                            'triples': result.get('triples', 0),
+                            'triples': result.get('triples', {}).get(fp) or 0,
+                            'skipped': fp in result.get('skipped', []),
                             'context': context_uri
                         })
-                    else:
-                        error_msg = result.get('error', 'Unknown error')
-                        print(f"❌ Upload failed: {error_msg}")
+                else:
+                    error_msg = result.get('message', 'Unknown error')
+                    print(f"❌ Upload failed: {error_msg}")
+                    for fp, _ in to_upload:
                         failed.append({
                             'file': fp,
                             'error': error_msg
                         })
 
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ Exception: {error_msg}")
-                    failed.append({
-                        'file': fp,
-                        'error': error_msg
-                    })
-
             # Summary
             print(f"\n=== UPLOAD SUMMARY ===")
             print(f"Total files: {len(file_paths)}")
@@ -3303,6 +4918,129 @@ def delete_group_data():
         return jsonify({'success': False, 'error': str(e)})
 
 
+# Formati delle risposte in streaming delle query SPARQL -> formato richiesto a GraphDB
+SPARQL_STREAM_FORMATS = {
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+    'ndjson': 'text/csv',  # convertito riga per riga
+}
+
+_SPARQL_PROLOGUE = re.compile(r'(?:\s+|#[^\n]*|PREFIX\s+[^\s:]*:\s*<[^>]*>|BASE\s*<[^>]*>)*', re.IGNORECASE)
+
+
+def read_sparql_pagination(data: Dict) -> tuple:
+    """
+    Legge limit/offset dalla richiesta. Senza limit la query non viene paginata.
+
+    Returns:
+        (limit o None, offset)
+
+    Raises:
+        ValueError: Se i valori non sono validi
+    """
+    limit = data.get('limit')
+    offset = data.get('offset', 0) or 0
+    try:
+        limit = int(limit) if limit not in (None, '') else None
+        offset = int(offset)
+    except (TypeError, ValueError):
+        raise ValueError("limit e offset devono essere numeri interi")
+
+    if limit is not None and not 1 <= limit <= SPARQL_MAX_PAGE_SIZE:
+        raise ValueError(f"limit deve essere compreso tra 1 e {SPARQL_MAX_PAGE_SIZE}")
+    if offset < 0:
+        raise ValueError("offset non può essere negativo")
+    return limit, offset
+
+
+def paginate_sparql_query(query: str, limit: int, offset: int = 0) -> str:
+    """
+    Applica LIMIT/OFFSET ai modificatori della query SELECT stessa, dopo il suo ORDER BY:
+    FROM/FROM NAMED restano al loro posto e le pagine seguono l'ordinamento della query
+    (per pagine stabili la query deve avere un ORDER BY). Un LIMIT/OFFSET già presente
+    delimita i risultati da paginare: la pagina è presa all'interno di quella finestra.
+
+    Raises:
+        ValueError: Se la query non è una SELECT
+    """
+    prologue = _SPARQL_PROLOGUE.match(query).group(0)
+    body = query[len(prologue):].strip()
+    if not re.match(r'SELECT\b', body, re.IGNORECASE):
+        raise ValueError("La paginazione è disponibile solo per query SELECT")
+
+    # VALUES finale (dati inline della query): va dopo i modificatori
+    values = re.search(r'\bVALUES\b[^{}]*\{[^{}]*\}\s*$', body, re.IGNORECASE)
+    values_clause = values.group(0).strip() if values and '}' in body[:values.start()] else ''
+    if values_clause:
+        body = body[:values.start()].rstrip()
+
+    # i modificatori della query esterna seguono l'ultima graffa del WHERE
+    head, tail = body[:body.rindex('}') + 1], body[body.rindex('}') + 1:]
+    if '"' not in tail and "'" not in tail:
+        tail = re.sub(r'#[^\n]*', '', tail)
+
+    original_limit = None
+    original_offset = 0
+    modifiers = re.search(r'(?:\s*\b(?:LIMIT|OFFSET)\s+\d+)+\s*$', tail, re.IGNORECASE)
+    if modifiers:
+        for keyword, value in re.findall(r'(LIMIT|OFFSET)\s+(\d+)', modifiers.group(0), re.IGNORECASE):
+            if keyword.upper() == 'LIMIT':
+                original_limit = int(value)
+            else:
+                original_offset = int(value)
+        tail = tail[:modifiers.start()]
+
+    if original_limit is not None:
+        limit = max(0, min(limit, original_limit - offset))
+    offset += original_offset
+
+    paginated = f"{head}{tail.rstrip()}\nLIMIT {limit} OFFSET {offset}"
+    if values_clause:
+        paginated += f"\n{values_clause}"
+    return f"{prologue.strip()}\n{paginated}".strip()
+
+
+def stream_sparql_results(response: requests.Response, output_format: str) -> Response:
+    """
+    Inoltra al client i risultati di GraphDB (GraphDBManager.stream_query) a blocchi, senza caricarli in memoria.
+    csv/tsv sono passati così come arrivano; ndjson è ricavato dal CSV, un oggetto JSON per riga.
+    """
+    if output_format == 'ndjson':
+        def generate():
+            try:
+                response.raw.decode_content = True
+                reader = csv.reader(io.TextIOWrapper(response.raw, encoding='utf-8', newline=''))
+                header = next(reader, None)
+                if header is None:
+                    return
+                buffer = []
+                size = 0
+                for row in reader:
+                    line = json.dumps(dict(zip(header, row)), ensure_ascii=False) + "\n"
+                    buffer.append(line)
+                    size += len(line)
+                    if size >= SPARQL_STREAM_CHUNK_SIZE:
+                        yield "".join(buffer)
+                        buffer = []
+                        size = 0
+                if buffer:
+                    yield "".join(buffer)
+            finally:
+                response.close()
+
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            try:
+                yield from response.iter_content(chunk_size=SPARQL_STREAM_CHUNK_SIZE)
+            finally:
+                response.close()
+
+        mimetype = SPARQL_STREAM_FORMATS[output_format]
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
 @app.route('/api/graphdb/query', methods=['POST'])
 def graphdb_query():
     """Esegue una query SPARQL su GraphDB"""
@@ -3314,8 +5052,30 @@ def graphdb_query():
         graphdb_url = data.get('graphdb_url', 'http://localhost:7200')
         repo_id = data['repo_id']
         query = data['query']
+        output_format = data.get('format', 'json')
+
+        # Paginazione opzionale (limit/offset) e formati in streaming (csv, tsv, ndjson)
+        if output_format != 'json' and output_format not in SPARQL_STREAM_FORMATS:
+            return jsonify({'success': False, 'error': f'Formato non supportato: {output_format}'})
+        try:
+            limit, offset = read_sparql_pagination(data)
+            if limit is not None:
+                # in JSON una riga in più dice se c'è una pagina successiva
+                query = paginate_sparql_query(query, limit if output_format != 'json' else limit + 1, offset)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
 
         graphdb = GraphDBManager(graphdb_url)
+
+        if output_format != 'json':
+            response = graphdb.stream_query(repo_id, query, SPARQL_STREAM_FORMATS[output_format])
+            print(f"Response status: {response.status_code}")
+            if response.status_code != 200:
+                error_text = response.text
+                response.close()
+                return jsonify({'success': False, 'error': f'HTTP {response.status_code}: {error_text}'})
+            return stream_sparql_results(response, output_format)
+
         url = f"{graphdb.base_url}/repositories/{repo_id}"
 
         response = graphdb.session.post(
@@ -3332,7 +5092,12 @@ def graphdb_query():
         if response.status_code == 200:
             result_data = response.json()
             print(f"Results: {len(result_data.get('results', {}).get('bindings', []))} bindings")
-            return jsonify({'success': True, 'data': result_data})
+            result = {'success': True, 'data': result_data}
+            if limit is not None and 'results' in result_data:
+                bindings = result_data['results'].get('bindings', [])
+                result.update({'limit': limit, 'offset': offset, 'hasMore': len(bindings) > limit})
+                result_data['results']['bindings'] = bindings[:limit]
+            return jsonify(result)
         else:
             print(f"Error: {response.text}")
             return jsonify({'success': False, 'error': f'HTTP {response.status_code}: {response.text}'})
@@ -3491,11 +5256,37 @@ def execute_surveybuilder_sparql_query():
                 "message": "Query SPARQL vuota"
             }), 400
 
+        # Paginazione opzionale (limit/offset) e formati in streaming (csv, tsv, ndjson)
+        output_format = data.get('format', 'json')
+        if output_format != 'json' and output_format not in SPARQL_STREAM_FORMATS:
+            return jsonify({
+                "status": "error",
+                "message": f"Formato non supportato: {output_format}"
+            }), 400
+        try:
+            limit, offset = read_sparql_pagination(data)
+            if limit is not None:
+                # in JSON una riga in più dice se c'è una pagina successiva
+                query = paginate_sparql_query(query, limit if output_format != 'json' else limit + 1, offset)
+        except ValueError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 400
+
         print(f"\n{'=' * 70}")
         print(f"Executing custom SPARQL query:")
         print(query)
         print(f"{'=' * 70}\n")
 
+        if output_format != 'json':
+            response = GraphDBManager(GRAPHDB_URL).stream_query(REPOSITORY, query, SPARQL_STREAM_FORMATS[output_format])
+            if response.status_code != 200:
+                error_text = response.text
+                response.close()
+                raise Exception(f"Errore query SPARQL: HTTP {response.status_code}: {error_text}")
+            return stream_sparql_results(response, output_format)
+
         client = GraphDBClient(GRAPHDB_URL, REPOSITORY)
         results = client.execute_query(query)
 
@@ -3519,12 +5310,18 @@ def execute_surveybuilder_sparql_query():
         print(f"✓ Query executed successfully")
         print(f"✓ Found {len(formatted_results)} results")
 
-        return jsonify({
+        response_data = {
             "status": "success",
             "columns": columns,
             "results": formatted_results,
             "count": len(formatted_results)
-        })
+        }
+        if limit is not None:
+            response_data.update({"limit": limit, "offset": offset, "hasMore": len(formatted_results) > limit})
+            response_data["results"] = formatted_results[:limit]
+            response_data["count"] = len(response_data["results"])
+
+        return jsonify(response_data)
 
     except Exception as e:
         print(f"✗ Query error: {e}")
@@ -3665,11 +5462,9 @@ def create_surveybuilder_limesurvey():
         survey_id = ls_client.create_survey(survey_title)
         print(f"✓ Survey created with ID: {survey_id}")
 
-        imported_questions_count = 0
-        failed_questions = []
-
-        # Step 2: Crea gruppi e importa domande
-        print(f"\nStep 2: Creating groups and importing questions...")
+        # Step 2: Crea i gruppi (in sequenza: servono i group_id per le domande)
+        print(f"\nStep 2: Creating groups...")
+        group_tasks = []
 
         for group_idx, group in enumerate(groups):
             group_name = group.get('name', f'Group {group_idx + 1}')
@@ -3679,7 +5474,6 @@ def create_surveybuilder_limesurvey():
             print(f"\n  [{group_idx + 1}/{len(groups)}] Creating group: {group_name}")
 
             try:
-                # Crea gruppo
                 group_id = ls_client.add_group(
                     survey_id,
                     group_name,
@@ -3687,138 +5481,109 @@ def create_surveybuilder_limesurvey():
                     group_order
                 )
                 print(f"  ✓ Group created with ID: {group_id}")
+            except Exception as e:
+                print(f"  ✗ Failed to create group: {e}")
+                traceback.print_exc()
+                continue
 
-                # Trova domande di questo gruppo
-                group_questions = [q for q in questions if q.get('groupUri') == group['uri']]
+            # Trova domande di questo gruppo
+            group_questions = [q for q in questions if q.get('groupUri') == group['uri']]
+            if not group_questions:
+                print(f"  ⚠ No questions for this group")
+                continue
 
-                if not group_questions:
-                    print(f"  ⚠ No questions for this group")
-                    continue
+            group_tasks.append((group_id, group_questions))
 
-                print(f"  📊 Importing {len(group_questions)} questions...")
-
-                # Importa ogni domanda
-                for q_idx, question in enumerate(group_questions):
-                    question_uri = question.get('uri')
-                    question_id = question.get('id', 'N/A')
-                    question_title = question.get('variableCod', f"Q{q_idx + 1}")
-                    question_type = question.get('questionType', 'Unknown')
-
-                    print(f"\n    [{q_idx + 1}/{len(group_questions)}] Processing Question:")
-                    print(f"      ID: {question_id}")
-                    print(f"      Title: {question_title}")
-                    print(f"      Type: {question_type}")
-                    print(f"      URI: {question_uri}")
-
-                    # ✅ DEBUG: Mostra dati question dal frontend
-                    print(f"      Frontend data:")
-                    print(f"        - Has text: {bool(question.get('text'))}")
-                    print(f"        - Text preview: {question.get('text', '')[:50]}...")
-                    print(f"        - Has subquestions: {'subquestions' in question}")
-                    print(f"        - Has answerOptions: {'answerOptions' in question}")
-                    if 'subquestions' in question:
-                        subs = question.get('subquestions', [])
-                        print(f"        - Subquestions count from frontend: {len(subs)}")
-                        if subs:
-                            print(f"        - First subquestion: {subs[0]}")
-                    if 'answerOptions' in question:
-                        ans = question.get('answerOptions', [])
-                        print(f"        - AnswerOptions count from frontend: {len(ans)}")
-                        if ans:
-                            print(f"        - First answer: {ans[0]}")
+        # Step 3: Dati completi di tutte le domande dal GraphDB con poche query VALUES
+        all_questions = [question for _, group_questions in group_tasks for question in group_questions]
+        print(f"\nStep 3: Fetching complete data of {len(all_questions)} questions from GraphDB...")
 
-                    try:
-                        # Ottieni dati completi dal GraphDB
-                        print(f"      Fetching complete data from GraphDB...")
-                        complete_data = graphdb_client.get_complete_question_data(question_uri)
-
-                        # ✅ DEBUG: Verifica dati da GraphDB
-                        if not complete_data:
-                            print(f"      ✗ ERROR: get_complete_question_data returned None/empty")
-                            failed_questions.append(f"{question_title} (ID:{question_id}): No data from GraphDB")
-                            continue
+        prefetch_error = None
+        questions_data = {}
+        try:
+            questions_data = graphdb_client.get_complete_questions_data([q.get('uri') for q in all_questions])
+        except Exception as e:
+            print(f"  ✗ GraphDB prefetch failed: {e}")
+            prefetch_error = e
+
+        # Step 4: Pipeline: i .lsq sono generati nel pool di processi mentre gli import procedono.
+        # Le domande di un gruppo sono importate in ordine (LimeSurvey le accoda nel gruppo),
+        # gruppi diversi in parallelo fino a SURVEYBUILDER_IMPORT_CONCURRENCY.
+        print(f"\nStep 4: Generating .lsq files and importing questions...")
+
+        def question_label(question: Dict, q_idx: int) -> str:
+            question_title = question.get('variableCod', f"Q{q_idx + 1}")
+            question_id = question.get('id', 'N/A')
+            return f"{question_title} (ID:{question_id})"
+
+        # Per ogni gruppo: lista di (domanda, dati, future XML) oppure (domanda, errore)
+        pipelines = []
+        for group_id, group_questions in group_tasks:
+            pipeline = []
+            for q_idx, question in enumerate(group_questions):
+                label = question_label(question, q_idx)
+                if prefetch_error is not None:
+                    pipeline.append((label, None, None, str(prefetch_error)))
+                    continue
 
-                        print(f"      ✓ GraphDB data retrieved:")
-                        print(f"        - QID: {complete_data.get('qid', 'N/A')}")
-                        print(f"        - Type: {complete_data.get('type', 'N/A')}")
-                        print(f"        - Title: {complete_data.get('title', 'N/A')}")
-                        print(f"        - Text: {complete_data.get('questionText', 'N/A')[:50]}...")
-                        print(f"        - Subquestions: {len(complete_data.get('subquestions', {}))}")
-                        print(f"        - AnswerOptions: {len(complete_data.get('answerOptions', {}))}")
-                        print(f"        - Attributes: {len(complete_data.get('attributes', {}))}")
-
-                        # ✅ DEBUG: Mostra subquestions dettaglio
-                        if complete_data.get('subquestions'):
-                            print(f"        - Subquestions detail:")
-                            if complete_data.get('subquestions'):
-                                for idx, sub_data in enumerate(complete_data['subquestions'][:3]):
-                                    print(f"          - {idx}: {sub_data.get('title', 'N/A')}")
-
-                        # ✅ DEBUG: Mostra answer options dettaglio
-                        if complete_data.get('answerOptions'):
-                            print(f"        - AnswerOptions detail:")
-                            if complete_data.get('answerOptions'):
-                                for ans_data in complete_data['answerOptions'][:3]:
-                                    print(
-                                        f"          - [{ans_data.get('code', 'N/A')}]: {ans_data.get('text', 'N/A')[:30]}...")
-                        # Aggiorna IDs per la nuova survey
-                        complete_data['sid'] = str(survey_id)
-                        complete_data['gid'] = str(group_id)
-
-                        # Genera .lsq XML
-                        print(f"      Generating .lsq XML...")
-                        try:
-                            lsq_xml = generate_lsq_xml(complete_data)
-                            print(f"      ✓ XML generated: {len(lsq_xml)} bytes")
-                        except Exception as xml_error:
-                            print(f"      ✗ ERROR generating XML: {xml_error}")
-                            import traceback
-                            traceback.print_exc()
-                            failed_questions.append(f"{question_title} (ID:{question_id}): XML generation failed - {str(xml_error)}")
-                            continue
+                complete_data = questions_data.get(question.get('uri'))
+                if not complete_data:
+                    pipeline.append((label, None, None, "No data from GraphDB"))
+                    continue
 
-                        # Converti in Base64
-                        lsq_base64 = base64.b64encode(lsq_xml.encode('utf-8')).decode('utf-8')
-                        print(f"      Base64 size: {len(lsq_base64)} chars")
+                # Aggiorna IDs per la nuova survey (copia: la stessa domanda può comparire in più gruppi)
+                complete_data = dict(complete_data, sid=str(survey_id), gid=str(group_id))
+                pipeline.append((label, complete_data, LSQGenerator.submit(complete_data), None))
+            pipelines.append((group_id, pipeline))
 
-                        # Importa usando import_question
-                        mandatory = complete_data.get('attributes', {}).get('mandatory', 'N')
-                        print(f"      Importing to LimeSurvey (mandatory: {mandatory})...")
+        def import_group(group_id: int, pipeline: List) -> List:
+            outcomes = []
+            for label, complete_data, xml_future, error in pipeline:
+                if error is not None:
+                    outcomes.append(f"{label}: {error}")
+                    continue
 
-                        try:
-                            new_qid = ls_client.import_question(
-                                survey_id=survey_id,
-                                group_id=group_id,
-                                lsq_base64=lsq_base64,
-                                mandatory=mandatory
-                            )
+                try:
+                    lsq_xml = LSQGenerator.result(xml_future, complete_data)
+                except Exception as xml_error:
+                    print(f"      ✗ ERROR generating XML for {label}: {xml_error}")
+                    outcomes.append(f"{label}: XML generation failed - {str(xml_error)}")
+                    continue
 
-                            print(f"      ✓ Question imported successfully (new ID: {new_qid})")
-                            imported_questions_count += 1
+                lsq_base64 = base64.b64encode(lsq_xml.encode('utf-8')).decode('utf-8')
+                mandatory = complete_data.get('attributes', {}).get('mandatory', 'N')
 
-                        except Exception as import_error:
-                            print(f"      ✗ ERROR importing to LimeSurvey: {import_error}")
-                            import traceback
-                            traceback.print_exc()
-                            failed_questions.append(f"{question_title} (ID:{question_id}): LimeSurvey import failed - {str(import_error)}")
-                            continue
+                try:
+                    new_qid = ls_client.import_question(
+                        survey_id=survey_id,
+                        group_id=group_id,
+                        lsq_base64=lsq_base64,
+                        mandatory=mandatory
+                    )
+                    print(f"      ✓ {label} imported (new ID: {new_qid})")
+                    outcomes.append(None)
+                except Exception as import_error:
+                    print(f"      ✗ ERROR importing {label} to LimeSurvey: {import_error}")
+                    outcomes.append(f"{label}: LimeSurvey import failed - {str(import_error)}")
+            return outcomes
 
-                    except Exception as e:
-                        error_msg = f"{question_title} (ID:{question_id}): {str(e)}"
-                        print(f"      ✗ Failed with exception: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        failed_questions.append(error_msg)
-                        continue
+        imported_questions_count = 0
+        failed_questions = []
 
-            except Exception as e:
-                print(f"  ✗ Failed to create group: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
+        if pipelines:
+            workers = max(1, min(SURVEYBUILDER_IMPORT_CONCURRENCY, len(pipelines)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lsq-import') as executor:
+                futures = [executor.submit(import_group, group_id, pipeline) for group_id, pipeline in pipelines]
+                # Risultati nell'ordine di gruppi e domande, come nell'import sequenziale
+                for future in futures:
+                    for outcome in future.result():
+                        if outcome is None:
+                            imported_questions_count += 1
+                        else:
+                            failed_questions.append(outcome)
 
-        # Step 3: Rilascia sessione
-        print(f"\nStep 3: Releasing session...")
+        # Step 5: Rilascia sessione
+        print(f"\nStep 5: Releasing session...")
         ls_client.release_session_key()
 
         # Genera URL
@@ -3890,4 +5655,8 @@ if __name__ == '__main__':
     print("\nServer starting on http://localhost:5005")
     print("=" * 70)
 
+    # Preforka i worker RML nel processo che serve le richieste (con debug=True è il figlio del reloader)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=RMLConverter.warm_up, daemon=True).start()
+
     app.run(debug=True, host='0.0.0.0', port=5005)
\ No newline at end of file
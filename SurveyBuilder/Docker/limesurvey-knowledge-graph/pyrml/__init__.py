@@ -2,4 +2,5 @@ from pyrml.pyrml_api import *
 from pyrml.pyrml_core import *
 from pyrml.pyrml_mapper import *
 from pyrml.pyrml_rdflib import *
+from pyrml.pyrml_sink import *
 from pyrml.functions import *
@@ -2,14 +2,15 @@
 from abc import abstractmethod
 from io import BytesIO
 import json
+import re
 from pyrml import rml_vocab
 import time
-from typing import Dict, Union, Set, List, Type, Generator
+from typing import Dict, Union, Set, List, Tuple, Type, Generator
 
 from SPARQLWrapper import SPARQLWrapper, CSV, JSON, XML, TSV
 from jsonpath_ng import parse
 from pandas.core.frame import DataFrame
-from pyrml.pyrml_api import PyRML, DataSource, TermMap, AbstractMap, TermUtils, graph_add_all, Expression, FunctionNotRegisteredException, NoneFunctionException, ParameterNotExintingInFunctionException, RMLModelException
+from pyrml.pyrml_api import PyRML, DataSource, TermMap, AbstractMap, TermUtils, graph_add_all, Expression, TermColumn, FunctionNotRegisteredException, NoneFunctionException, ParameterNotExintingInFunctionException, RMLModelException
 from rdflib import URIRef, Graph, IdentifiedNode
 from rdflib.namespace import RDF, Namespace, XSD
 from rdflib.plugins.sparql.processor import prepareQuery
@@ -215,7 +216,10 @@ class TermObjectMap(ObjectMap):
                 
                 #l = lambda val : TermUtils.irify(val) if self.term_type and self.term_type == rml_vocab.IRI else BNode(val) if self.term_type and self.term_type == rml_vocab.BLANK_NODE else val
                 
-                terms = [l(term) for term in data]
+                if self.term_type and self.term_type == rml_vocab.IRI:
+                    terms = TermUtils.irify_many(data).tolist()
+                else:
+                    terms = [l(term) for term in data]
                 
                 
             elif self.map_type == Literal("template"):
@@ -256,8 +260,17 @@ class TermObjectMap(ObjectMap):
                         
                         languages = self.language.apply(data_source)
                         
-                        #terms = np.array([Literal(lit, lang=lang) if lit and not pd.isna(lit) else None for lit, lang in zip(terms, languages)], dtype=Literal)
-                        terms = np.array([l(lit, lang) for lit, lang in zip(terms, languages)], dtype=Literal)
+                        column = None
+                        if len(languages) > 0 and isinstance(languages[0], str) and (np.asarray(languages, dtype=object) == languages[0]).all():
+                            if not TermUtils.is_valid_language_tag(languages[0]):
+                                raise RMLModelException(f'The language tag {languages[0]} is not a valid IETF BCP 47 language tag.')
+                            column = TermColumn.encode(terms, TermColumn.LITERAL, language=languages[0])
+                        
+                        if column is not None:
+                            terms = column.to_nodes()
+                        else:
+                            #terms = np.array([Literal(lit, lang=lang) if lit and not pd.isna(lit) else None for lit, lang in zip(terms, languages)], dtype=Literal)
+                            terms = np.array([l(lit, lang) for lit, lang in zip(terms, languages)], dtype=Literal)
                         
                     elif self.datatype is not None:
                         
@@ -268,7 +281,11 @@ class TermObjectMap(ObjectMap):
                                 _term = Literal(_castPythonToLiteral(_castLexicalToPython(str(term), self.datatype), self.datatype)[0], datatype=self.datatype) if term is not None and not pd.isna(term) else None
                                 return _term
                         
-                        terms = np.array([l(term) for term in terms], dtype=Literal)
+                        column = TermColumn.encode(terms, TermColumn.LITERAL, datatype=self.datatype, stringify=True)
+                        if column is not None:
+                            terms = column.to_nodes()
+                        else:
+                            terms = np.array([l(term) for term in terms], dtype=Literal)
                     else:
                         
                         def l(term):
@@ -291,13 +308,24 @@ class TermObjectMap(ObjectMap):
                             else:
                                 return get_item(term) if term or not pd.isna(term) else None
                         
+                        column = None
+                        if not PyRML.INFER_LITERAL_DATATYPES:
+                            values = np.asarray(terms, dtype=object)
+                            column = TermColumn.encode(values, TermColumn.LITERAL, stringify=True, valid=values != None)
                         
-                        terms = np.array([l(term) for term in terms], dtype=Literal)
+                        if column is not None:
+                            terms = column.to_nodes()
+                        else:
+                            terms = np.array([l(term) for term in terms], dtype=Literal)
                 else:
                     if self.term_type == rml_vocab.BLANK_NODE:
                         
                         l = lambda term: BNode(term) if term and not pd.isna(term) else term
-                        terms = np.array([l(term) for term in terms], dtype=BNode)
+                        column = TermColumn.encode(terms, TermColumn.BLANK_NODE, keep_missing=True)
+                        if column is not None:
+                            terms = column.to_nodes()
+                        else:
+                            terms = np.array([l(term) for term in terms], dtype=BNode)
                         
                     else:
                         def l(term):
@@ -305,8 +333,12 @@ class TermObjectMap(ObjectMap):
                                 return np.array([URIRef(TermUtils.irify(t)) if t and not pd.isna(t) else t for t in term], dtype=URIRef)
                             else:
                                 return URIRef(TermUtils.irify(term)) if term and not pd.isna(term) else term
-                            
-                        terms = np.array([l(term) for term in terms], dtype=URIRef)
+                        
+                        column = TermColumn.encode(terms, TermColumn.IRI, keep_missing=True)
+                        if column is not None:
+                            terms = column.to_nodes()
+                        else:
+                            terms = np.array([l(term) for term in terms], dtype=URIRef)
                         
                         
             
@@ -647,18 +679,25 @@ class PredicateObjectMap(AbstractMap):
         
         else:
             preds = [pm.apply(data_source) for pm in self._predicates]
-            objs = [om.apply(data_source) for om in self.__object_maps]
-            init = True
-            preds_objs = None
+            # Referencing object maps with join conditions are applied by TripleMappings.stream through a JoinIndex.
+            objs = [om.apply(data_source) for om in self.__object_maps if not (isinstance(om, ReferencingObjectMap) and om.join_conditions)]
+            blocks = []
             for predicates in preds:
                 predicates = np.array(predicates).reshape(len(predicates), 1)
                 
                 for multi_objects in objs:
+                    nested = [isinstance(obj, list) or isinstance(obj, np.ndarray) for obj in multi_objects]
+                    
+                    if nested and not any(nested) and isinstance(multi_objects, np.ndarray) and multi_objects.ndim == 1:
+                        # Single-valued objects (e.g. the terms materialised from a TermColumn) need no unrolling.
+                        blocks.append(np.concatenate([predicates, multi_objects.astype(object).reshape(-1, 1)], axis=1))
+                        continue
+                    
                     object_lens = [
                         len(obj)
-                        if isinstance(obj, list) or isinstance(obj, np.ndarray)
+                        if is_nested
                         else 1
-                        for obj in multi_objects
+                        for obj, is_nested in zip(multi_objects, nested)
                     ]
                     
                     if object_lens:
@@ -682,17 +721,12 @@ class PredicateObjectMap(AbstractMap):
                                 for obj in multi_objects
                             ], dtype=object).reshape(-1, 1)
                                                 
-                            p_o = np.concatenate([
+                            blocks.append(np.concatenate([
                                 predicates, objects
-                            ], axis=1)
-                            
-                            if init:
-                                preds_objs = p_o
-                                init = False
-                            else:
-                                preds_objs = np.concatenate([preds_objs, p_o], axis=0)
+                            ], axis=1))
+            
+            preds_objs = np.concatenate(blocks, axis=0) if blocks else None
                                 
-                            
             #preds_objs = np.array([[pred, obj] for pred in predicates for obj in objects])
             
             
@@ -871,6 +905,27 @@ class LogicalSource(AbstractMap):
                     root = elem
         return ns
     
+    @staticmethod
+    def row_range(n_rows: int, index: int, partitions: int) -> Tuple[int, int]:
+        '''
+        Returns the bounds (start, end) of the index-th of partitions contiguous row ranges of n_rows rows.
+        The row ranges have the same size up to one row.
+        '''
+        return (n_rows * index) // partitions, (n_rows * (index + 1)) // partitions
+    
+    @staticmethod
+    def partition(dfs: List[DataFrame], index: int, partitions: int) -> List[DataFrame]:
+        '''
+        Restricts the data frames to the index-th of partitions row ranges (see LogicalSource.row_range).
+        '''
+        slices = []
+        for df in dfs:
+            if df is not None:
+                start, end = LogicalSource.row_range(len(df), index, partitions)
+                df = df.iloc[start:end]
+            slices.append(df)
+        return slices
+    
     def apply(self, row: pd.Series = None) -> DataFrame:
         if self.id in PyRML.get_mapper().logical_sources:
             dfs = PyRML.get_mapper().logical_sources[self.id]
@@ -882,89 +937,7 @@ class LogicalSource(AbstractMap):
             
             dfs = []
             for source in self.sources:
-                if isinstance(source, BaseSource):
-                    if self.__reference_formulation == rml_vocab.JSON_PATH and self.__iterator:
-                        json_data = json.load(open(source._mapped_entity,mode='r',encoding='utf-8'))
-                        
-                        jsonpath_expr = parse(self.__iterator)
-                        matches = jsonpath_expr.find(json_data)
-                
-                        data = [match.value for match in matches]
-                        
-                        df = pd.json_normalize(data)
-                        
-                    elif (self.__reference_formulation == rml_vocab.XML or self.__reference_formulation == rml_vocab.XPAPTH) and self.__iterator:
-                        
-                        _namespaces = LogicalSource.xml_namespaces(source._mapped_entity)
-                        
-                        df = pd.read_xml(source._mapped_entity, namespaces=_namespaces, xpath=self.__iterator, dtype=str)
-                        
-                    else:
-                        df = pd.read_csv(source._mapped_entity, sep=sep, dtype=str)
-                elif isinstance(source, CSVSource):
-                    df = pd.read_csv(source.url, sep=source.delimiter, dtype=str)
-                elif isinstance(source, SPARQLSource) and self.__query:
-                    
-                    sparql = SPARQLWrapper(source.endpoint)
-                    sparql.setQuery(self.__query)
-                    
-                    if source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_CSV'):
-                        sparql.setReturnFormat(CSV)
-                    elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_TSV'):
-                        sparql.setReturnFormat(TSV)
-                    elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_XML'):
-                        sparql.setReturnFormat(XML)
-                    else:
-                        sparql.setReturnFormat(JSON)
-                    
-                    rs = sparql.queryAndConvert()
-                    
-                    if source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_CSV'):
-                        df = pd.read_csv(BytesIO(rs), sep=',', dtype=str)
-                    elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_TSV'):
-                        df = pd.read_csv(BytesIO(rs), sep='\t', dtype=str)
-                    elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_JSON') and self.__iterator:
-                
-                        jsonpath_expr = parse(self.__iterator)
-                        matches = jsonpath_expr.find(rs)
-        
-                        data = [match.value for match in matches]
-                        df = pd.json_normalize(data)
-                        
-                    elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_XML') and self.__iterator:
-                        df = pd.read_xml(BytesIO(rs), xpath=self.__iterator, dtype=str)
-                        
-                    else:
-                        df = None
-                elif isinstance(source, SQLSource) and source.valid() and (self.__query or self.__table_name):
-                    
-                    protocol_delimiter = source.dsn.find(':')
-                    if protocol_delimiter >= 0:
-                    
-                        db_protocol = source.dsn[:protocol_delimiter]
-                        db_server = source.dsn[protocol_delimiter+3:]
-                        if db_protocol:
-                            
-                            #engine = sa.create_engine(f'{db_protocol}://{source.username}:{source.password}@?dsn={source.dsn}')
-                            engine = sa.create_engine(f'{db_protocol}://{source.username}:{source.password}@{db_server}')
-    
-                            
-                            query = self.__query if self.__query else f'SELECT * FROM {self.__table_name}'
-                            try:
-                                df = pd.read_sql(query, engine, parse_dates=['EntranceDate'])
-                            except Exception as e:
-                                print(e)
-                                df = pd.DataFrame()
-                            engine.dispose()
-                            
-                        else:
-                            raise Exception(f'Database {source.driver} not supported.')
-                    else:
-                        raise Exception(f'No protocol found from DSN string {source.dsn}.')
-                    
-                else:
-                    df = None
-                
+                df = self.__load(source, sep)
                 
                 #df.columns = df.columns.str.replace(r' ', '_')
                 
@@ -973,6 +946,177 @@ class LogicalSource(AbstractMap):
                 PyRML.get_mapper().logical_sources[self.id] = dfs
                 
         return dfs
+    
+    def __load(self, source: 'Source', sep: str) -> DataFrame:
+        if isinstance(source, BaseSource) and PyRML.has_registered_source(str(source._mapped_entity)):
+            data = PyRML.get_registered_source(str(source._mapped_entity))
+            if isinstance(data, DataFrame):
+                df = data
+            else:
+                if self.__reference_formulation == rml_vocab.JSON_PATH and self.__iterator:
+                    data = [match.value for match in parse(self.__iterator).find(data)]
+                df = pd.json_normalize(data)
+            
+        elif isinstance(source, BaseSource):
+            if self.__reference_formulation == rml_vocab.JSON_PATH and self.__iterator:
+                json_data = json.load(open(source._mapped_entity,mode='r',encoding='utf-8'))
+                
+                jsonpath_expr = parse(self.__iterator)
+                matches = jsonpath_expr.find(json_data)
+        
+                data = [match.value for match in matches]
+                
+                df = pd.json_normalize(data)
+                
+            elif (self.__reference_formulation == rml_vocab.XML or self.__reference_formulation == rml_vocab.XPAPTH) and self.__iterator:
+                
+                _namespaces = LogicalSource.xml_namespaces(source._mapped_entity)
+                
+                df = pd.read_xml(source._mapped_entity, namespaces=_namespaces, xpath=self.__iterator, dtype=str)
+                
+            else:
+                df = pd.read_csv(source._mapped_entity, sep=sep, dtype=str)
+        elif isinstance(source, CSVSource):
+            df = pd.read_csv(source.url, sep=source.delimiter, dtype=str)
+        elif isinstance(source, SPARQLSource) and self.__query:
+            
+            sparql = SPARQLWrapper(source.endpoint)
+            sparql.setQuery(self.__query)
+            
+            if source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_CSV'):
+                sparql.setReturnFormat(CSV)
+            elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_TSV'):
+                sparql.setReturnFormat(TSV)
+            elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_XML'):
+                sparql.setReturnFormat(XML)
+            else:
+                sparql.setReturnFormat(JSON)
+            
+            rs = sparql.queryAndConvert()
+            
+            if source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_CSV'):
+                df = pd.read_csv(BytesIO(rs), sep=',', dtype=str)
+            elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_TSV'):
+                df = pd.read_csv(BytesIO(rs), sep='\t', dtype=str)
+            elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_JSON') and self.__iterator:
+        
+                jsonpath_expr = parse(self.__iterator)
+                matches = jsonpath_expr.find(rs)
+
+                data = [match.value for match in matches]
+                df = pd.json_normalize(data)
+                
+            elif source.result_format == URIRef('http://www.w3.org/ns/formats/SPARQL_Results_XML') and self.__iterator:
+                df = pd.read_xml(BytesIO(rs), xpath=self.__iterator, dtype=str)
+                
+            else:
+                df = None
+        elif isinstance(source, SQLSource) and source.valid() and (self.__query or self.__table_name):
+            
+            protocol_delimiter = source.dsn.find(':')
+            if protocol_delimiter >= 0:
+            
+                db_protocol = source.dsn[:protocol_delimiter]
+                db_server = source.dsn[protocol_delimiter+3:]
+                if db_protocol:
+                    
+                    #engine = sa.create_engine(f'{db_protocol}://{source.username}:{source.password}@?dsn={source.dsn}')
+                    engine = sa.create_engine(f'{db_protocol}://{source.username}:{source.password}@{db_server}')
+    
+                    
+                    query = self.__query if self.__query else f'SELECT * FROM {self.__table_name}'
+                    try:
+                        df = pd.read_sql(query, engine, parse_dates=['EntranceDate'])
+                    except Exception as e:
+                        print(e)
+                        df = pd.DataFrame()
+                    engine.dispose()
+                    
+                else:
+                    raise Exception(f'Database {source.driver} not supported.')
+            else:
+                raise Exception(f'No protocol found from DSN string {source.dsn}.')
+            
+        else:
+            df = None
+        
+        return df
+    
+    def iter_chunks(self, chunk_size: int) -> Generator[DataFrame, None, None]:
+        '''
+        Iterates the logical source in data frames of at most chunk_size rows. Unlike apply, the data frames are not cached
+        by the mapper, hence the memory used by the sources read in chunks is bounded by the chunk size.
+        CSV files are read in chunks by pandas and XML files are streamed by iterparse when the iterator is a plain path of elements
+        (e.g. /root/row or //row): all their cells are read as strings, as apply does, so the output does not depend on the chunks.
+        Any other source is loaded as a whole and sliced, and so are the sources already loaded by apply and the registered ones (see PyRML.register_source).
+        JSON sources are among them: the column dtypes inferred by pandas.json_normalize (e.g. integers with nulls read as floats)
+        depend on all the rows, hence normalising the rows chunk by chunk would change the generated terms.
+        '''
+        if self.id in PyRML.get_mapper().logical_sources:
+            for df in self.apply():
+                yield from LogicalSource.__slices(df, chunk_size)
+            return
+        
+        sep = ',' if self.__separator is None else self.__separator
+        
+        for source in self.sources:
+            if isinstance(source, BaseSource) and not PyRML.has_registered_source(str(source._mapped_entity)):
+                if (self.__reference_formulation == rml_vocab.XML or self.__reference_formulation == rml_vocab.XPAPTH) and self.__iterator:
+                    if re.match(r'^//?[\w.-]+(/[\w.-]+)*$', self.__iterator):
+                        yield from LogicalSource.__iter_xml(source._mapped_entity, self.__iterator, chunk_size)
+                        continue
+                    
+                elif not (self.__reference_formulation == rml_vocab.JSON_PATH and self.__iterator):
+                    with pd.read_csv(source._mapped_entity, sep=sep, dtype=str, chunksize=chunk_size) as reader:
+                        yield from reader
+                    continue
+                
+            elif isinstance(source, CSVSource):
+                with pd.read_csv(source.url, sep=source.delimiter, dtype=str, chunksize=chunk_size) as reader:
+                    yield from reader
+                continue
+            
+            yield from LogicalSource.__slices(self.__load(source, sep), chunk_size)
+    
+    @staticmethod
+    def __slices(df: DataFrame, chunk_size: int) -> Generator[DataFrame, None, None]:
+        if df is not None:
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start+chunk_size]
+    
+    @staticmethod
+    def __iter_xml(path: str, iterator: str, chunk_size: int) -> Generator[DataFrame, None, None]:
+        '''
+        Streams the elements matching a plain XPath iterator (/root/row or //row). As pandas.read_xml does,
+        each element gives a row made of its attributes and of the text of its children, keyed by their local names.
+        '''
+        local_name = lambda tag: tag.rsplit('}', 1)[-1]
+        
+        descendant = iterator.startswith('//')
+        steps = iterator.strip('/').split('/')
+        
+        stack = []
+        rows = []
+        for event, elem in ET.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                stack.append(local_name(elem.tag))
+            else:
+                if (descendant and stack[-len(steps):] == steps) or stack == steps:
+                    row = {local_name(name): value for name, value in elem.attrib.items()}
+                    if len(elem) == 0 and elem.text and elem.text.strip():
+                        row[local_name(elem.tag)] = elem.text
+                    for child in elem:
+                        row[local_name(child.tag)] = child.text if child.text and child.text.strip() else None
+                    rows.append(row)
+                    elem.clear()
+                    
+                    if len(rows) == chunk_size:
+                        yield pd.DataFrame(rows, dtype=str)
+                        rows = []
+                stack.pop()
+        
+        if rows:
+            yield pd.DataFrame(rows, dtype=str)
             
 
         
@@ -1139,8 +1283,13 @@ class SubjectMap(AbstractMap):
                     return np.array([tt(TermUtils.irify(t)) if t and not pd.isna(t) and not isinstance(t, URIRef) else t for t in term], dtype=IdentifiedNode)
                 else:
                     return tt(TermUtils.irify(term)) if term and not pd.isna(term) else term
-                        
-            terms = np.array([l(term) for term in terms], dtype=URIRef)
+            
+            # Blank node subjects are irified too, hence only IRI subjects are encoded columnwise.
+            column = TermColumn.encode(terms, TermColumn.IRI, keep_missing=True) if self.__tt != rml_vocab.BLANK_NODE else None
+            if column is not None:
+                terms = column.to_nodes()
+            else:
+                terms = np.array([l(term) for term in terms], dtype=URIRef)
                 
             PyRML.get_mapper().mappings[self] = terms
             return terms
@@ -1179,7 +1328,7 @@ class SubjectMap(AbstractMap):
     @staticmethod
     def __create(_id: IdentifiedNode, graph: Graph, row):
         
-        classes = graph.objects(row.sm, rml_vocab.CLASS, True)
+        classes = list(graph.objects(row.sm, rml_vocab.CLASS, True))
         
         graph_maps = GraphMap.from_rdf(graph, row.sm)
         
@@ -1393,19 +1542,57 @@ class TripleMappings(AbstractMap):
     
     
     def apply(self, data_source: DataSource = None) -> np.array:
+        
+        batches = [batch for batch in self.stream(data_source)]
+        
+        if batches:
+            return np.concatenate(batches, axis=0)
+        else:
+            return np.empty((0, 3), dtype=Node)
+    
+    def has_joins(self) -> bool:
+        '''
+        Returns True if any predicate-object map refers to a parent triples map by means of join conditions.
+        '''
+        if self.predicate_object_maps:
+            for pom in self.predicate_object_maps:
+                for object_map in pom.object_maps:
+                    if isinstance(object_map, ReferencingObjectMap) and object_map.join_conditions:
+                        return True
+        return False
+    
+    def stream(self, data_source: DataSource = None, batch_size: int = None, chunk_size: int = None) -> Generator[np.ndarray, None, None]:
+        '''
+        Yields the triples (or quads if graph maps are declared) generated by the triples map
+        as object arrays of at most batch_size rows, predicate-object map by predicate-object map.
+        Rows containing null terms are discarded.
+        If chunk_size is given, the logical source is streamed in chunks
+        of at most chunk_size rows (see LogicalSource.iter_chunks) and mapped chunk by chunk.
+        Parent logical sources are always joined as a whole.
+        '''
         if PyRML.RML_STRICT and (len(self.subject_maps) > 1 or len(self.logical_sources) > 1):
             raise RMLModelException(f'The RML descriptor declares a TripleMapping with {len(self.subject_maps)} subject maps. Exactly 1 subject map must be declared.')
         
-        triples : DataFrame = pd.DataFrame(columns=['s', 'p', 'o'], dtype=object)
+        batch_size = batch_size if batch_size else PyRML.TRIPLE_BATCH_SIZE
+        
         for logical_source in self.logical_sources:
             
-            for df in logical_source.apply():
+            if chunk_size:
+                dfs = logical_source.iter_chunks(chunk_size)
+            else:
+                dfs = logical_source.apply()
+            
+            for df in dfs:
                 
                 if self.condition:
                     df = df[eval(self.condition)]
                 
                 data_source = DataSource(df)
                 
+                # Term maps are cached by id, hence the cache is scoped to the data source being mapped.
+                # This keeps the output of a triples map independent of the triples maps applied before it.
+                PyRML.get_mapper().mappings.clear()
+                
                 sbj_maps = [subject_map.apply(data_source) for subject_map in self.subject_maps]
                 
                 graph_maps = [graph_map.apply(data_source) for subject_map in self.subject_maps for graph_map in subject_map.graph_maps]
@@ -1415,97 +1602,90 @@ class TripleMappings(AbstractMap):
                     if self.predicate_object_maps is not None:
                             
                         for pom in self.predicate_object_maps:
-                            try:
-                                for object_map in pom.object_maps:
-                                    
-                                    df_join = None
-                                    if isinstance(object_map, ReferencingObjectMap) and object_map.join_conditions:
-                                        df_left = df.copy()
-                                        df_left['__pyrml_sbj_representation__'] = sbj_representation
-                                        
-                                        parent_triple_mappings = object_map.parent_triples_maps
-                                        
+                            
+                            emitted = False
+                            for object_map in pom.object_maps:
+                                
+                                if isinstance(object_map, ReferencingObjectMap) and object_map.join_conditions:
+                                    for sbjs, pom_representation, join_graph_maps in self.__join(df, data_source, sbj_representation, pom, object_map, graph_maps):
+                                        yield from self.__triples(sbjs, pom_representation, join_graph_maps, batch_size)
+                                
+                                elif not emitted:
+                                    # The representation of a predicate-object map without joins is the same for all its object maps.
+                                    pom_representation = pom.apply(data_source)
+                                    emitted = True
                                         
-                                        for parent_triple_mapping in parent_triple_mappings:
-                                            for parent_logical_source in parent_triple_mapping.logical_sources:
-                                                
-                                                for df_right in parent_logical_source.apply():
-                                                    
-                                                    df_tmp = df
-                                                    df = df_right
-                                                    pandas_condition = parent_triple_mapping.condition
-                                                    if pandas_condition:
-                                                        df = df[eval(pandas_condition)]
-                                                        
-                                                    join_conditions = object_map.join_conditions
-                                                    
-                                                    left_ons = []
-                                                    right_ons = []
-                                                    
-                                                    for join_condition in join_conditions:
-                                                        left_ons.append(join_condition.child.value)
-                                                        right_ons.append(join_condition.parent.value)
-                                                    
-                                                    if not df_left.empty and not df.empty:
-                                                        try: 
-                                                            df_join = df_left.merge(df, how='inner', suffixes=("_s", "_r"), left_on=left_ons, right_on=right_ons, sort=False)
-                                                        except ValueError:
-                                                            df_join = pd.concat([df_left, df], axis=1, join='inner', sort=False)
-                                                    
-                                                        pom_representation = pom.apply(DataSource(df_join))
-                                                        
-                                                    df = df_tmp
-                                                        
-                                    else:
-                                        pom_representation = pom.apply(data_source)   
-                                            
                                     if pom_representation is not None:
-                                        #results: pd.DataFrame = pd.concat([sbj_representation, pom_representation], axis=1, sort=False)
-                                        
-                                        #triples_representation = [[s, p, o] for s in sbj_representation for p, o in pom_representation]
-                                        
-                                        end = len(pom_representation)
-                                        if df_join is not None:
-                                            # if referencing object map with joins
-                                            sbjs = df_join["__pyrml_sbj_representation__"]
-                                        else:
-                                            sbjs = sbj_representation
-                                        
-                                        chunk_size = len(sbjs)
-                                        
-                                        if chunk_size > 0:
-                                        
-                                            for i in range(0, end, chunk_size):
-                                                triples_representation = [[s, p_o[0], p_o[1]] for s, p_o in zip(sbjs, pom_representation[i:i+chunk_size])]
-                                                
-                                                
-                                                if len(graph_maps) > 0:
-                                                    #triples_representation = [[s, p, o, ctx] for ctx in graph_maps for s, p, o in triples_representation]
-                                                    
-                                                    for gmaps in graph_maps:
-                                                        g_end = len(gmaps)
-                                                        
-                                                        for k in range(0, g_end, chunk_size):
-                                                            triples_representation = [[t[0], t[1], t[2], g] for t, g in zip(triples_representation, gmaps[k:k+chunk_size])]
-                                                            
-                                                            triples_df = pd.DataFrame(triples_representation, columns=['s', 'p', 'o', 'ctx'])
-                                                            triples_df.dropna(inplace=True)
-                                                        
-                                                            triples = pd.concat([triples, triples_df], axis=0)
-                                                        
-                                                    
-                                                else:
-                                                
-                                                    triples_df = pd.DataFrame(triples_representation, columns=['s', 'p', 'o'])
-                                                    triples_df.dropna(inplace=True)
-                                                    
-                                                    triples = pd.concat([triples, triples_df], axis=0)
-                                            
-                            except Exception as e:
-                                raise e
-                            
+                                        sbjs = np.asarray(sbj_representation, dtype=object)
+                                        yield from self.__triples(sbjs, pom_representation, graph_maps, batch_size)
+    
+    @staticmethod
+    def __join(df: DataFrame, data_source: DataSource, sbj_representation: np.ndarray, pom: 'PredicateObjectMap', object_map: 'ReferencingObjectMap', graph_maps: List[np.ndarray]) -> Generator[tuple, None, None]:
+        '''
+        Joins the child data source with the parent triples maps of a referencing object map by probing their JoinIndex.
+        Yields the subjects, the predicate-object representation and the graph maps of the joined rows.
+        '''
+        child_keys = [join_condition.child.value for join_condition in object_map.join_conditions]
+        parent_keys = tuple(join_condition.parent.value for join_condition in object_map.join_conditions)
+        
+        keys = JoinIndex.key_array(df, child_keys)
+        
+        sbjs = np.asarray(sbj_representation, dtype=object)
+        predicates = [np.asarray(predicate_map.apply(data_source), dtype=object) for predicate_map in pom.predicates]
+        graph_maps = [np.asarray(gmaps, dtype=object) for gmaps in graph_maps]
+        
+        for parent_triple_mapping in object_map.parent_triples_maps:
+            join_index = JoinIndex.get(parent_triple_mapping, parent_keys)
+            child_idx, parent_idx = join_index.probe(keys)
+            
+            if len(child_idx) > 0 and predicates:
+                for parent_sbjs in join_index.subjects:
+                    objects = parent_sbjs[parent_idx]
+                    pom_representation = np.concatenate([np.stack([preds[child_idx], objects], axis=1) for preds in predicates], axis=0)
+                    
+                    yield sbjs[child_idx], pom_representation, [gmaps[child_idx] for gmaps in graph_maps]
+    
+    @staticmethod
+    def __triples(sbjs: np.ndarray, pom_representation: np.ndarray, graph_maps: List[np.ndarray], batch_size: int) -> Generator[np.ndarray, None, None]:
+        
+        end = len(pom_representation)
+        chunk_size = len(sbjs)
+        
+        if chunk_size > 0:
+            
+            for i in range(0, end, chunk_size):
+                p_o = pom_representation[i:i+chunk_size]
+                n = min(chunk_size, len(p_o))
                 
-        return triples.to_numpy(dtype=Node)  
+                triples = np.empty((n, 3), dtype=object)
+                triples[:, 0] = sbjs[:n]
+                triples[:, 1:] = p_o[:n]
+                
+                if len(graph_maps) > 0:
+                    
+                    for gmaps in graph_maps:
+                        g_end = len(gmaps)
+                        
+                        for k in range(0, g_end, chunk_size):
+                            ctxs = gmaps[k:k+chunk_size]
+                            n = min(len(triples), len(ctxs))
+                            
+                            quads = np.empty((n, 4), dtype=object)
+                            quads[:, :3] = triples[:n, :3]
+                            quads[:, 3] = ctxs[:n]
+                            triples = quads
+                            
+                            yield from TripleMappings.__batches(quads, batch_size)
+                else:
+                    yield from TripleMappings.__batches(triples, batch_size)
+    
+    @staticmethod
+    def __batches(triples: np.ndarray, batch_size: int) -> Generator[np.ndarray, None, None]:
+        
+        triples = triples[~pd.isna(triples).any(axis=1)]
+        
+        for i in range(0, len(triples), batch_size):
+            yield triples[i:i+batch_size]
     
          
     @staticmethod
@@ -1605,6 +1785,130 @@ class ReferencingObjectMap(ObjectMap):
             term_maps.append(rmo)
            
         return term_maps
+    
+
+class JoinIndex():
+    '''
+    Hash index on the join keys of the rows of a parent triples map, along with the subjects generated for such rows.
+    It is built once per (parent triples map, parent keys) and cached by the mapper.
+    Probing the index with the keys of a child data source yields the pairs of joined rows
+    in the order of the child rows. Null keys never join.
+    '''
+    
+    KEY_SEPARATOR = '\x1f'
+    
+    def __init__(self, keys: np.ndarray, subjects: List[np.ndarray]):
+        self.__subjects = subjects
+        
+        codes, uniques = pd.factorize(keys)
+        self.__keys = pd.Index(uniques, dtype=object)
+        
+        rows = np.flatnonzero(codes >= 0)
+        self.__rows = rows[np.argsort(codes[rows], kind='stable')]
+        self.__counts = np.bincount(codes[rows], minlength=len(uniques))
+        self.__starts = np.cumsum(self.__counts) - self.__counts
+        
+    @property
+    def subjects(self) -> List[np.ndarray]:
+        return self.__subjects
+    
+    def probe(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the positions of the joined child rows and of the parent rows they are joined with.
+        '''
+        if len(self.__keys) == 0 or len(keys) == 0:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        
+        codes = self.__keys.get_indexer(keys)
+        found = codes >= 0
+        
+        counts = np.where(found, self.__counts[codes], 0)
+        starts = np.where(found, self.__starts[codes], 0)
+        
+        child_idx = np.repeat(np.arange(len(keys)), counts)
+        offsets = np.arange(len(child_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        parent_idx = self.__rows[np.repeat(starts, counts) + offsets]
+        
+        return child_idx, parent_idx
+    
+    @staticmethod
+    def key_array(df: DataFrame, columns: List[str]) -> np.ndarray:
+        '''
+        Returns the join keys of the rows of df as strings. Rows having a null value in any of the columns get a None key.
+        Integral floats are keyed as integers (see JoinIndex.key_strings).
+        '''
+        keys = np.empty(len(df), dtype=object)
+        nulls = np.zeros(len(df), dtype=bool)
+        
+        for i, column in enumerate(columns):
+            cells = df[column].to_numpy(dtype=object)
+            nulls |= pd.isna(cells)
+            values = JoinIndex.key_strings(cells)
+            keys = values if i == 0 else keys + JoinIndex.KEY_SEPARATOR + values
+        
+        keys[nulls] = None
+        return keys
+    
+    @staticmethod
+    def key_strings(cells: np.ndarray) -> np.ndarray:
+        '''
+        Returns the cells as strings, with integral floats written as integers. A JSON or CSV column
+        of integers having a null is loaded as float, so 1.0 and 1 must give the same key on both sides of a join.
+        '''
+        values = pd.Series(cells, dtype=object).astype(str).to_numpy(dtype=object)
+        
+        floats = np.fromiter((isinstance(cell, (float, np.floating)) for cell in cells), dtype=bool, count=len(cells))
+        if floats.any():
+            numbers = np.array(cells[floats], dtype=float)
+            integral = np.isfinite(numbers) & (numbers == np.floor(numbers)) & (np.abs(numbers) < 2 ** 63)
+            positions = np.flatnonzero(floats)[integral]
+            values[positions] = [str(int(number)) for number in numbers[integral]]
+        
+        return values
+    
+    @staticmethod
+    def get(parent_triple_mapping: 'TripleMappings', parent_keys: Tuple[str, ...]) -> 'JoinIndex':
+        join_indexes = PyRML.get_mapper().join_indexes
+        key = (parent_triple_mapping.id, parent_keys)
+        if key not in join_indexes:
+            join_indexes[key] = JoinIndex.build(parent_triple_mapping, parent_keys)
+        
+        return join_indexes[key]
+    
+    @staticmethod
+    def build(parent_triple_mapping: 'TripleMappings', parent_keys: Tuple[str, ...]) -> 'JoinIndex':
+        '''
+        Indexes all the rows of the parent triples map that satisfy its condition. The parent subjects are generated
+        on the whole parent data sources with a term map cache of their own, so the cache of the child is left untouched.
+        '''
+        keys = []
+        subjects = [[] for subject_map in parent_triple_mapping.subject_maps]
+        
+        mappings = PyRML.get_mapper().mappings
+        cached = dict(mappings)
+        try:
+            for logical_source in parent_triple_mapping.logical_sources:
+                for df in logical_source.apply():
+                    if df is None:
+                        continue
+                    
+                    if parent_triple_mapping.condition:
+                        df = df[eval(parent_triple_mapping.condition)]
+                    
+                    mappings.clear()
+                    data_source = DataSource(df)
+                    
+                    keys.append(JoinIndex.key_array(df, list(parent_keys)))
+                    for i, subject_map in enumerate(parent_triple_mapping.subject_maps):
+                        subjects[i].append(np.asarray(subject_map.apply(data_source), dtype=object))
+        finally:
+            mappings.clear()
+            mappings.update(cached)
+        
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=object)
+        subjects = [np.concatenate(sbjs) if sbjs else np.empty(0, dtype=object) for sbjs in subjects]
+        
+        return JoinIndex(keys, subjects)
         
     
 class Source(AbstractMap):
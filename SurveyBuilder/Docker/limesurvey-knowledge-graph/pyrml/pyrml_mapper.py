@@ -4,17 +4,24 @@ __license__ = "Apache 2"
 __version__ = "0.2.9"
 __status__ = "Alpha"
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import logging
 from multiprocessing import cpu_count
 from multiprocessing.pool import ThreadPool
 import os
+import pickle
+import tempfile
 import time
-from typing import Dict, Generator, Union, List
+from typing import Dict, Generator, Union, List, Tuple
 
 from jinja2 import Environment, FileSystemLoader
 from pyrml.pyrml_api import Mapper, MappingsDict, graph_add_all, PyRML
 from pyrml.pyrml_core import TripleMappings, \
     TripleMapping, LogicalSource
+from pyrml.pyrml_sink import Sink, DatasetSink, NQuadsChunkSink
 from rdflib import Graph, Namespace, plugin, ConjunctiveGraph, URIRef, Dataset
 from rdflib.term import Node, IdentifiedNode, BNode, _is_valid_uri, Literal
 from rdflib.parser import StringInputSource
@@ -25,10 +32,137 @@ import pandas as pd
 import pyrml.rml_vocab as rml_vocab
 
 
+def normalize_iri(_value: Node, base: str) -> Node:
+    if isinstance(_value, IdentifiedNode):
+        
+        iri = _value
+        if isinstance(_value, URIRef):
+            if str(_value).find(':') > 0:
+                iri = _value
+            else:                      
+                iri = URIRef(base + str(_value))
+        
+        if _is_valid_uri(iri):
+            return iri
+        else:
+            return None
+    else:
+        return _value
+
+
+def sink_add_all(g: Sink, triples: np.ndarray, base: str):
+    for _tuple in triples:
+        subj = normalize_iri(_tuple[0], base)
+        pred = normalize_iri(_tuple[1], base)
+        obj = normalize_iri(_tuple[2], base)
+        if subj and pred and obj:
+            if len(_tuple)==4: 
+                ctx = normalize_iri(_tuple[3], base)
+                if ctx: 
+                    if ctx == rml_vocab.RR_NS.defaultGraph:
+                        g.add((subj, pred, obj))
+                    else:
+                        g.add((subj, pred, obj, ctx))
+            else:
+                g.add((subj, pred, obj))
+    
+
+class MappingCache():
+    '''
+    On-disk cache of the triples maps parsed by RMLParser.parse, pickled in the directory PyRML.MAPPING_CACHE_DIR.
+    Entries are keyed by the SHA-256 of the mapping content, the Jinja template variables, the format,
+    the location the base IRI of the mapping is resolved against and the source code of the mapping model,
+    so that they are never stale.
+    '''
+    
+    __fingerprint = None
+    
+    def __init__(self, directory: str):
+        self.__directory = directory
+        
+    @property
+    def directory(self) -> str:
+        return self.__directory
+    
+    @staticmethod
+    def fingerprint() -> str:
+        '''
+        Digest of the modules defining the pickled classes. It changes along with them.
+        '''
+        if MappingCache.__fingerprint is None:
+            digest = hashlib.sha256()
+            for module in ['pyrml_api.py', 'pyrml_core.py']:
+                with open(os.path.join(os.path.dirname(__file__), module), 'rb') as f:
+                    digest.update(f.read())
+            MappingCache.__fingerprint = digest.hexdigest()
+        
+        return MappingCache.__fingerprint
+    
+    @staticmethod
+    def key(source, format: str = "ttl", template_vars: Dict[str, str] = None) -> Union[str, None]:
+        '''
+        Returns the cache key of a mapping, which is either the content of the mapping (bytes) or the path of its file.
+        None is returned for any other kind of source, which is not cached.
+        '''
+        if isinstance(source, bytes):
+            content = source
+            location = os.getcwd()
+        elif isinstance(source, str) and os.path.isfile(source):
+            with open(source, 'rb') as f:
+                content = f.read()
+            location = os.path.abspath(source)
+        else:
+            return None
+        
+        digest = hashlib.sha256(content)
+        digest.update(json.dumps(template_vars, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(f'{format}|{location}|{MappingCache.fingerprint()}'.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def __path(self, key: str) -> str:
+        return os.path.join(self.__directory, f'{key}.pickle')
+    
+    def load(self, key: str) -> Union[List[TripleMappings], None]:
+        path = self.__path(key)
+        if not os.path.isfile(path):
+            return None
+        
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f'Ignoring the unreadable mapping cache entry {path}: {e}')
+            return None
+    
+    def store(self, key: str, triple_mappings: List[TripleMappings]):
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            # Written to a temporary file and then renamed, so that concurrent readers never see partial entries.
+            fd, tmp_path = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(triple_mappings, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.__path(key))
+        except Exception as e:
+            logging.getLogger(__name__).warning(f'Cannot store the mapping cache entry {key}: {e}')
+
+
 class RMLParser():
     
     @staticmethod
-    def parse(source, format="ttl"):
+    def parse(source, format="ttl", template_vars: Dict[str, str] = None):
+        '''
+        Parses an RML mapping, given as the path of its file, its content (bytes) or any source accepted by Graph.parse.
+        If PyRML.MAPPING_CACHE_DIR is set, the triples maps parsed from paths and contents are cached on disk
+        (see MappingCache), hence parsing the same mapping again only unpickles them.
+        template_vars are the Jinja variables the content has been rendered with, if any.
+        '''
+        
+        cache = MappingCache(PyRML.MAPPING_CACHE_DIR) if PyRML.MAPPING_CACHE_DIR else None
+        key = MappingCache.key(source, format, template_vars) if cache else None
+        if key:
+            triple_mappings = cache.load(key)
+            if triple_mappings is not None:
+                return triple_mappings
         
         g = Graph()
         
@@ -41,10 +175,16 @@ class RMLParser():
         g.bind('fno', Namespace(rml_vocab.FNO))
         
         
-        g.parse(source, format=format)
+        if isinstance(source, bytes):
+            g.parse(data=source, format=format)
+        else:
+            g.parse(source, format=format)
         
+        triple_mappings = TripleMappings.from_rdf(g)
+        if key:
+            cache.store(key, triple_mappings)
         
-        return TripleMappings.from_rdf(g)
+        return triple_mappings
         
         '''
         g_2 = Graph()
@@ -64,6 +204,7 @@ class RMLConverter(Mapper):
         self.__mapping_dict = MappingsDict()
         self.__loaded_logical_sources = dict()
         self.__mappings = dict()
+        self.__join_indexes = dict()
         
         self.subject_map_representations = dict()
         
@@ -75,12 +216,14 @@ class RMLConverter(Mapper):
         del(self.__mapping_dict)
         del(self.__loaded_logical_sources)
         del(self.__mappings)
+        del(self.__join_indexes)
         del(self.subject_map_representations)
         
         self.__function_registry = dict()
         self.__mapping_dict = MappingsDict()
         self.__loaded_logical_sources = dict()
         self.__mappings = dict()
+        self.__join_indexes = dict()
         self.subject_map_representations = dict()
         
         
@@ -92,6 +235,10 @@ class RMLConverter(Mapper):
     def logical_sources(self):
         return self.__loaded_logical_sources
     
+    @property
+    def join_indexes(self):
+        return self.__join_indexes
+    
     
     @property
     def function_registry(self):
@@ -113,7 +260,17 @@ class RMLConverter(Mapper):
         RMLConverter.__instance = instance
     '''    
     
-    def convert(self, rml_mapping, multiprocessed=False, base=None, template_vars: Dict[str, str] = None) -> Graph:
+    def convert(self, rml_mapping, multiprocessed=False, base=None, template_vars: Dict[str, str] = None, sink: Sink = None, processes: int = None, chunk_size: int = None) -> Union[Graph, Sink]:
+        '''
+        Applies the RML mapping. The generated triples are added to an rdflib Dataset, which is returned,
+        unless a sink is provided (e.g. NTriplesFileSink). In that case the triples are handed to the sink,
+        which is returned once closed.
+        If multiprocessed is True, the triples maps are applied by a pool of processes (cpu_count() if processes
+        is not provided). Each worker parses the mapping on its own, so rml_mapping must be the path of the mapping file,
+        otherwise the triples maps are applied sequentially.
+        If chunk_size is provided, logical sources are streamed and mapped in chunks of at most chunk_size rows,
+        which bounds the memory used (see LogicalSource.iter_chunks). Sources joined as parents are still loaded as a whole.
+        '''
     
         plugin.register("sparql", Result, "rdflib.plugins.sparql.processor", "SPARQLResult")
         plugin.register("sparql", Processor, "rdflib.plugins.sparql.processor", "SPARQLProcessor")
@@ -130,112 +287,125 @@ class RMLConverter(Mapper):
             template = env.get_template(rml_mapping)
             rml_mapping_template = template.render(template_vars)
             
-            rml_mapping = StringInputSource(rml_mapping_template.encode('utf-8'))
+            rml_source = rml_mapping_template.encode('utf-8')
+        else:
+            rml_source = rml_mapping
         
-        triple_mappings = RMLParser.parse(rml_mapping)
+        triple_mappings = RMLParser.parse(rml_source, template_vars=template_vars)
         
-        if base:
-            g = Dataset(default_graph_base=base)
-        else:
-            g = Dataset()
+        # Loaded logical sources, join indexes and term maps are cached by the ids of the parsed mapping,
+        # which are the same every time a cached mapping is unpickled: nothing is kept from a previous conversion.
+        self.__loaded_logical_sources.clear()
+        self.__join_indexes.clear()
+        self.__mappings.clear()
         
+        if sink is None:
+            g = DatasetSink(base)
+        else:
+            g = sink
         
         #print(f'The RML mapping contains {len(triple_mappings)} triple mappings.')
         start_time = time.time()
-        if multiprocessed:
-            start_time = time.time()
-            processes = cpu_count()
-        
-            tms = np.array_split(np.array(list(triple_mappings)), processes)
-            pool = ThreadPool(initializer=initializer, initargs=(PyRML.get_mapper(),), processes=processes)
-            tuples_collection = pool.map(pool_map, tms)
-            pool.close()
-            pool.join()
-        
+        g.open()
+        try:
+            if multiprocessed and triple_mappings and isinstance(rml_source, (str, bytes)):
+                RMLConverter.__convert_in_processes(g, rml_source, triple_mappings, processes, chunk_size, template_vars)
         
-            for tuples in tuples_collection:
-                for _tuple in tuples:
-                    g.add(_tuple)
-        
-        else:
-            for tm in triple_mappings:
-                tuples = tm.apply()
-                
-                def normalize_iri(_value):
-                    if isinstance(_value, IdentifiedNode):
-                        
-                        iri = _value
-                        if isinstance(_value, URIRef):
-                            if str(_value).find(':') > 0:
-                                iri = _value
-                            else:                      
-                                iri = URIRef(tm.base + str(_value))
-                        
-                        if _is_valid_uri(iri):
-                            return iri
-                        else:
-                            return None
-                    else:
-                        return _value
-                
-                for _tuple in tuples:
-                    subj = normalize_iri(_tuple[0])
-                    pred = normalize_iri(_tuple[1])
-                    obj = normalize_iri(_tuple[2])
-                    if subj and pred and obj:
-                        if len(_tuple)==4: 
-                            ctx = normalize_iri(_tuple[3])
-                            if ctx: 
-                                if ctx == rml_vocab.RR_NS.defaultGraph:
-                                    g.add((subj, pred, obj))
-                                else:
-                                    g.add((subj, pred, obj, ctx))
-                        else:
-                            g.add((subj, pred, obj))
+            else:
+                for tm in triple_mappings:
+                    for triples in tm.stream(chunk_size=chunk_size):
+                        sink_add_all(g, triples, tm.base)
                 
-                '''
-                for _tuple in tm.apply():
+                    '''
+                    for _tuple in tm.apply():
                     
-                    def normalize_iri(iri):
-                        if isinstance(iri, IdentifiedNode):
-                            if isinstance(iri, BNode):
-                                return iri
-                            elif isinstance(iri, URIRef):
-                                if str(iri).find(':') > 0:
+                        def normalize_iri(iri):
+                            if isinstance(iri, IdentifiedNode):
+                                if isinstance(iri, BNode):
                                     return iri
+                                elif isinstance(iri, URIRef):
+                                    if str(iri).find(':') > 0:
+                                        return iri
                         
-                            return URIRef(tm.base + str(iri))
-                        else:
-                            return iri
+                                return URIRef(tm.base + str(iri))
+                            else:
+                                return iri
 
                         
-                    try:
-                        #print(f'TUPLE {_tuple}')
-                        _sub = normalize_iri(_tuple[0])
-                        _pred = normalize_iri(_tuple[1])
-                        _obj = normalize_iri(_tuple[2])
-                        _graph = _tuple[3] if len(_tuple) == 4 else None
+                        try:
+                            #print(f'TUPLE {_tuple}')
+                            _sub = normalize_iri(_tuple[0])
+                            _pred = normalize_iri(_tuple[1])
+                            _obj = normalize_iri(_tuple[2])
+                            _graph = _tuple[3] if len(_tuple) == 4 else None
                         
-                        if _graph:
-                            if _is_valid_uri(_graph):
-                                g.add((_sub, _pred, _obj, URIRef(_graph)))
+                            if _graph:
+                                if _is_valid_uri(_graph):
+                                    g.add((_sub, _pred, _obj, URIRef(_graph)))
+                                else:
+                                    g.add((_sub, _pred, _obj))
                             else:
-                                g.add((_sub, _pred, _obj))
-                        else:
-                            g.add((_sub, _pred, _obj))                    
+                                g.add((_sub, _pred, _obj))                    
                     
-                    except Exception as e:
-                        print(f'{_sub}, {_pred}, {_obj}')
-                        print(f'{_sub} as type {type(_sub)}')
-                        print(type(_obj))
-                        print(_tuple)
-                        raise e
-                '''
+                        except Exception as e:
+                            print(f'{_sub}, {_pred}, {_obj}')
+                            print(f'{_sub} as type {type(_sub)}')
+                            print(type(_obj))
+                            print(_tuple)
+                            raise e
+                    '''
                 
+        except BaseException:
+            g.abort()
+            raise
+        
+        g.close()
+        
         elapsed_time_secs = time.time() - start_time
-        #print(f'Mapping computed in {elapsed_time_secs} secs producing {len(g)} triples.')
-        return g
+        #print(f'Mapping computed in {elapsed_time_secs} secs producing {g.count} triples.')
+        return g.result()
+    
     
+    @staticmethod
+    def __convert_in_processes(g: Sink, rml_source: Union[str, bytes], triple_mappings: List[TripleMappings], processes: int = None, chunk_size: int = None, template_vars: Dict[str, str] = None):
+        '''
+        Applies the triples maps in a pool of processes. Every worker parses the RML mapping on its own,
+        hence it has its own mapper, i.e. MappingsDict, loaded logical sources and term map cache.
+        The sources registered by PyRML.register_source are handed to the workers.
+        Triples maps are identified by their position in the parsed mapping. The logical sources of a triples map
+        without joins are loaded once, in this process, and split in as many row ranges as processes:
+        every worker receives and maps only its own row range.
+        Splitting requires loading the whole source in memory, so it is not done if chunk_size is provided:
+        every triples map is then streamed in chunks by a single worker.
+        The output of the workers is merged as N-Quads following the order of the triples maps and of their row ranges.
+        At most two tasks per worker are submitted at a time, so that neither the row ranges shipped to the workers
+        nor the N-Quads waiting to be merged pile up in memory.
+        '''
+        processes = processes if processes else cpu_count()
+        processes = max(1, processes)
+        
+        tasks = []
+        for index, tm in enumerate(triple_mappings):
+            if tm.has_joins() or processes == 1 or chunk_size:
+                tasks.append((index, chunk_size, None))
+            else:
+                # the workers parse the mapping on their own: logical sources are identified by position
+                dfs = [logical_source.apply() for logical_source in tm.logical_sources]
+                tasks += [(index, None, [LogicalSource.partition(ls_dfs, partition, processes) for ls_dfs in dfs])
+                          for partition in range(processes)]
+        
+        settings = {setting: getattr(PyRML, setting) for setting in ['IRIFY', 'RML_STRICT', 'INFER_LITERAL_DATATYPES', 'TRIPLE_BATCH_SIZE', 'MAPPING_CACHE_DIR']}
+        
+        workers = min(processes, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers, initializer=process_initializer, initargs=(rml_source, settings, template_vars, PyRML.registered_sources())) as executor:
+            pending = deque()
+            for task in tasks:
+                if len(pending) == 2 * workers:
+                    g.add_nquads(pending.popleft().result())
+                pending.append(executor.submit(process_map, task))
+            
+            while pending:
+                g.add_nquads(pending.popleft().result())
     
     def convert_(self, rml_mapping, multiprocessed=False, template_vars: Dict[str, str] = None) -> Graph:
     
@@ -403,3 +573,51 @@ def pool_map(triple_mappings):
         graph_add_all(g, triples)
         
     return g
+
+
+# The triples maps parsed by a worker process of RMLConverter.convert.
+_worker_triple_mappings: List[TripleMappings] = None
+
+def process_initializer(rml_source: Union[str, bytes], settings: Dict[str, object], template_vars: Dict[str, str] = None, sources: Dict[str, object] = None):
+    global _worker_triple_mappings
+    
+    logger = logging.getLogger("rdflib")
+    logger.setLevel(logging.ERROR)
+    
+    logger.disabled = True
+    
+    for setting, value in settings.items():
+        setattr(PyRML, setting, value)
+    
+    for name, data in (sources or {}).items():
+        PyRML.register_source(name, data)
+    
+    PyRML.set_mapper(RMLConverter())
+    
+    _worker_triple_mappings = RMLParser.parse(rml_source, template_vars=template_vars)
+    
+def process_map(task: Tuple[int, int, List[List[pd.DataFrame]]]) -> str:
+    '''
+    Maps a triples map or, if the task carries row_ranges (one list of data frames per logical source
+    of the triples map), the given row range, which replaces the loaded logical sources of the worker while it is mapped.
+    '''
+    index, chunk_size, row_ranges = task
+    tm = _worker_triple_mappings[index]
+    
+    loaded = PyRML.get_mapper().logical_sources
+    ls_ids = [logical_source.id for logical_source in tm.logical_sources] if row_ranges is not None else []
+    previous = {ls_id: loaded[ls_id] for ls_id in ls_ids if ls_id in loaded}
+    loaded.update(zip(ls_ids, row_ranges or []))
+    
+    sink = NQuadsChunkSink()
+    try:
+        for triples in tm.stream(chunk_size=chunk_size):
+            sink_add_all(sink, triples, tm.base)
+    finally:
+        for ls_id in ls_ids:
+            if ls_id in previous:
+                loaded[ls_id] = previous[ls_id]
+            else:
+                loaded.pop(ls_id, None)
+    
+    return sink.result()